@@ -0,0 +1,241 @@
+"""
+channels.py  —  ThingSpeak channel registry and concurrent fetch
+─────────────────────────────────────────────────────────────────────
+A ThingSpeak channel carries at most 8 fields, so a deployment with
+more than four sensors spans several channels.  The registry maps each
+channel's fields to sensor ids and fetches the latest entry of every
+channel at once: a tick costs about as long as the slowest channel,
+not the sum of all of them.
+
+CHANNELS_CONFIG (JSON file):
+  {"channels": [
+     {"channel_id": 1234567, "read_api_key_env": "TS_KEY_1234567",
+      "sensors": [{"sensor_id": 4, "flow_field": "field1",
+                   "pressure_field": "field2", "pipe_id": "P-011"}, …]},
+     …]}
+  read_api_key (inline) or read_api_key_env (name of an env var);
+  pipe_id / pressure_sensor_id / flow_sensor_id go into SENSOR_META,
+  pressure_factor / flow_factor override the config.py calibration.
+  Without a file the registry is the single channel CHANNEL_ID /
+  READ_API_KEY with SENSOR_CONFIG.
+
+Fetching:
+  At most `concurrency` requests are in flight (a thread pool on the
+  blocking path, a semaphore on the async one).  HTTP 429 / 5xx put a
+  channel into exponential backoff (Retry-After honoured, capped at
+  backoff_max_s); until it expires the channel is skipped and its
+  sensors are not re-scored.  entry_id dedup is per channel and lives
+  with the buffer state in main.py.
+"""
+
+import asyncio, json, logging, os, re, time
+from concurrent.futures import ThreadPoolExecutor
+
+import aiohttp
+import requests
+
+from . import kernels, metrics
+from .config import SENSOR_CONFIG
+
+log = logging.getLogger(__name__)
+
+FEEDS_URL = "https://api.thingspeak.com/channels/{channel}/feeds.json"
+META_KEYS = ("pressure_sensor_id", "flow_sensor_id", "pipe_id")
+
+_FIELD = re.compile(r"field([1-8])")
+_RETRY = (429, 500, 502, 503, 504)      # back off instead of hammering
+
+FETCHES       = metrics.Counter("twin_channel_fetches_total",
+                                "ThingSpeak fetches per channel by outcome",
+                                ("channel", "result"))
+FETCH_SECONDS = metrics.Histogram("twin_channel_fetch_seconds",
+                                  "ThingSpeak fetch latency per channel", ("channel",))
+
+
+def _latest_feed(payload: dict):
+    feeds = payload.get("feeds", [])
+    return feeds[-1] if feeds else None
+
+
+def _retry_after(headers) -> float:
+    try:
+        return max(float((headers or {}).get("Retry-After", 0)), 0.0)
+    except (TypeError, ValueError):
+        return 0.0          # HTTP-date form: fall back to our own backoff
+
+
+class Channel:
+    """One ThingSpeak channel: its sensors, feed URL and backoff state."""
+
+    def __init__(self, channel_id, read_api_key: str, sensors: list):
+        self.channel_id   = int(channel_id)
+        self.read_api_key = read_api_key
+        self.sensors      = sensors
+        self.pressure_factor, self.flow_factor = kernels.sensor_factors(sensors)
+        self.url          = (FEEDS_URL.format(channel=self.channel_id)
+                             + f"?api_key={read_api_key}&results=1")
+        self.backoff_s    = 0.0
+        self.retry_at     = 0.0         # monotonic; skipped until then
+
+        fields = [s[k] for s in sensors for k in ("flow_field", "pressure_field")]
+        bad = [f for f in fields if not _FIELD.fullmatch(f)]
+        if bad:
+            raise ValueError(f"channel {self.channel_id}: not a ThingSpeak field: {bad}")
+        if len(set(fields)) != len(fields):
+            raise ValueError(f"channel {self.channel_id}: a field is mapped twice")
+
+
+class ChannelRegistry:
+    """All channels of the deployment, fetched concurrently every tick."""
+
+    def __init__(self, channels: list, concurrency: int = 8, timeout: float = 10.0,
+                 backoff_s: float = 15.0, backoff_max_s: float = 300.0):
+        self.channels      = channels
+        self.concurrency   = max(int(concurrency), 1)
+        self.timeout       = timeout
+        self.backoff_s     = backoff_s          # first backoff step
+        self.backoff_max_s = backoff_max_s
+        self._pool         = None               # blocking path, created on first use
+
+        ids  = [c.channel_id for c in channels]
+        sids = [s["sensor_id"] for c in channels for s in c.sensors]
+        if not channels:
+            raise ValueError("no ThingSpeak channels configured")
+        if len(set(ids)) != len(ids):
+            raise ValueError("duplicate channel_id")
+        if len(set(sids)) != len(sids):
+            raise ValueError("a sensor_id is mapped to two channels")
+
+    @classmethod
+    def single(cls, channel_id, read_api_key: str, **kw) -> "ChannelRegistry":
+        """The one-channel layout of SENSOR_CONFIG."""
+        return cls([Channel(channel_id, read_api_key, SENSOR_CONFIG)], **kw)
+
+    @classmethod
+    def from_file(cls, path: str, **kw) -> "ChannelRegistry":
+        with open(path, encoding="utf-8") as fh:
+            cfg = json.load(fh)
+        channels = []
+        for c in cfg["channels"]:
+            key = c.get("read_api_key") or os.getenv(c.get("read_api_key_env", ""), "")
+            if not key:
+                raise ValueError(f"channel {c['channel_id']}: no read API key")
+            channels.append(Channel(c["channel_id"], key, c["sensors"]))
+        return cls(channels, **kw)
+
+    @property
+    def sensors(self) -> list:
+        """SENSOR_CONFIG-style entries of every channel, registry order."""
+        return [s for c in self.channels for s in c.sensors]
+
+    @property
+    def key(self) -> str:
+        """The channel set as one stable id, e.g. "1234" or "1234,5678"."""
+        return ",".join(str(i) for i in sorted(c.channel_id for c in self.channels))
+
+    @property
+    def sensor_meta(self) -> dict:
+        """sensor_id → SENSOR_META fields given in the channel config."""
+        return {s["sensor_id"]: {k: s[k] for k in META_KEYS if k in s}
+                for s in self.sensors if any(k in s for k in META_KEYS)}
+
+    # ── Outcome bookkeeping ───────────────────────────────────────
+    def _due(self) -> tuple:
+        now, due, errors = time.monotonic(), [], {}
+        for ch in self.channels:
+            if ch.retry_at > now:
+                FETCHES.inc(ch.channel_id, "skipped")
+                errors[ch.channel_id] = f"backing off for {ch.retry_at - now:.0f} s"
+            else:
+                due.append(ch)
+        return due, errors
+
+    def _ok(self, ch: Channel, feed) -> tuple:
+        ch.backoff_s = 0.0
+        if feed is None:
+            FETCHES.inc(ch.channel_id, "empty")
+            return None, "No feeds from ThingSpeak"
+        FETCHES.inc(ch.channel_id, "ok")
+        return feed, None
+
+    def _failed(self, ch: Channel, err: Exception, status=None, headers=None) -> tuple:
+        if status in _RETRY:
+            ch.backoff_s = min(max(ch.backoff_s * 2, self.backoff_s), self.backoff_max_s)
+            ch.retry_at  = time.monotonic() + max(ch.backoff_s, _retry_after(headers))
+            FETCHES.inc(ch.channel_id, "rate_limited")
+            log.warning("ThingSpeak channel %d: HTTP %s, backing off %.0f s",
+                        ch.channel_id, status, ch.retry_at - time.monotonic())
+        else:
+            FETCHES.inc(ch.channel_id, "error")
+        return None, str(err)
+
+    @staticmethod
+    def _collect(due: list, results: list, errors: dict) -> tuple:
+        feeds = {}
+        for ch, (feed, err) in zip(due, results):
+            if err is None:
+                feeds[ch.channel_id] = feed
+            else:
+                errors[ch.channel_id] = err
+        return feeds, errors
+
+    # ── Blocking fetch (WebJob path) ──────────────────────────────
+    def _get(self, session, ch: Channel) -> tuple:
+        t0 = time.perf_counter()
+        try:
+            resp = session.get(ch.url, timeout=self.timeout)
+            resp.raise_for_status()
+            feed = _latest_feed(resp.json())
+        except requests.HTTPError as e:
+            r = e.response
+            return self._failed(ch, e, getattr(r, "status_code", None), getattr(r, "headers", None))
+        except Exception as e:
+            return self._failed(ch, e)
+        finally:
+            FETCH_SECONDS.observe(time.perf_counter() - t0, ch.channel_id)
+        return self._ok(ch, feed)
+
+    def fetch(self, session) -> tuple:
+        """
+        Latest entry of every channel not in backoff.
+
+        Returns (feeds, errors): channel_id → feed dict, and channel_id →
+        error message for channels that failed or were skipped.
+        """
+        due, errors = self._due()
+        if len(due) <= 1:
+            results = [self._get(session, ch) for ch in due]
+        else:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(self.concurrency,
+                                                thread_name_prefix="thingspeak")
+            results = list(self._pool.map(lambda ch: self._get(session, ch), due))
+        return self._collect(due, results, errors)
+
+    # ── Async fetch (ingestion scheduler, /live) ──────────────────
+    async def _get_async(self, http, sem: asyncio.Semaphore, ch: Channel) -> tuple:
+        async with sem:
+            t0 = time.perf_counter()
+            try:
+                async with http.get(ch.url) as resp:
+                    resp.raise_for_status()
+                    feed = _latest_feed(await resp.json(content_type=None))
+            except aiohttp.ClientResponseError as e:
+                return self._failed(ch, e, e.status, e.headers)
+            except Exception as e:
+                return self._failed(ch, e)
+            finally:
+                FETCH_SECONDS.observe(time.perf_counter() - t0, ch.channel_id)
+            return self._ok(ch, feed)
+
+    async def fetch_async(self, http) -> tuple:
+        """fetch() on a shared aiohttp session; same (feeds, errors)."""
+        due, errors = self._due()
+        sem     = asyncio.Semaphore(self.concurrency)
+        results = await asyncio.gather(*(self._get_async(http, sem, ch) for ch in due))
+        return self._collect(due, results, errors)
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False)
+            self._pool = None
@@ -0,0 +1,38 @@
+"""
+config.py  —  Pipe network & sensor configuration
+─────────────────────────────────────────────────────────────────────
+Plain constants, no environment or network access, so the API, the
+WebJob and offline tools (replay) can all import them.
+"""
+
+# ══════════════════════════════════════════════════════════════════
+# PIPE & SENSOR CONFIGURATION
+# ══════════════════════════════════════════════════════════════════
+PIPE_AREA = 490.87          # mm²  (DN25 pipe: π/4 × 25²)
+
+# Field normal operating point (must match predict.py values)
+FIELD_FLOW_LPM     = 25.0   # lpm
+FIELD_PRESSURE_BAR = 0.48   # bar
+
+# ADC → physical unit correction factors (calibrated from field meter)
+FLOW_FACTOR     = 7.177033493    # raw → lpm
+PRESSURE_FACTOR = 0.390450136    # raw → bar
+
+# Safety clamps (reject clearly faulty sensor values)
+FLOW_MAX_LPM     = 200.0    # lpm
+PRESSURE_MAX_BAR = 10.0     # bar
+
+# ThingSpeak field assignments (an entry may also set its own
+# "pressure_factor" / "flow_factor" in place of the factors above)
+SENSOR_CONFIG = [
+    {"sensor_id": 1, "flow_field": "field1", "pressure_field": "field2"},
+    {"sensor_id": 2, "flow_field": "field3", "pressure_field": "field4"},
+    {"sensor_id": 3, "flow_field": "field5", "pressure_field": "field6"},
+]
+
+# Pipe network metadata (used by CesiumJS 3D visualisation)
+SENSOR_META = {
+    1: {"pressure_sensor_id": "PP-001", "flow_sensor_id": "F-001", "pipe_id": "P-002"},
+    2: {"pressure_sensor_id": "PP-002", "flow_sensor_id": "F-002", "pipe_id": "P-006"},
+    3: {"pressure_sensor_id": "PP-003", "flow_sensor_id": "F-003", "pipe_id": "P-009"},
+}
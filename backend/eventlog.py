@@ -0,0 +1,243 @@
+"""
+eventlog.py  —  Change-only persistence: keyframes + latch event log
+─────────────────────────────────────────────────────────────────────
+Parquet snapshots (snapshots.py) still store every sensor on every
+tick, although on a healthy network almost every row says "normal,
+no leak" again.  With SNAPSHOT_FORMAT=events only changes are kept:
+
+  events/log/date=YYYY-MM-DD/hour=HH/part-HHMMSS-<id>.jsonl
+      append-only log: one flat_record() row per latch transition
+      (normal → latched → recovering → normal, or a sensor's first
+      reading), carrying the leak quantification of that tick and the
+      state it left ("prev_state")
+  events/keyframes/date=YYYY-MM-DD/hour=HH/kf-HHMMSS-<id>.parquet
+      every EVENTS_KEYFRAME_S (default 1 h of tick time): the latest
+      record of every sensor, so a reader never replays more than one
+      keyframe interval of events; "keyframe_at" is the tick it was
+      taken on (with several channels, rows may be older)
+
+Log parts are immutable, one per flush, and only written when there
+is something to write; a network that stays healthy costs one
+keyframe per interval.  state_at(t) rebuilds every sensor's record in
+force at any time t: the last keyframe at or before t, then each later
+event up to t.  read_events() is the transition history of a range.
+
+Readings between transitions are not kept; the per-tick series lives
+in the history index (history.py) or a parquet / json deployment.
+
+A restarted writer resumes from the stored log (resume(), which reads
+Blob storage and so runs at startup, off the event loop), so a restart
+neither forces a keyframe nor logs every sensor again.  add() never
+touches storage.
+"""
+
+import io, json, threading, time, uuid
+from datetime import datetime, timedelta
+
+import pandas as pd
+
+from .snapshots import _hour_partitions, _naive_utc, partition_of
+from .twin import flat_record
+
+EVENTS_PREFIX   = "events"
+KEYFRAME_S      = 3600.0
+LOOKBACK_DAYS   = 2         # how far back state_at() looks for a keyframe
+
+
+def _key(row: dict) -> tuple:
+    """What counts as a change: the latch state and the leak flag."""
+    return row.get("alert_state"), int(row.get("leak") or 0)
+
+
+def _ts(timestamp: str) -> float:
+    return _naive_utc(timestamp).timestamp()
+
+
+# ══════════════════════════════════════════════════════════════════
+# WRITER
+# ══════════════════════════════════════════════════════════════════
+class EventLogWriter:
+    """
+    Drop-in for SnapshotWriter (add / due / flush / pending): buffers
+    transitions and keyframes, flush() writes them.  Thread-safe like
+    SnapshotWriter.
+    """
+
+    def __init__(self, container, flush_interval_s: float = 300.0,
+                 keyframe_s: float = KEYFRAME_S, prefix: str = EVENTS_PREFIX):
+        self.container        = container
+        self.flush_interval_s = flush_interval_s
+        self.keyframe_s       = keyframe_s
+        self.prefix           = prefix
+        self._latest: dict    = None    # sensor id → last flat row (None until first use)
+        self._keyframe_at     = None    # tick time (epoch s) of the last keyframe
+        self._events: list    = []
+        self._keyframes: list = []      # [(timestamp, rows)]
+        self._lock            = threading.Lock()
+        self._last_flush      = time.monotonic()
+
+    def resume(self, timestamp: str = None):
+        """
+        Pick up the stored state before `timestamp` (default: now) so a
+        restart logs only real changes.  Blob I/O: call it off the event
+        loop before the first add(); a no-op once state exists.
+        """
+        if self._latest is not None:
+            return
+        at, latest, kf_time = _naive_utc(timestamp or datetime.utcnow().isoformat()), {}, None
+        try:
+            kf_time, df = _state_at(self.container, at, self.prefix)
+            if kf_time is not None:
+                latest = {int(r["sensor_numeric_id"]): r for r in df.to_dict("records")}
+        except Exception:
+            kf_time = None              # unreadable store: next tick keyframes
+        with self._lock:
+            if self._latest is None:
+                self._latest, self._keyframe_at = latest, kf_time
+
+    def add(self, proc_out: dict):
+        """
+        Log the transitions of one processed document; keyframe if due.
+        In memory only: without resume() the first tick is a keyframe.
+        """
+        ts, eid = proc_out["timestamp"], proc_out.get("entry_id")
+        rows = [flat_record(ts, eid, rec) for rec in proc_out["sensors"]]
+        now  = _ts(ts)
+        with self._lock:
+            if self._latest is None:
+                self._latest = {}
+            for row in rows:
+                sid  = int(row["sensor_numeric_id"])
+                prev = self._latest.get(sid)
+                if prev is None or _key(prev) != _key(row):
+                    self._events.append({**row, "prev_state":
+                                         None if prev is None else prev["alert_state"]})
+                self._latest[sid] = row
+            if self._keyframe_at is None or now - self._keyframe_at >= self.keyframe_s:
+                self._keyframes.append((ts, list(self._latest.values())))
+                self._keyframe_at = now
+                # the keyframe already holds this tick: first sight is not an event
+                self._events = [e for e in self._events
+                                if e["timestamp"] != ts or e["prev_state"] is not None]
+
+    @property
+    def pending(self) -> int:
+        return len(self._events) + sum(len(rows) for _, rows in self._keyframes)
+
+    def due(self) -> bool:
+        return bool(self._events or self._keyframes) and \
+            time.monotonic() - self._last_flush >= self.flush_interval_s
+
+    def flush(self) -> list[str]:
+        """Write buffered events and keyframes; returns the blob names written.
+
+        On upload failure whatever was not written is put back.
+        """
+        with self._lock:
+            events, self._events       = self._events, []
+            keyframes, self._keyframes = self._keyframes, []
+            self._last_flush = time.monotonic()
+        stamp, tag = datetime.utcnow().strftime("%H%M%S"), uuid.uuid4().hex[:8]
+        names = []
+        try:
+            while keyframes:
+                ts, rows = keyframes[0]
+                name = (f"{self.prefix}/keyframes/{partition_of(ts)}/"
+                        f"kf-{ts[11:19].replace(':', '')}-{tag}.parquet")
+                buf  = io.BytesIO()
+                pd.DataFrame(rows).assign(keyframe_at=ts).to_parquet(
+                    buf, index=False, compression="zstd")
+                self.container.upload_blob(name, buf.getvalue(), overwrite=True)
+                names.append(name); keyframes.pop(0)
+            by_part: dict = {}
+            for e in events:
+                by_part.setdefault(partition_of(e["timestamp"]), []).append(e)
+            for part, group in sorted(by_part.items()):
+                name = f"{self.prefix}/log/{part}/part-{stamp}-{tag}.jsonl"
+                body = "".join(json.dumps(e, separators=(",", ":"), default=float) + "\n"
+                               for e in group)
+                self.container.upload_blob(name, body.encode(), overwrite=True)
+                names.append(name)
+                events = [e for e in events if partition_of(e["timestamp"]) != part]
+        except Exception:
+            with self._lock:
+                self._keyframes[:0] = keyframes
+                self._events[:0]    = events
+            raise
+        return names
+
+
+# ══════════════════════════════════════════════════════════════════
+# READER
+# ══════════════════════════════════════════════════════════════════
+def _list(container, kind: str, start: datetime, end: datetime, prefix: str) -> list[str]:
+    wanted = set(_hour_partitions(start, end))
+    names  = []
+    for day in sorted({p.split("/")[0] for p in wanted}):
+        for b in container.list_blobs(name_starts_with=f"{prefix}/{kind}/{day}/"):
+            if "/".join(b.name.split("/")[2:4]) in wanted:
+                names.append(b.name)
+    return sorted(names)
+
+
+def _frame(df: pd.DataFrame, start: datetime, end: datetime) -> pd.DataFrame:
+    if df.empty:
+        return df
+    ts = pd.to_datetime(df["timestamp"], utc=True, format="ISO8601").dt.tz_localize(None)
+    df = df[(ts >= start) & (ts < end)]
+    return df.sort_values(["timestamp", "sensor_numeric_id"], kind="stable").reset_index(drop=True)
+
+
+def read_events(container, start, end, prefix: str = EVENTS_PREFIX) -> pd.DataFrame:
+    """Every logged transition with start <= timestamp < end, in time order."""
+    start, end = _naive_utc(start), _naive_utc(end)
+    rows = []
+    for name in _list(container, "log", start, end, prefix):
+        body = container.download_blob(name).readall().decode()
+        rows.extend(json.loads(line) for line in body.splitlines() if line)
+    return _frame(pd.DataFrame(rows), start, end)
+
+
+def _keyframe_time(df: pd.DataFrame) -> datetime:
+    """
+    Tick time of a keyframe.  Rows of channels that did not tick then
+    are older, so it is stored explicitly; keyframes written before
+    that fall back to their newest row.
+    """
+    if "keyframe_at" in df:
+        return _naive_utc(df["keyframe_at"].iloc[0])
+    return max(_naive_utc(ts) for ts in df["timestamp"])
+
+
+def _state_at(container, t: datetime, prefix: str, lookback_days: float = LOOKBACK_DAYS):
+    """(keyframe time in epoch s | None, rows in force strictly before t)."""
+    names = _list(container, "keyframes", t - timedelta(days=lookback_days), t, prefix)
+    best  = None
+    for name in reversed(names):                    # newest first
+        df = pd.read_parquet(io.BytesIO(container.download_blob(name).readall()))
+        if not df.empty and _keyframe_time(df) < t:
+            best = df
+            break
+    if best is None:
+        return None, pd.DataFrame()
+    kf_time = _keyframe_time(best)
+    best    = best.drop(columns="keyframe_at", errors="ignore")
+    state   = {int(r["sensor_numeric_id"]): r for r in best.to_dict("records")}
+    for r in read_events(container, kf_time, t, prefix).to_dict("records"):
+        if _naive_utc(r["timestamp"]) > kf_time:
+            r.pop("prev_state", None)
+            state[int(r["sensor_numeric_id"])] = r
+    df = pd.DataFrame(list(state.values()))
+    return kf_time.timestamp(), df.sort_values("sensor_numeric_id").reset_index(drop=True)
+
+
+def state_at(container, t, prefix: str = EVENTS_PREFIX,
+             lookback_days: float = LOOKBACK_DAYS) -> pd.DataFrame:
+    """
+    Every sensor's record in force at time t (the last keyframe at or
+    before t plus the events since), one row per sensor; timestamp is
+    when that record was written.  Empty if no keyframe is within
+    lookback_days.
+    """
+    t = _naive_utc(t) + timedelta(microseconds=1)
+    return _state_at(container, t, prefix, lookback_days)[1]
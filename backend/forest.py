@@ -0,0 +1,198 @@
+"""
+forest.py  —  Compiled flat-array evaluator for leak_detector.pkl
+────────────────────────────────────────────────────────────────────
+The bundled model is a CalibratedClassifierCV whose calibrated
+classifiers each wrap Pipeline(RobustScaler → ExtraTreesClassifier).
+On one row, sklearn spends most of its time validating input and
+dispatching to ~1200 individual trees.
+
+CompiledForest exports everything once at load time into contiguous
+NumPy arrays:
+  - per-fold scaler   : center, scale                (C × F)
+  - every tree node   : feature, threshold,
+                        left/right child, leaf P(y=1) (all trees concatenated)
+  - per-fold isotonic : X/y thresholds, clip bounds
+
+and scores an (n × F) matrix with a vectorized traversal of all trees
+at once (max_depth steps, leaves loop onto themselves), chunk_rows
+rows at a time so the (rows × trees) index arrays stay a few MB
+whatever the batch size.  NaN features follow each node's
+missing_go_to_left, as in sklearn.  Output matches
+_model.predict_proba(X) to floating-point rounding.
+
+Only numpy is needed at scoring time; sklearn is only touched here at
+compile time.  Anything outside the shapes above raises ValueError so
+the caller can stay on the sklearn path.
+"""
+
+import numpy as np
+
+
+def _unwrap_pipeline(est):
+    """Split a fitted estimator into (scaler or None, forest)."""
+    steps = getattr(est, "steps", None)
+    if steps is None:
+        return None, est
+    if len(steps) == 1:
+        return None, steps[0][1]
+    if len(steps) == 2:
+        return steps[0][1], steps[1][1]
+    raise ValueError(f"unsupported pipeline: {[n for n, _ in steps]}")
+
+
+def _scaler_arrays(scaler, n_features: int) -> tuple:
+    """(center, scale) such that scaled = (X - center) / scale."""
+    center = np.zeros(n_features); scale = np.ones(n_features)
+    if scaler is None or scaler == "passthrough":
+        return center, scale
+    name = type(scaler).__name__
+    if name == "RobustScaler":
+        if scaler.with_centering: center = np.asarray(scaler.center_, dtype=np.float64)
+        if scaler.with_scaling:   scale  = np.asarray(scaler.scale_,  dtype=np.float64)
+    elif name == "StandardScaler":
+        if scaler.with_mean: center = np.asarray(scaler.mean_,  dtype=np.float64)
+        if scaler.with_std:  scale  = np.asarray(scaler.scale_, dtype=np.float64)
+    else:
+        raise ValueError(f"unsupported scaler: {name}")
+    return center, scale
+
+
+def _calibrator_arrays(cal) -> tuple:
+    """('isotonic', x, y, lo, hi) or ('sigmoid', a, b, 0, 0)."""
+    name = type(cal).__name__
+    if name == "IsotonicRegression":
+        if cal.out_of_bounds != "clip":
+            raise ValueError("isotonic calibrator must use out_of_bounds='clip'")
+        return ("isotonic", np.asarray(cal.X_thresholds_, dtype=np.float64),
+                np.asarray(cal.y_thresholds_, dtype=np.float64),
+                float(cal.X_min_), float(cal.X_max_))
+    if name == "_SigmoidCalibration":
+        return ("sigmoid", float(cal.a_), float(cal.b_), 0.0, 0.0)
+    raise ValueError(f"unsupported calibrator: {name}")
+
+
+class CompiledForest:
+    """
+    Flat-array export of a calibrated tree-ensemble classifier.
+
+    predict_proba(X) takes an (n × F) float64 matrix in training column
+    order and returns (n × 2) probabilities, like the sklearn model.
+    """
+
+    def __init__(self, model, chunk_rows: int = 512):
+        folds = getattr(model, "calibrated_classifiers_", None)
+        if not folds:
+            raise ValueError("model is not a fitted CalibratedClassifierCV")
+        if len(model.classes_) != 2:
+            raise ValueError("only binary classifiers are supported")
+
+        n_features = int(model.n_features_in_)
+        centers, scales, cals = [], [], []
+        feat, thr, left, right, leaf, roots, fold_of = [], [], [], [], [], [], []
+        nan_left = []
+        offset, depth = 0, 0
+
+        for c, fold in enumerate(folds):
+            if len(fold.calibrators) != 1:
+                raise ValueError("expected one calibrator per fold")
+            scaler, forest = _unwrap_pipeline(fold.estimator)
+            trees = getattr(forest, "estimators_", None)
+            if trees is None:
+                raise ValueError(f"unsupported estimator: {type(forest).__name__}")
+            center, scale = _scaler_arrays(scaler, n_features)
+            centers.append(center); scales.append(scale)
+            cals.append(_calibrator_arrays(fold.calibrators[0]))
+
+            for est in trees:
+                t = est.tree_
+                if t.n_outputs != 1:
+                    raise ValueError("multi-output trees are not supported")
+                n   = t.node_count
+                idx = np.arange(n)
+                is_leaf = t.children_left < 0
+                value = t.value[:, 0, :]
+                total = value.sum(axis=1)
+                total[total == 0.0] = 1.0
+
+                feat.append(np.where(is_leaf, 0, t.feature))
+                thr.append(np.where(is_leaf, np.inf, t.threshold))
+                nan_left.append(getattr(t, "missing_go_to_left", np.zeros(n, np.uint8)) != 0)
+                # leaves point at themselves so extra steps are no-ops
+                left.append(offset + np.where(is_leaf, idx, t.children_left))
+                right.append(offset + np.where(is_leaf, idx, t.children_right))
+                leaf.append(value[:, 1] / total)
+                roots.append(offset)
+                fold_of.append(c)
+                offset += n
+                depth = max(depth, int(t.max_depth))
+
+        self.n_features = n_features
+        self.chunk_rows = max(int(chunk_rows), 1)
+        self.n_folds    = len(folds)
+        self.depth      = depth
+        self.center     = np.vstack(centers)                       # C × F
+        self.scale      = np.vstack(scales)                        # C × F
+        self.feature    = np.concatenate(feat).astype(np.intp)
+        self.threshold  = np.concatenate(thr).astype(np.float64)
+        self.left       = np.concatenate(left).astype(np.intp)
+        self.right      = np.concatenate(right).astype(np.intp)
+        self.nan_left   = np.concatenate(nan_left)
+        self.leaf_value = np.concatenate(leaf).astype(np.float64)
+        self.roots      = np.asarray(roots, dtype=np.intp)         # T
+        self.fold_of    = np.asarray(fold_of, dtype=np.intp)       # T
+        self.calibrators = cals
+        # trees are stored fold by fold, so each fold is one column slice
+        counts = np.bincount(self.fold_of, minlength=self.n_folds)
+        self._fold_counts = counts.astype(np.float64)
+        self._fold_starts = np.concatenate([[0], np.cumsum(counts)[:-1]]).astype(np.intp)
+
+    @property
+    def n_trees(self) -> int:
+        return len(self.roots)
+
+    @property
+    def n_nodes(self) -> int:
+        return len(self.feature)
+
+    def _raw_scores(self, X: np.ndarray) -> np.ndarray:
+        """Uncalibrated P(y=1) per fold, shape (n × C)."""
+        if len(X) <= self.chunk_rows:
+            return self._raw_chunk(X)
+        return np.vstack([self._raw_chunk(X[i:i + self.chunk_rows])
+                          for i in range(0, len(X), self.chunk_rows)])
+
+    def _raw_chunk(self, X: np.ndarray) -> np.ndarray:
+        n, F = X.shape
+        # sklearn scales in float64, then trees compare in float32
+        Xs = ((X[None, :, :] - self.center[:, None, :])
+              / self.scale[:, None, :]).astype(np.float32).ravel()  # C·n·F
+
+        # flat offset of (fold(tree), row) into Xs, shape n × T
+        base = (self.fold_of[None, :] * (n * F)
+                + (np.arange(n) * F)[:, None])
+        node = np.broadcast_to(self.roots, base.shape).copy()
+        for _ in range(self.depth):
+            x = Xs[base + self.feature[node]]
+            go_left = np.where(np.isnan(x), self.nan_left[node], x <= self.threshold[node])
+            node = np.where(go_left, self.left[node], self.right[node])
+
+        vals = self.leaf_value[node]                                # n × T
+        return np.add.reduceat(vals, self._fold_starts, axis=1) / self._fold_counts
+
+    def predict_proba(self, X: np.ndarray) -> np.ndarray:
+        X = np.asarray(X, dtype=np.float64)
+        if X.ndim != 2 or X.shape[1] != self.n_features:
+            raise ValueError(f"expected (n, {self.n_features}) matrix, got {X.shape}")
+
+        raw = self._raw_scores(X)
+        p1  = np.zeros(X.shape[0])
+        for c, (kind, a, b, lo, hi) in enumerate(self.calibrators):
+            s = raw[:, c]
+            if kind == "isotonic":
+                q = np.interp(np.clip(s, lo, hi), a, b)
+            else:
+                q = 1.0 / (1.0 + np.exp(a * s + b))
+            q[(1.0 < q) & (q <= 1.0 + 1e-5)] = 1.0
+            p1 += q
+        p1 /= self.n_folds
+        return np.column_stack([1.0 - p1, p1])
@@ -0,0 +1,428 @@
+"""
+history.py  —  Local time-range index over processed history
+─────────────────────────────────────────────────────────────────────
+Processed output lives in Blob storage as per-tick JSON documents or
+hourly Parquet parts, so "leak probability on P-006 over the last week"
+means listing and downloading thousands of blobs.  This module keeps an
+embedded SQLite index beside the app, fed every tick, from which
+/history and /events answer in milliseconds:
+
+  readings  one row per sensor per tick, primary key (sensor_id, ts),
+            plus an (alert_state, ts) index; ts is epoch ms, UTC
+  sensors   sensor_id → pipe_id, so a pipe resolves to its sensors
+  rollups   per-sensor 5-minute and 1-hour aggregates (count, sums,
+            min / max), updated on insert; long ranges are downsampled
+            from these instead of from the raw rows
+  episodes  latch episodes: one row per run of consecutive leak = 1
+            readings of a sensor (latched or recovering), with peak
+            probability, largest leak and whether physics fired
+
+Readings of one sensor are assumed to arrive oldest first (ingestion
+order); rebuild_episodes() re-derives them after loading older history.
+Rows older than retention_days are pruned about once an hour.
+
+Rebuild from blob history (LocalContainer directory or the
+digital-twin-processed container):
+  python -m backend.history history.db snapshots ./processed --start 2026-09-01 --end 2026-10-01
+  python -m backend.history history.db json ./processed
+"""
+
+import argparse, json, logging, math, os, sqlite3, threading, time
+from datetime import datetime, timedelta, timezone
+
+log = logging.getLogger(__name__)
+
+ROLLUPS    = (300_000, 3_600_000)      # rollup bucket sizes, ms (5 min, 1 h)
+MAX_POINTS = 2000
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS readings (
+    sensor_id   INTEGER NOT NULL,
+    ts          INTEGER NOT NULL,
+    pipe_id     TEXT,
+    alert_state TEXT    NOT NULL,
+    leak        INTEGER NOT NULL,
+    probability REAL,
+    pressure    REAL,
+    flow_lpm    REAL,
+    p_drop_pct  REAL,
+    leak_lpm    REAL,
+    physics     INTEGER NOT NULL,
+    PRIMARY KEY (sensor_id, ts)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS readings_state ON readings (alert_state, ts);
+
+CREATE TABLE IF NOT EXISTS sensors (
+    sensor_id INTEGER PRIMARY KEY,
+    pipe_id   TEXT
+);
+CREATE INDEX IF NOT EXISTS sensors_pipe ON sensors (pipe_id);
+
+CREATE TABLE IF NOT EXISTS rollups (
+    size         INTEGER NOT NULL,
+    sensor_id    INTEGER NOT NULL,
+    t            INTEGER NOT NULL,
+    n            INTEGER NOT NULL,
+    prob_sum     REAL, prob_max     REAL,
+    pressure_sum REAL, pressure_min REAL,
+    flow_sum     REAL, leak_lpm_max REAL,
+    leaks        INTEGER NOT NULL,
+    PRIMARY KEY (size, sensor_id, t)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS episodes (
+    sensor_id        INTEGER NOT NULL,
+    start_ts         INTEGER NOT NULL,
+    end_ts           INTEGER NOT NULL,      -- last leaking reading
+    closed           INTEGER NOT NULL,
+    pipe_id          TEXT,
+    readings         INTEGER NOT NULL,
+    peak_probability REAL,
+    max_leak_lpm     REAL,
+    physics          INTEGER NOT NULL,
+    PRIMARY KEY (sensor_id, start_ts)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS episodes_pipe ON episodes (pipe_id, start_ts);
+CREATE INDEX IF NOT EXISTS episodes_end  ON episodes (end_ts);
+"""
+
+_INSERT = ("INSERT OR IGNORE INTO readings VALUES "
+           "(:sensor_id, :ts, :pipe_id, :alert_state, :leak, :probability, "
+           ":pressure, :flow_lpm, :p_drop_pct, :leak_lpm, :physics)")
+
+_ROLLUP = """
+INSERT INTO rollups VALUES (:size, :sensor_id, :t, 1, :probability, :probability,
+                            :pressure, :pressure, :flow_lpm, :leak_lpm, :leak)
+ON CONFLICT (size, sensor_id, t) DO UPDATE SET
+    n            = n + 1,
+    prob_sum     = prob_sum + excluded.prob_sum,
+    prob_max     = max(prob_max, excluded.prob_max),
+    pressure_sum = pressure_sum + excluded.pressure_sum,
+    pressure_min = min(pressure_min, excluded.pressure_min),
+    flow_sum     = flow_sum + excluded.flow_sum,
+    leak_lpm_max = max(leak_lpm_max, excluded.leak_lpm_max),
+    leaks        = leaks + excluded.leaks
+"""
+
+_EPISODE = ("INSERT OR REPLACE INTO episodes VALUES "
+            "(:sensor_id, :start_ts, :end_ts, :closed, :pipe_id, :readings, "
+            ":peak_probability, :max_leak_lpm, :physics)")
+
+SERIES = ("n", "probability_mean", "probability_max", "pressure_mean", "pressure_min",
+          "flow_lpm_mean", "leak_lpm_max", "leak_share")
+
+
+# ══════════════════════════════════════════════════════════════════
+# TIME
+# ══════════════════════════════════════════════════════════════════
+def to_ms(x) -> int:
+    """ISO timestamp (naive = UTC), datetime or epoch ms → epoch ms."""
+    if isinstance(x, (int, float)):
+        return int(x)
+    t = x if isinstance(x, datetime) else datetime.fromisoformat(str(x).strip())
+    if t.tzinfo is None:
+        t = t.replace(tzinfo=timezone.utc)
+    return int(round(t.timestamp() * 1000))
+
+
+def iso(ms: int) -> str:
+    """epoch ms → naive UTC ISO string, as in processed documents."""
+    return (datetime(1970, 1, 1) + timedelta(milliseconds=int(ms))).isoformat()
+
+
+def _reading(ts: int, rec: dict) -> dict:
+    """flat_record() / sensor_record() fields → a readings row."""
+    return {
+        "sensor_id":   int(rec["sensor_numeric_id"]),
+        "ts":          ts,
+        "pipe_id":     rec.get("pipe_id"),
+        "alert_state": rec.get("alert_state") or "normal",
+        "leak":        int(rec.get("leak") or 0),
+        "probability": rec.get("probability"),
+        "pressure":    rec.get("pressure"),
+        "flow_lpm":    rec.get("flow_lpm"),
+        "p_drop_pct":  rec.get("p_drop_pct"),
+        "leak_lpm":    rec.get("leak_lpm"),
+        "physics":     int(bool(rec.get("physics_fired"))),
+    }
+
+
+# ══════════════════════════════════════════════════════════════════
+# INDEX
+# ══════════════════════════════════════════════════════════════════
+class HistoryIndex:
+    """SQLite history index; thread-safe (one connection, one lock)."""
+
+    def __init__(self, path: str, retention_days: float = 90.0):
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path           = path
+        self.retention_days = retention_days
+        self._db            = sqlite3.connect(path, check_same_thread=False,
+                                              isolation_level=None)
+        self._lock          = threading.Lock()
+        self._pruned        = 0.0
+        with self._lock:
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.executescript(_SCHEMA)
+            self._open = {r[0]: dict(zip(_EPISODE_COLS, r)) for r in self._db.execute(
+                f"SELECT {', '.join(_EPISODE_COLS)} FROM episodes WHERE closed = 0")}
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    # ── ingest ───────────────────────────────────────────────────
+    def add(self, proc_out: dict) -> int:
+        """Index every sensor of one processed document; rows added."""
+        ts = to_ms(proc_out["timestamp"])
+        return self.add_rows([_reading(ts, rec) for rec in proc_out.get("sensors", [])])
+
+    def add_records(self, records) -> int:
+        """Index flat_record() rows (snapshot / replay tables)."""
+        return self.add_rows([_reading(to_ms(r["timestamp"]), r) for r in records])
+
+    def add_rows(self, rows: list) -> int:
+        if not rows:
+            return 0
+        with self._lock:
+            db = self._db
+            db.execute("BEGIN")
+            try:
+                new = []
+                for row in rows:
+                    if db.execute(_INSERT, row).rowcount == 1:     # skip re-indexed rows
+                        new.append(row)
+                db.executemany("INSERT OR REPLACE INTO sensors VALUES (:sensor_id, :pipe_id)",
+                               {r["sensor_id"]: r for r in new}.values())
+                db.executemany(_ROLLUP, ({**r, "size": s, "t": r["ts"] // s * s}
+                                         for s in ROLLUPS for r in new))
+                db.executemany(_EPISODE, self._track(new))
+                db.execute("COMMIT")
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+            self._prune()
+        return len(new)
+
+    def _track(self, rows: list) -> list:
+        """Advance the open latch episodes; rows of episodes that changed."""
+        changed = {}
+        for r in rows:
+            sid, ep = r["sensor_id"], self._open.get(r["sensor_id"])
+            if r["leak"]:
+                if ep is None:
+                    ep = self._open[sid] = {
+                        "sensor_id": sid, "start_ts": r["ts"], "end_ts": r["ts"],
+                        "closed": 0, "pipe_id": r["pipe_id"], "readings": 0,
+                        "peak_probability": r["probability"], "max_leak_lpm": r["leak_lpm"],
+                        "physics": 0}
+                ep["end_ts"]    = r["ts"]
+                ep["readings"] += 1
+                ep["peak_probability"] = _max(ep["peak_probability"], r["probability"])
+                ep["max_leak_lpm"]     = _max(ep["max_leak_lpm"], r["leak_lpm"])
+                ep["physics"] |= int(r["physics"])
+            elif ep is not None:
+                ep["closed"] = 1
+                del self._open[sid]
+            else:
+                continue
+            changed[(sid, ep["start_ts"])] = dict(ep)
+        return list(changed.values())
+
+    def rebuild_episodes(self):
+        """Re-derive every episode from the readings (after a backfill)."""
+        with self._lock:
+            db = self._db
+            db.execute("BEGIN")
+            try:
+                db.execute("DELETE FROM episodes")
+                self._open = {}
+                keys = ("sensor_id", "ts", "pipe_id", "leak", "probability", "leak_lpm", "physics")
+                cur  = db.execute(f"SELECT {', '.join(keys)} FROM readings ORDER BY sensor_id, ts")
+                while True:
+                    batch = cur.fetchmany(50_000)
+                    if not batch:
+                        break
+                    db.executemany(_EPISODE, self._track([dict(zip(keys, r)) for r in batch]))
+                db.execute("COMMIT")
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+
+    def _prune(self):
+        if not self.retention_days or time.monotonic() - self._pruned < 3600:
+            return
+        self._pruned = time.monotonic()
+        cut = int(time.time() * 1000 - self.retention_days * 86_400_000)
+        for sql in ("DELETE FROM readings WHERE ts < ?",
+                    "DELETE FROM rollups  WHERE t < ?",
+                    "DELETE FROM episodes WHERE closed = 1 AND end_ts < ?"):
+            self._db.execute(sql, (cut,))
+
+    # ── queries ──────────────────────────────────────────────────
+    def _where(self, pipe_id, sensor_id) -> tuple:
+        """(SQL condition on sensor_id, its params, sensor ids) for the filters."""
+        if sensor_id is not None:
+            sids = [int(sensor_id)]
+        elif pipe_id is not None:
+            sids = [r[0] for r in self._db.execute(
+                "SELECT sensor_id FROM sensors WHERE pipe_id = ? ORDER BY sensor_id", (pipe_id,))]
+        else:
+            return "1", {}, None
+        params = {f"x{k}": sid for k, sid in enumerate(sids)}
+        return f"sensor_id IN ({', '.join(':' + k for k in params)})", params, sids
+
+    def series(self, start, end, pipe_id: str = None, sensor_id: int = None,
+               alert_state: str = None, bucket_s: float = None, points: int = 500) -> dict:
+        """
+        Downsampled series over [start, end): one bucket per bucket_s
+        seconds (default: the range split into about `points` buckets),
+        aggregated across the pipe's / sensor's / the fleet's readings.
+        Buckets of 5 min or more come from the rollups; alert_state
+        filters raw readings.  Columnar: "t" (bucket start, ISO) plus
+        one list per SERIES field; empty buckets are left out.
+        """
+        s, e = to_ms(start), to_ms(end)
+        if e <= s:
+            raise ValueError("end must be after start")
+        points = min(max(int(points), 1), MAX_POINTS)
+        b = (int(bucket_s * 1000) if bucket_s else math.ceil((e - s) / points))
+        b = max(b, 1000, math.ceil((e - s) / MAX_POINTS))
+        size = next((z for z in reversed(ROLLUPS) if b >= z), None) if alert_state is None else None
+        if size is not None:
+            b = math.ceil(b / size) * size                   # whole rollup buckets
+        s = s // b * b
+
+        with self._lock:
+            cond, params, sids = self._where(pipe_id, sensor_id)
+            if size is None:
+                sql = (f"SELECT ts / :b * :b AS k, count(*), sum(probability), max(probability), "
+                       f"sum(pressure), min(pressure), sum(flow_lpm), max(leak_lpm), sum(leak) "
+                       f"FROM readings WHERE {cond} AND ts >= :s AND ts < :e")
+                if alert_state is not None:
+                    sql += " AND alert_state = :a"
+            else:
+                sql = (f"SELECT t / :b * :b AS k, sum(n), sum(prob_sum), max(prob_max), "
+                       f"sum(pressure_sum), min(pressure_min), sum(flow_sum), max(leak_lpm_max), "
+                       f"sum(leaks) FROM rollups WHERE size = :z AND {cond} AND t >= :s AND t < :e")
+            args = {"b": b, "s": s, "e": e, "a": alert_state, "z": size, **params}
+            rows = self._db.execute(sql + " GROUP BY k ORDER BY k", args).fetchall()
+
+        cols = {k: [] for k in ("t",) + SERIES}
+        for k, n, psum, pmax, prs, pmin, fsum, lmax, leaks in rows:
+            for name, v in zip(("t",) + SERIES,
+                               (iso(k), n, _mean(psum, n), pmax, _mean(prs, n), pmin,
+                                _mean(fsum, n), lmax, round(leaks / n, 4))):
+                cols[name].append(v)
+        return {"pipe_id": pipe_id, "sensor_ids": sids, "alert_state": alert_state,
+                "start": iso(s), "end": iso(e), "bucket_s": b / 1000,
+                "source": "readings" if size is None else f"rollup_{size // 1000}s",
+                "series": cols}
+
+    def events(self, start, end, pipe_id: str = None, sensor_id: int = None,
+               open_only: bool = False, limit: int = 500) -> list:
+        """Latch episodes overlapping [start, end), newest first."""
+        s, e = to_ms(start), to_ms(end)
+        with self._lock:
+            cond, params, _ = self._where(pipe_id, sensor_id)
+            sql = (f"SELECT {', '.join(_EPISODE_COLS)} FROM episodes WHERE {cond} "
+                   f"AND start_ts < :e AND end_ts >= :s")
+            if open_only:
+                sql += " AND closed = 0"
+            rows = self._db.execute(sql + " ORDER BY start_ts DESC LIMIT :limit",
+                                    {"s": s, "e": e, "limit": int(limit), **params}).fetchall()
+        out = []
+        for r in rows:
+            ep = dict(zip(_EPISODE_COLS, r))
+            out.append({
+                "sensor_id":        ep["sensor_id"],
+                "pipe_id":          ep["pipe_id"],
+                "start":            iso(ep["start_ts"]),
+                "end":              iso(ep["end_ts"]),
+                "open":             not ep["closed"],
+                "duration_s":       (ep["end_ts"] - ep["start_ts"]) / 1000,
+                "readings":         ep["readings"],
+                "peak_probability": ep["peak_probability"],
+                "max_leak_lpm":     ep["max_leak_lpm"],
+                "physics_fired":    bool(ep["physics"]),
+            })
+        return out
+
+    def stats(self) -> dict:
+        with self._lock:
+            n, first, last = self._db.execute(
+                "SELECT count(*), min(ts), max(ts) FROM readings").fetchone()
+        return {"readings": n, "first": first and iso(first), "last": last and iso(last),
+                "open_episodes": len(self._open)}
+
+
+_EPISODE_COLS = ("sensor_id", "start_ts", "end_ts", "closed", "pipe_id", "readings",
+                 "peak_probability", "max_leak_lpm", "physics")
+
+
+def _max(a, b):
+    return b if a is None else a if b is None else max(a, b)
+
+
+def _mean(total, n):
+    return None if total is None or not n else round(total / n, 4)
+
+
+# ══════════════════════════════════════════════════════════════════
+# REBUILD FROM BLOB HISTORY
+# ══════════════════════════════════════════════════════════════════
+def rebuild_from_snapshots(index: HistoryIndex, container, start, end) -> int:
+    """Index Parquet snapshot rows in [start, end); rows added."""
+    from .snapshots import read_range
+    df = read_range(container, start, end)
+    n = index.add_records(df.to_dict("records")) if len(df) else 0
+    index.rebuild_episodes()
+    return n
+
+
+def rebuild_from_json(index: HistoryIndex, container, prefix: str = "") -> int:
+    """Index {fid}_processed.json documents (name order = time order)."""
+    names = sorted(b.name for b in container.list_blobs(name_starts_with=prefix or None)
+                   if b.name.endswith("_processed.json"))
+    n = 0
+    for name in names:
+        doc = json.loads(container.download_blob(name).readall())
+        if "timestamp" in doc and "sensors" in doc:
+            n += index.add(doc)
+    index.rebuild_episodes()
+    return n
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(prog="python -m backend.history",
+                                 description="Rebuild the history index from blob history.")
+    ap.add_argument("db", help="SQLite file (HISTORY_DB)")
+    ap.add_argument("source", choices=["snapshots", "json"])
+    ap.add_argument("path", nargs="?", help="local directory (default: processed container)")
+    ap.add_argument("--start", help="snapshots: start, ISO UTC")
+    ap.add_argument("--end",   help="snapshots: end,   ISO UTC")
+    ap.add_argument("--prefix", default="", help="json: blob name prefix, e.g. 2026-09")
+    ap.add_argument("--container", default="digital-twin-processed")
+    args = ap.parse_args(argv)
+    if args.source == "snapshots" and not (args.start and args.end):
+        ap.error("snapshots needs --start and --end")
+
+    if args.path:
+        from .snapshots import LocalContainer
+        ctr = LocalContainer(args.path)
+    else:
+        from azure.storage.blob import ContainerClient
+        ctr = ContainerClient.from_connection_string(
+            os.environ["AZURE_STORAGE_CONNECTION_STRING"], args.container)
+
+    t0, index = time.perf_counter(), HistoryIndex(args.db, retention_days=0)
+    n = (rebuild_from_snapshots(index, ctr, args.start, args.end) if args.source == "snapshots"
+         else rebuild_from_json(index, ctr, args.prefix))
+    print(json.dumps({"added": n, **index.stats(),
+                      "seconds": round(time.perf_counter() - t0, 3)}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""
+kernels.py  —  Array versions of the per-reading scalar paths
+─────────────────────────────────────────────────────────────────────
+NumPy kernels for a whole tick (or a whole replay) at once.  Each
+returns the same numbers as its scalar reference, which stays the
+readable definition:
+
+  to_float()   twin._float()        coerce; non-finite → default
+  clean()      twin._clean()        NaN / ±Inf → 0.0
+  calibrate()  twin.calibrate()     raw field values → bar / lpm, clamped
+  quantify()   predict._quantify()  orifice equation → leak lps, mm², mm
+
+Sensors sit on the last axis, so calibration factors broadcast per
+sensor: sensor_factors() reads the optional "pressure_factor" /
+"flow_factor" of SENSOR_CONFIG-style entries (default: config.py).
+"""
+
+import numpy as np
+
+from .config import (FIELD_FLOW_LPM, FIELD_PRESSURE_BAR, FLOW_FACTOR,
+                     PRESSURE_FACTOR, FLOW_MAX_LPM, PRESSURE_MAX_BAR)
+
+
+def to_float(values, default) -> np.ndarray:
+    """float64 array of values; unparseable / NaN / ±Inf → default."""
+    a = np.asarray(values)
+    try:
+        # parses like float() (pd.to_numeric can differ in the last bit)
+        out = a.astype(np.float64)
+    except (TypeError, ValueError):
+        out = np.fromiter((_parse(v) for v in a.ravel()), np.float64, a.size)
+        out = out.reshape(a.shape)
+    return np.where(np.isfinite(out), out, default)
+
+
+def _parse(v) -> float:
+    try:
+        return float(v)
+    except (TypeError, ValueError):
+        return np.nan
+
+
+def clean(values) -> np.ndarray:
+    """NaN / ±Inf → 0.0, so JSON / Parquet output never carries them."""
+    a = np.asarray(values, dtype=np.float64)
+    return np.where(np.isfinite(a), a, 0.0)
+
+
+def sensor_factors(sensors) -> tuple:
+    """(pressure_factor[S], flow_factor[S]) for SENSOR_CONFIG-style entries."""
+    return (np.array([s.get("pressure_factor", PRESSURE_FACTOR) for s in sensors], dtype=np.float64),
+            np.array([s.get("flow_factor",     FLOW_FACTOR)     for s in sensors], dtype=np.float64))
+
+
+def calibrate(raw_pressure, raw_flow, pressure_factor=PRESSURE_FACTOR,
+              flow_factor=FLOW_FACTOR) -> tuple:
+    """
+    (pressure_bar, flow_lpm) arrays for raw ThingSpeak field values
+    (strings, None or numbers), shape (…, S).  A missing or garbage
+    value reads as the field normal, as in twin.calibrate().
+    """
+    pf = np.asarray(pressure_factor, dtype=np.float64)
+    ff = np.asarray(flow_factor,     dtype=np.float64)
+    p_raw = np.maximum(to_float(raw_pressure, FIELD_PRESSURE_BAR / pf), 0.0)
+    f_raw = np.maximum(to_float(raw_flow,     FIELD_FLOW_LPM / ff),     0.0)
+    return (np.minimum(p_raw * pf, PRESSURE_MAX_BAR),
+            np.minimum(f_raw * ff, FLOW_MAX_LPM))
+
+
+def quantify(flow_lps, pressure_bar, normal_lps: float, cd: float, g: float) -> tuple:
+    """
+    (leak_lps, area_mm2, diameter_mm) arrays, rounded to 4 places: the
+    excess flow over normal_lps through a sharp-edged orifice at the
+    measured head.  Zero where there is no excess flow or no pressure.
+    """
+    f = np.asarray(flow_lps,     dtype=np.float64)
+    p = np.asarray(pressure_bar, dtype=np.float64)
+    lps  = np.abs(f - normal_lps)
+    head = p * 10.2
+    off  = (lps <= 0) | (p <= 0) | (head <= 0)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        A   = (lps / 1000.0) / (cd * np.sqrt(2.0 * g * np.where(off, 1.0, head)))
+        dia = np.sqrt(4 * A / np.pi) * 1000
+    return tuple(np.where(off, 0.0, np.round(x, 4)) for x in (lps, A * 1e6, dia))
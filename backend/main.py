@@ -7,216 +7,727 @@ Architecture:
 
 Routes:
   GET /       status + config
-  GET /live   fetch → predict → prescribe → persist → return
+  GET /live       most recent fetch → predict → prescribe → persist result
+  POST /backfill  re-score ThingSpeak history or stored blobs (replay.py)
+  GET /stream     Server-Sent Events: snapshot, then per-tick deltas of
+                  changed sensors only (stream.py); fed by ingestion,
+                  so viewers never trigger a model run
+  GET /metrics    Prometheus text: per-stage / per-sensor latency
+                  histograms, trigger and latch counters (metrics.py)
+  GET /history    downsampled series for a pipe / sensor / the fleet
+                  over a time range, from the local index (history.py)
+  GET /events     latch episodes (leak start → end) over a time range
+  GET /models     live / shadow model, per-model latency, disagreement
+  POST /models/shadow?name=…  load a bundle from MODEL_DIR as shadow
+                  (in the background), POST /models/promote makes it
+                  live, DELETE /models/shadow drops it (models.py)
+
+Ingestion:
+  An APScheduler job runs the async pipeline every INGEST_INTERVAL_S
+  seconds (ThingSpeak update rate) and skips feed entries whose
+  entry_id was already ingested, so every reading enters the rolling
+  windows exactly once.  /live just returns the last result from
+  memory.  With INGEST_SCHEDULER=0, /live runs the pipeline itself
+  (still deduplicated by entry_id).
+
+Channels (CHANNELS_CONFIG, channels.py):
+  Sensors may span many ThingSpeak channels.  Every tick fetches the
+  latest entry of all channels concurrently (FETCH_CONCURRENCY at a
+  time, rate-limited channels back off) and scores every sensor of a
+  channel with a new entry_id in one batch.  latest.json and /live
+  hold the most recent record of every sensor; history documents only
+  the sensors scored in that tick.
+
+Persistence (SNAPSHOT_FORMAT):
+  parquet  (default) processed rows are buffered and flushed every
+           SNAPSHOT_FLUSH_S seconds as hourly-partitioned Parquet parts
+           (snapshots.py); rows carry the calibrated readings, so no
+           per-tick raw blob is written
+  json     one {fid}_raw.json + {fid}_processed.json pair per tick
+  events   change-only (eventlog.py): an append-only log of latch
+           transitions plus a keyframe of every sensor's latest record
+           each EVENTS_KEYFRAME_S, flushed like parquet; a healthy
+           network writes one keyframe per interval and nothing else
+  latest.json is overwritten every tick in every mode.
+
+Buffer state (STATE_STORE, state_store.py):
+  SensorBuffer windows, latch state and each channel's last ingested
+  entry_id are restored before the first tick and saved every
+  STATE_SAVE_S seconds and on shutdown.  With STATE_SHARED=1 every tick runs under the store's
+  cross-process lock, reloads state another worker saved and saves
+  straight after, so all workers advance one shared state.  The Redis
+  key defaults to digital-twin:<sorted channel ids>:buffers (STATE_KEY
+  overrides it).
+  The live registry (predict.BufferRegistry) evicts sensors idle for
+  BUFFER_TTL_S (default 1 day) and holds at most BUFFER_MAX_SENSORS,
+  least recently seen first out; an evicted sensor that reports again
+  restarts from field normals.
+
+Sharded inference (INFERENCE_SHARDS, shards.py):
+  With INFERENCE_SHARDS=N, sensor ids are hashed over N worker
+  processes; each loads the model once and owns the buffers of its
+  shard, and readings / scores cross over shared memory.  The state
+  store saves and restores the union of the shards.  Off (0) by
+  default: worth it from a few thousand sensors per tick.
+
+History index (HISTORY_DB, history.py):
+  With HISTORY_DB set to a SQLite file, every processed tick is also
+  indexed locally by sensor / pipe_id, timestamp and alert_state, with
+  5-minute and hourly rollups and latch episodes, so /history and
+  /events never touch Blob storage.  Rows older than
+  HISTORY_RETENTION_DAYS are pruned; `python -m backend.history`
+  rebuilds the index from snapshots or processed JSON blobs.
+
+Pipe network (NETWORK_CONFIG, network.py):
+  Off unless NETWORK_CONFIG names a topology file (layout as in
+  backend/network.example.json); then every tick adds
+  proc_out["network"]: per-sensor pressure-gradient residual and zone
+  flow deficit, and the suspect pipe_id they localise a leak to.
+
+Startup (STARTUP_MODE):
+  Importing this module does no network I/O, does not load the model
+  and does not read the state store.  lifespan (default) warms all
+  three up before serving; lazy waits for the first tick; preload
+  loads the model at import for pre-forked workers (gunicorn.conf.py).
+
+Profiling:
+  With PROFILE_TOKEN set, a request carrying "X-Profile: <token>" is
+  run under cProfile (PROFILER=pyinstrument if installed) and answered
+  with the report instead of its body; any other X-Profile value is
+  ignored.  One profiled request runs at a time: another gets 409.  /live then runs one ingestion tick inline, so fetch →
+  predict → persist shows up in the profile.
+
+run_digital_twin() is the blocking version of the same pipeline, used
+by the WebJob.  The async pipeline shares one keep-alive HTTP session
+and one async Blob client, and only waits for latest.json — history
+writes happen in the background.
 """
 
-from fastapi import FastAPI
-import requests, math, os, json, uuid
+from fastapi import FastAPI, Request
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from contextlib import asynccontextmanager
+import contextlib
+import requests, os, json, uuid, asyncio, gc, hmac, logging, threading, time
+import aiohttp
+import numpy as np
 from datetime import datetime
 from azure.storage.blob import BlobServiceClient
-
-from .predict  import predict_leak
-from .prescribe import get_prescription
-
-app = FastAPI(title="Predictive Digital Twin — Leak Detection API")
+from azure.storage.blob.aio import BlobServiceClient as AsyncBlobServiceClient
+from apscheduler.schedulers.asyncio import AsyncIOScheduler
+
+from .config  import (FIELD_FLOW_LPM, FIELD_PRESSURE_BAR, SENSOR_META)
+from .predict import predict_leak_batch
+from .        import metrics, predict, state_store
+from .twin    import sensor_record
+from .kernels import calibrate
+from .        import replay
+from .channels  import ChannelRegistry
+from .snapshots import SnapshotWriter
+from .eventlog  import EventLogWriter
+from .stream    import StreamHub
+from .network   import NetworkInference, PipeNetwork
+from .          import history
+from .shards    import ShardedScorer
+
+log = logging.getLogger(__name__)
 
 # ══════════════════════════════════════════════════════════════════
 # ENVIRONMENT VARIABLES (set in Azure App Service → Configuration)
 # ══════════════════════════════════════════════════════════════════
-CHANNEL_ID   = os.getenv("CHANNEL_ID")
-READ_API_KEY = os.getenv("READ_API_KEY")
-AZURE_CONN   = os.getenv("AZURE_STORAGE_CONNECTION_STRING")
+CHANNEL_ID      = os.getenv("CHANNEL_ID")
+READ_API_KEY    = os.getenv("READ_API_KEY")
+CHANNELS_CONFIG = os.getenv("CHANNELS_CONFIG", "")      # multi-channel registry (JSON)
+AZURE_CONN      = os.getenv("AZURE_STORAGE_CONNECTION_STRING")
 
 RAW_CONTAINER       = "digital-twin-raw"
 PROCESSED_CONTAINER = "digital-twin-processed"
 
-if not CHANNEL_ID or not READ_API_KEY:
-    raise ValueError("Missing env vars: CHANNEL_ID, READ_API_KEY")
+if not CHANNELS_CONFIG and (not CHANNEL_ID or not READ_API_KEY):
+    raise ValueError("Missing env vars: CHANNEL_ID, READ_API_KEY (or CHANNELS_CONFIG)")
 if not AZURE_CONN:
     raise ValueError("Missing env var: AZURE_STORAGE_CONNECTION_STRING")
 
+# ── Startup ────────────────────────────────────────────────────────
+# lifespan  (default) import does no I/O; model load, container setup
+#           and the state restore run in the FastAPI lifespan, before
+#           the first request
+# lazy      all happen on first use (first tick / first blob write)
+# preload   model loaded at import and frozen out of the GC, so workers
+#           forked from a preloading master (gunicorn.conf.py) share it
+#           copy-on-write (unsharded only: shard workers load their own)
+STARTUP_MODE = os.getenv("STARTUP_MODE", "lifespan").strip().lower()
+
 # ── Azure Blob ─────────────────────────────────────────────────────
-_blob_svc = BlobServiceClient.from_connection_string(AZURE_CONN)
-_raw_ctr  = _blob_svc.get_container_client(RAW_CONTAINER)
-_proc_ctr = _blob_svc.get_container_client(PROCESSED_CONTAINER)
+class _LazyContainer:
+    """ContainerClient that is created, and its container ensured, on first use."""
+
+    def __init__(self, name: str):
+        self.container_name = name
+        self._client = None
+        self._lock   = threading.Lock()
+
+    @property
+    def client(self):
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    ctr = _blob_service().get_container_client(self.container_name)
+                    try: ctr.create_container()
+                    except Exception: pass   # already exists
+                    self._client = ctr
+        return self._client
+
+    @property
+    def ready(self) -> bool:
+        return self._client is not None
+
+    def __getattr__(self, attr):
+        return getattr(self.client, attr)
+
+
+_blob: dict = {}
+
+def _blob_service() -> BlobServiceClient:
+    if "svc" not in _blob:
+        _blob["svc"] = BlobServiceClient.from_connection_string(AZURE_CONN)
+    return _blob["svc"]
+
+_raw_ctr  = _LazyContainer(RAW_CONTAINER)
+_proc_ctr = _LazyContainer(PROCESSED_CONTAINER)
+
+
+def _warm_up():
+    """Everything lifespan mode defers: model load, blob containers, stored state."""
+    if _shards is not None:
+        _shards.start()             # each worker loads its own model; we never score
+    else:
+        predict.load_model()
+    for ctr in (_raw_ctr, _proc_ctr):
+        ctr.client
+    _restore_once()
+    _resume_snapshots()
+
+
+def _resume_snapshots():
+    """SNAPSHOT_FORMAT=events: read the stored keyframe + log once (Blob I/O)."""
+    if isinstance(_snapshots, EventLogWriter):
+        _snapshots.resume()
 
-for ctr in [_raw_ctr, _proc_ctr]:
-    try: ctr.create_container()
-    except Exception: pass   # already exists
 
 # ── ThingSpeak ─────────────────────────────────────────────────────
-THINGSPEAK_URL = (
-    f"https://api.thingspeak.com/channels/{CHANNEL_ID}/feeds.json"
-    f"?api_key={READ_API_KEY}&results=1"
-)
+THINGSPEAK_TIMEOUT  = 10     # s
+FETCH_CONCURRENCY   = int(os.getenv("FETCH_CONCURRENCY", "8"))
+FETCH_BACKOFF_MAX_S = float(os.getenv("FETCH_BACKOFF_MAX_S", "300"))
 
-# ══════════════════════════════════════════════════════════════════
-# PIPE & SENSOR CONFIGURATION
-# ══════════════════════════════════════════════════════════════════
-PIPE_AREA = 490.87          # mm²  (DN25 pipe: π/4 × 25²)
-
-# Field normal operating point (must match predict.py values)
-FIELD_FLOW_LPM     = 25.0   # lpm
-FIELD_PRESSURE_BAR = 0.48   # bar
-
-# ADC → physical unit correction factors (calibrated from field meter)
-FLOW_FACTOR     = 7.177033493    # raw → lpm
-PRESSURE_FACTOR = 0.390450136    # raw → bar
-
-# Safety clamps (reject clearly faulty sensor values)
-FLOW_MAX_LPM     = 200.0    # lpm
-PRESSURE_MAX_BAR = 10.0     # bar
-
-# ThingSpeak field assignments
-SENSOR_CONFIG = [
-    {"sensor_id": 1, "flow_field": "field1", "pressure_field": "field2"},
-    {"sensor_id": 2, "flow_field": "field3", "pressure_field": "field4"},
-    {"sensor_id": 3, "flow_field": "field5", "pressure_field": "field6"},
-]
-
-# Pipe network metadata (used by CesiumJS 3D visualisation)
-SENSOR_META = {
-    1: {"pressure_sensor_id": "PP-001", "flow_sensor_id": "F-001", "pipe_id": "P-002"},
-    2: {"pressure_sensor_id": "PP-002", "flow_sensor_id": "F-002", "pipe_id": "P-006"},
-    3: {"pressure_sensor_id": "PP-003", "flow_sensor_id": "F-003", "pipe_id": "P-009"},
-}
+_fetch_kw = dict(concurrency=FETCH_CONCURRENCY, timeout=THINGSPEAK_TIMEOUT,
+                 backoff_max_s=FETCH_BACKOFF_MAX_S)
+_channels = (ChannelRegistry.from_file(CHANNELS_CONFIG, **_fetch_kw) if CHANNELS_CONFIG
+             else ChannelRegistry.single(CHANNEL_ID, READ_API_KEY, **_fetch_kw))
+SENSOR_META.update(_channels.sensor_meta)
+
+# ── Ingestion scheduler ───────────────────────────────────────────
+INGEST_SCHEDULER  = os.getenv("INGEST_SCHEDULER", "1") != "0"
+INGEST_INTERVAL_S = float(os.getenv("INGEST_INTERVAL_S", "15"))   # ThingSpeak rate
+
+# ── History persistence ───────────────────────────────────────────
+SNAPSHOT_FORMAT   = os.getenv("SNAPSHOT_FORMAT", "parquet").strip().lower()   # | 'json' | 'events'
+SNAPSHOT_FLUSH_S  = float(os.getenv("SNAPSHOT_FLUSH_S", "300"))
+EVENTS_KEYFRAME_S = float(os.getenv("EVENTS_KEYFRAME_S", "3600"))
+
+_snapshots = (SnapshotWriter(_proc_ctr, SNAPSHOT_FLUSH_S) if SNAPSHOT_FORMAT == "parquet" else
+              EventLogWriter(_proc_ctr, SNAPSHOT_FLUSH_S, EVENTS_KEYFRAME_S)
+              if SNAPSHOT_FORMAT == "events" else None)
+
+# ── Buffer state persistence ──────────────────────────────────────
+STATE_STORE  = os.getenv("STATE_STORE", "")          # file:/path | redis://…
+STATE_KEY    = os.getenv("STATE_KEY", f"digital-twin:{_channels.key}:buffers")
+STATE_SAVE_S = float(os.getenv("STATE_SAVE_S", "60"))
+STATE_SHARED = os.getenv("STATE_SHARED", "0") == "1"
+
+_store = state_store.open_store(STATE_STORE, STATE_KEY)
+
+# ── Sharded inference (off unless INFERENCE_SHARDS > 0) ──────────
+INFERENCE_SHARDS = int(os.getenv("INFERENCE_SHARDS", "0"))
+
+_shards = (ShardedScorer(INFERENCE_SHARDS, ttl_s=predict.BUFFER_TTL_S,
+                         max_sensors=predict.BUFFER_MAX_SENSORS)
+           if INFERENCE_SHARDS > 0 else None)
+
+# Sharded, the model lives in the workers (started per process by the
+# lifespan), so there is nothing in this process to share copy-on-write.
+if STARTUP_MODE == "preload" and _shards is None:
+    predict.load_model()
+    gc.freeze()         # keep refcount/GC writes off the shared model pages
+
+# ── Model bundles for /models (shadow / promote) ─────────────────
+MODEL_DIR = os.getenv("MODEL_DIR", predict.BASE_DIR)
+
+# ── History index (off unless HISTORY_DB is set) ──────────────────
+HISTORY_DB             = os.getenv("HISTORY_DB", "")
+HISTORY_RETENTION_DAYS = float(os.getenv("HISTORY_RETENTION_DAYS", "90"))
+HISTORY_DEFAULT_DAYS   = 7          # /history, /events range without start
+
+_history = history.HistoryIndex(HISTORY_DB, HISTORY_RETENTION_DAYS) if HISTORY_DB else None
+
+# ── /stream ───────────────────────────────────────────────────────
+STREAM_KEEPALIVE_S = float(os.getenv("STREAM_KEEPALIVE_S", "15"))
+_hub = StreamHub(STREAM_KEEPALIVE_S)
+
+# ── Pipe network (off unless NETWORK_CONFIG is set) ──────────────
+NETWORK_CONFIG = os.getenv("NETWORK_CONFIG", "")
+
+_network = (NetworkInference(PipeNetwork.from_file(NETWORK_CONFIG))
+            if NETWORK_CONFIG else None)
+
+# ── Per-request profiling (off unless PROFILE_TOKEN is set) ──────
+PROFILE_TOKEN = os.getenv("PROFILE_TOKEN", "")
+PROFILER      = os.getenv("PROFILER", "cprofile").strip().lower()   # | 'pyinstrument'
+
+_http = requests.Session()  # keep-alive for the blocking path
 
 # ══════════════════════════════════════════════════════════════════
 # UTILITIES
 # ══════════════════════════════════════════════════════════════════
-def _float(x, default: float) -> float:
-    try:
-        v = float(x)
-        return default if (math.isnan(v) or math.isinf(v)) else v
-    except Exception:
-        return default
+def _blob_stage(name: str) -> str:
+    """'latest.json' → 'persist_latest', '{fid}_raw.json' → 'persist_raw'."""
+    return "persist_" + name.rsplit("_", 1)[-1].removesuffix(".json")
 
-def _clean(d: dict) -> dict:
-    """Replace NaN/Inf so JSON serialisation never fails."""
-    return {k: (0.0 if isinstance(v, float) and (math.isnan(v) or math.isinf(v)) else v)
-            for k, v in d.items()}
 
 def _save_blob(ctr, name: str, data: dict):
-    ctr.get_blob_client(name).upload_blob(json.dumps(data, indent=2), overwrite=True)
+    with metrics.stage(_blob_stage(name)):
+        ctr.get_blob_client(name).upload_blob(json.dumps(data, indent=2), overwrite=True)
 
 # ══════════════════════════════════════════════════════════════════
 # CORE DIGITAL TWIN LOOP
 # ══════════════════════════════════════════════════════════════════
-def run_digital_twin() -> dict:
+# Buffers and latch state in predict.py are shared, so only one tick is
+# processed at a time (concurrent /live calls queue here, not in sklearn).
+_twin_lock = threading.Lock()
+
+# Last ingested entry per channel, latest record per sensor, the
+# document /live serves (every sensor's latest record) and last error
+_last = {"entry_ids": {}, "records": {}, "proc_out": None, "error": None}
+
+# Version of the buffer state we hold (seq of the snapshot it matches)
+_state = {"seq": 0, "saved_at": time.monotonic(), "dirty": False, "restored": False}
+
+
+def _buffers():
+    """The live buffer state: the shards' when sharded, else predict's."""
+    return _shards if _shards is not None else predict._buffers
+
+
+def _restore_state(data=None) -> bool:
+    """Replace the live buffers with the stored snapshot, if any."""
+    data = _store.load() if data is None else data
+    if not data:
+        return False
+    buffers, seq, eids = state_store.load_buffers(data)
+    _buffers().load(buffers)
+    _state.update(seq=seq, dirty=False)
+    _last["entry_ids"] = eids
+    return True
+
+
+def _save_state():
+    seq = _state["seq"] + 1
+    _store.save(state_store.dump_buffers(_buffers(), seq, _last["entry_ids"]))
+    _state.update(seq=seq, saved_at=time.monotonic(), dirty=False)
+
+
+def _sync_state():
+    """STATE_SHARED: pick up a snapshot saved by another worker."""
+    data = _store.load()
+    if data and state_store.read_header(data)[0] != _state["seq"]:
+        _restore_state(data)
+
+
+def _locked_save_state():
+    with _twin_lock, _state_lock():
+        _save_state()
+
 
-    # 1. Fetch from ThingSpeak ────────────────────────────────────
+def _state_lock():
+    if _store is not None and STATE_SHARED:
+        return _store.lock()
+    return contextlib.nullcontext()
+
+
+def _restore_at_startup() -> bool:
+    """Restore the stored buffers; a missing or unreadable snapshot → cold start."""
     try:
-        resp = requests.get(THINGSPEAK_URL, timeout=10)
-        resp.raise_for_status()
-        feeds = resp.json().get("feeds", [])
-        if not feeds:
-            return {"error": "No feeds from ThingSpeak"}
-        feed = feeds[-1]
+        if _restore_state():
+            log.info("Restored %d sensor buffers (seq %d)",
+                     len(_buffers()), _state["seq"])
+            return True
     except Exception as e:
-        return {"error": f"ThingSpeak: {e}"}
-
+        log.warning("State store: could not restore buffers: %s", e)
+    return False
+
+
+def _restore_once():
+    """Restore the stored buffers before the first tick (never at import)."""
+    if _store is None or _state["restored"]:
+        return
+    with _twin_lock:
+        if not _state["restored"]:
+            _restore_at_startup()
+            _state["restored"] = True
+
+
+def _process_feeds(feeds: dict, errors: dict = None, on_tick=None):
+    """Calibrate → predict → prescribe the latest entry of each channel.
+
+    feeds maps channel_id → ThingSpeak feed entry; channels whose
+    entry_id was already ingested are dropped (their buffers are left
+    untouched).  Returns (fid, raw_out, proc_out, latest): proc_out
+    holds the sensors scored now, latest every sensor's most recent
+    record.  raw_out is None on error and proc_out then carries the
+    {"error": ...} dict.  Returns None if no channel has a new entry.
+    on_tick(proc_out) is called under the tick lock, so overlapping
+    ticks reach it in the order they were processed.
+    """
+    with _twin_lock, _state_lock():
+        if _store is not None and STATE_SHARED:
+            _sync_state()
+        seen  = _last["entry_ids"]
+        fresh = {cid: f for cid, f in feeds.items()
+                 if f.get("entry_id") is None or f.get("entry_id") != seen.get(cid)}
+        if not fresh:
+            metrics.TICKS.inc("duplicate")
+            return None
+        fid, raw_out, proc_out = _process_feed_locked(fresh)
+        if raw_out is None:
+            metrics.TICKS.inc("error")
+            return fid, raw_out, proc_out, None
+        metrics.TICKS.inc("processed")
+        seen.update(proc_out["channels"])
+        _last["records"].update((r["sensor_numeric_id"], r) for r in proc_out["sensors"])
+        latest = {**proc_out, "channels": dict(seen),
+                  "sensors": [_last["records"][s["sensor_id"]] for s in _channels.sensors
+                              if s["sensor_id"] in _last["records"]]}
+        if errors:
+            latest["channel_errors"] = errors
+        _last.update(proc_out=latest, error=None)
+        _state["dirty"] = True
+        if on_tick is not None:
+            on_tick(proc_out)
+        if _history is not None:
+            try:
+                with metrics.stage("history"):
+                    _history.add(proc_out)
+            except Exception as e:
+                metrics.ERRORS.inc("history")
+                log.warning("History index: could not add tick: %s", e)
+        if _store is not None and (STATE_SHARED or
+                time.monotonic() - _state["saved_at"] >= STATE_SAVE_S):
+            try:
+                with metrics.stage("persist_state"):
+                    _save_state()
+            except Exception as e:
+                metrics.ERRORS.inc("persist_state")
+                log.warning("State store: could not save buffers: %s", e)
+        return fid, raw_out, proc_out, latest
+
+
+def _record_trace(trace: dict):
+    """predict_leak_rows() trace → stage histograms and counters."""
+    for stage, seconds in trace.get("seconds", {}).items():
+        metrics.STAGE_SECONDS.observe(seconds, stage)
+    for sid, rule in trace.get("triggers", ()):
+        metrics.TRIGGERS.inc(sid, rule)
+    for sid, old, new in trace.get("transitions", ()):
+        metrics.TRANSITIONS.inc(sid, old, new)
+
+
+def _process_feed_locked(feeds: dict) -> tuple:
     ts   = datetime.utcnow().isoformat()
     hour = datetime.utcnow().hour
     fid  = f"{datetime.utcnow().strftime('%Y-%m-%d_%H-%M-%S')}_{uuid.uuid4().hex}"
 
-    raw_out  = {"timestamp": ts, "channel_id": CHANNEL_ID, "sensors": {}}
-    proc_out = {"timestamp": ts, "channel_id": CHANNEL_ID, "sensors": []}
+    eids = {cid: f.get("entry_id") for cid, f in feeds.items()}
+    eid  = next(iter(eids.values())) if len(_channels.channels) == 1 else None
 
-    # 2. Per-sensor processing ────────────────────────────────────
+    head     = {"timestamp": ts, "channel_id": CHANNEL_ID, "entry_id": eid, "channels": eids}
+    raw_out  = {**head, "sensors": {}}
+    proc_out = {**head, "sensors": []}
+
+    # 2. Read & calibrate every sensor of the fresh channels ──────
     try:
-        for s in SENSOR_CONFIG:
-            sid = s["sensor_id"]
+        with metrics.stage("calibrate"):
+            chans = [ch for ch in _channels.channels if ch.channel_id in feeds]
+            sids  = [s["sensor_id"] for ch in chans for s in ch.sensors]
+            pressures, flows = calibrate(
+                [feeds[ch.channel_id].get(s["pressure_field"]) for ch in chans for s in ch.sensors],
+                [feeds[ch.channel_id].get(s["flow_field"])     for ch in chans for s in ch.sensors],
+                np.concatenate([ch.pressure_factor for ch in chans]),
+                np.concatenate([ch.flow_factor     for ch in chans]))
+            readings = list(zip(sids, pressures.tolist(), flows.tolist()))
+
+            # Store raw
+            raw_out["sensors"] = {
+                f"sensor_{sid}": {"pressure_bar": p, "flow_lpm": f}
+                for sid, p, f in zip(sids, np.round(pressures, 3).tolist(),
+                                     np.round(flows, 2).tolist())}
+
+        # Predict all sensors in one model call
+        # (rolling buffers updated inside predict_leak_batch / the shards)
+        trace   = {}
+        score   = _shards.predict_batch if _shards is not None else predict_leak_batch
+        results = score(
+            [(sid, p, f / 60.0) for sid, p, f in readings], hour=hour, trace=trace)
+        _record_trace(trace)
+
+        # 3. Per-sensor prescription ─────────────────────────────────
+        with metrics.stage("prescribe"):
+            for (sid, pressure, flow_lpm), result in zip(readings, results):
+                t0 = time.perf_counter()
+                proc_out["sensors"].append(sensor_record(sid, pressure, flow_lpm, result))
+                metrics.SENSOR_SECONDS.observe(time.perf_counter() - t0, sid, "prescribe")
+
+        # 4. Cross-sensor features + leak localisation ───────────────
+        if _network is not None:
+            with metrics.stage("network"):
+                sids, pressures, flows = zip(*readings) if readings else ((), (), ())
+                proc_out["network"] = _network.step(
+                    sids, pressures, flows, [r.get("leak", 0) for r in results])
 
-            # Read & calibrate
-            p_raw = max(_float(feed.get(s["pressure_field"]),
-                                FIELD_PRESSURE_BAR / PRESSURE_FACTOR), 0.0)
-            f_raw = max(_float(feed.get(s["flow_field"]),
-                                FIELD_FLOW_LPM / FLOW_FACTOR), 0.0)
+    except Exception as e:
+        metrics.ERRORS.inc("predict")
+        return fid, None, {"error": f"Prediction error: {e}"}
 
-            flow_lpm = min(f_raw * FLOW_FACTOR,     FLOW_MAX_LPM)
-            pressure = min(p_raw * PRESSURE_FACTOR, PRESSURE_MAX_BAR)
-            flow_lps = flow_lpm / 60.0
+    return fid, raw_out, proc_out
 
-            # Store raw
-            raw_out["sensors"][f"sensor_{sid}"] = {
-                "pressure_bar": round(pressure, 3),
-                "flow_lpm":     round(flow_lpm, 2),
-            }
-
-            # Predict (rolling buffer updated inside predict_leak)
-            result = predict_leak(pressure, flow_lps,
-                                  sensor_id=sid, hour=hour)
-
-            leak_lps  = _float(result.get("Leak_Magnitude_LPS"), 0.0)
-            leak_lpm  = _float(result.get("Leak_Magnitude_LPM"), leak_lps*60)
-            leak_area = _float(result.get("Leak_Area_mm2"),       0.0)
-            leak_dia  = _float(result.get("Leak_Diameter_mm"),    0.0)
-            prob      = _float(result.get("prob"),                 0.0)
-
-            # Prescription
-            prescription = {
-                "severity": "Normal", "action_type": "No action required",
-                "failure_type": "", "repair_strategy": "",
-            }
-            size_ratio = 0.0
-
-            if result.get("leak") == 1:
-                size_ratio = (leak_area / PIPE_AREA) if PIPE_AREA > 0 else 0.0
-                pres = _clean(get_prescription(size_ratio, leak_lps))
-                prescription = {
-                    "severity":        pres.get("severity",        "N/A"),
-                    "action_type":     pres.get("action_type",     "N/A"),
-                    "failure_type":    pres.get("failure_type",    "N/A"),
-                    "repair_strategy": pres.get("repair_strategy", "N/A"),
-                }
-
-            meta = SENSOR_META.get(sid, {})
-            proc_out["sensors"].append(_clean({
-                "sensor_numeric_id":  sid,
-                "pressure_sensor_id": meta.get("pressure_sensor_id"),
-                "flow_sensor_id":     meta.get("flow_sensor_id"),
-                "pipe_id":            meta.get("pipe_id"),
-
-                "pressure":           round(pressure, 3),   # bar
-                "flow_lpm":           round(flow_lpm, 2),   # lpm
-
-                "leak":               int(result.get("leak", 0)),
-                "probability":        round(prob, 4),
-                "physics_fired":      bool(result.get("physics_fired", False)),
-                "p_drop_pct":         round(_float(result.get("p_drop_pct"), 0.0), 4),
-
-                "leak_lpm":           round(leak_lpm, 2),
-                "leak_area_mm2":      leak_area,
-                "leak_diameter_mm":   leak_dia,
-                "leak_size_ratio":    round(size_ratio, 5),
-                "alert_state": result.get("alert_state", "normal"),
-
-                "prescription":       prescription,
-            }))
 
+def _flush_snapshots() -> list:
+    with metrics.stage("persist_snapshots"):
+        return _snapshots.flush()
+
+
+def run_digital_twin() -> dict:
+    """Blocking fetch → predict → prescribe → persist (WebJob path)."""
+    with metrics.stage("tick"):
+        return _run_digital_twin()
+
+
+def _fetch_error(feeds: dict, errors: dict):
+    """Count failed channels; the tick's {"error": ...} if none delivered."""
+    if not errors:
+        return None
+    metrics.ERRORS.inc("fetch", amount=len(errors))
+    detail = "; ".join(f"channel {cid}: {msg}" for cid, msg in errors.items())
+    if not feeds:
+        return {"error": f"ThingSpeak: {detail}"}
+    log.warning("ThingSpeak: %d of %d channels missed this tick: %s",
+                len(errors), len(_channels.channels), detail)
+    return None
+
+
+def _run_digital_twin() -> dict:
+    _restore_once()
+
+    # 1. Fetch every channel from ThingSpeak (concurrently) ────────
+    with metrics.stage("fetch"):
+        feeds, errors = _channels.fetch(_http)
+    failed = _fetch_error(feeds, errors)
+    if failed:
+        return failed
+
+    # 2–3. Predict + prescribe (skip already-ingested entries) ─────
+    tick = _process_feeds(feeds, errors)
+    if tick is None:
+        return _last["proc_out"]
+    fid, raw_out, proc_out, latest = tick
+    if raw_out is None:
+        return proc_out
+
+    # 4. Persist to Azure Blob ─────────────────────────────────────
+    try:
+        if _store is not None and _state["dirty"]:
+            with metrics.stage("persist_state"):
+                _locked_save_state()    # one-shot process: keep the window
+        if _snapshots is not None:
+            _resume_snapshots()
+            _snapshots.add(proc_out)
+            _flush_snapshots()          # one-shot process: nothing to batch
+        else:
+            _save_blob(_raw_ctr,  f"{fid}_raw.json",       raw_out)
+            _save_blob(_proc_ctr, f"{fid}_processed.json", proc_out)
+        _save_blob(_proc_ctr, "latest.json",            latest)     # live feed
     except Exception as e:
-        return {"error": f"Prediction error: {e}"}
+        metrics.ERRORS.inc("persist")
+        return {"error": f"Blob Storage: {e}"}
+
+    return latest
+
 
-    # 3. Persist to Azure Blob ─────────────────────────────────────
+# ══════════════════════════════════════════════════════════════════
+# ASYNC PIPELINE (/live)
+# ══════════════════════════════════════════════════════════════════
+# Created on first use inside the running loop, closed by the lifespan.
+_aio: dict = {}
+_pending: set = set()       # background blob writes in flight
+
+
+def _aio_clients() -> tuple:
+    if not _aio:
+        _aio["http"] = aiohttp.ClientSession(
+            timeout=aiohttp.ClientTimeout(total=THINGSPEAK_TIMEOUT))
+        _aio["blob"] = AsyncBlobServiceClient.from_connection_string(AZURE_CONN)
+    return _aio["http"], _aio["blob"]
+
+
+async def _close_aio_clients():
+    if _pending:
+        await asyncio.gather(*_pending, return_exceptions=True)
+    if _aio:
+        await _aio.pop("http").close()
+        await _aio.pop("blob").close()
+
+
+async def _save_blob_async(blob_svc, container: str, name: str, data: dict):
+    body = json.dumps(data, indent=2)
+    with metrics.stage(_blob_stage(name)):
+        await blob_svc.get_blob_client(container, name).upload_blob(body, overwrite=True)
+
+
+def _in_background(coro, what: str):
+    task = asyncio.create_task(coro)
+    _pending.add(task)
+
+    def _done(t):
+        _pending.discard(t)
+        if not t.cancelled() and t.exception() is not None:
+            metrics.ERRORS.inc("persist")
+            log.warning("Blob Storage (%s): %s", what, t.exception())
+    task.add_done_callback(_done)
+
+
+def _publish_stream(proc_out: dict):
+    with metrics.stage("stream"):
+        _hub.publish(proc_out)
+
+
+async def run_digital_twin_async(inline: bool = False) -> dict:
+    """
+    Non-blocking fetch → predict → prescribe → persist.
+
+    inline=True runs predict on the event loop thread instead of a
+    worker thread (profiled requests: the profiler only sees one thread).
+    """
+    with metrics.stage("tick"):
+        return await _run_digital_twin_async(inline)
+
+
+async def _run_digital_twin_async(inline: bool) -> dict:
+    http, blob_svc = _aio_clients()
+
+    if not _proc_ctr.ready:             # lazy start: ensure containers once
+        await asyncio.to_thread(_warm_up)
+    if _store is not None and not _state["restored"]:
+        await asyncio.to_thread(_restore_once)
+
+    # 1. Fetch every channel (pooled keep-alive connections) ───────
+    with metrics.stage("fetch"):
+        feeds, errors = await _channels.fetch_async(http)
+    failed = _fetch_error(feeds, errors)
+    if failed:
+        return failed
+
+    # 2–3. Predict + prescribe off the event loop; /stream deltas are
+    #      queued onto the loop in tick-lock order (a scheduled tick and
+    #      an on-demand /live may overlap)
+    loop = asyncio.get_running_loop()
+
+    def publish(doc):
+        loop.call_soon_threadsafe(_publish_stream, doc)
+
+    tick = (_process_feeds(feeds, errors, publish) if inline
+            else await asyncio.to_thread(_process_feeds, feeds, errors, publish))
+    if tick is None:
+        return _last["proc_out"]
+    fid, raw_out, proc_out, latest = tick
+    if raw_out is None:
+        return proc_out
+
+    # 4. Persist: history in the background, wait for latest ──────
+    if _snapshots is not None:
+        _snapshots.add(proc_out)
+        if _snapshots.due():
+            _in_background(asyncio.to_thread(_flush_snapshots), "snapshots")
+    else:
+        _in_background(_save_blob_async(blob_svc, RAW_CONTAINER,
+                                        f"{fid}_raw.json", raw_out), "raw")
+        _in_background(_save_blob_async(blob_svc, PROCESSED_CONTAINER,
+                                        f"{fid}_processed.json", proc_out), "processed")
     try:
-        _save_blob(_raw_ctr,  f"{fid}_raw.json",       raw_out)
-        _save_blob(_proc_ctr, f"{fid}_processed.json", proc_out)
-        _save_blob(_proc_ctr, "latest.json",            proc_out)   # live feed
+        await _save_blob_async(blob_svc, PROCESSED_CONTAINER,
+                               "latest.json", latest)               # live feed
     except Exception as e:
+        metrics.ERRORS.inc("persist")
         return {"error": f"Blob Storage: {e}"}
 
-    return proc_out
+    return latest
 
 
 # ══════════════════════════════════════════════════════════════════
 # API ROUTES
 # ══════════════════════════════════════════════════════════════════
+_ingest_running = asyncio.Lock()   # held while a scheduled tick runs
+
+
+async def _ingest_job():
+    """One scheduled tick; errors are kept for /live, never raised."""
+    async with _ingest_running:
+        result = await run_digital_twin_async()
+    if "error" in result:
+        _last["error"] = result
+        log.warning("Ingestion: %s", result["error"])
+
+
+@asynccontextmanager
+async def _lifespan(app: FastAPI):
+    if STARTUP_MODE != "lazy":
+        with metrics.stage("startup"):
+            await asyncio.to_thread(_warm_up)
+    scheduler = None
+    if INGEST_SCHEDULER:
+        scheduler = AsyncIOScheduler()
+        scheduler.add_job(_ingest_job, "interval", seconds=INGEST_INTERVAL_S,
+                          max_instances=1, coalesce=True,
+                          next_run_time=datetime.now())
+        scheduler.start()
+    yield
+    if scheduler is not None:
+        scheduler.pause()
+        async with _ingest_running:     # let an in-flight tick finish
+            scheduler.shutdown(wait=False)
+    await _close_aio_clients()
+    _channels.close()
+    if _store is not None and _state["dirty"]:
+        try:
+            await asyncio.to_thread(_locked_save_state)
+        except Exception as e:
+            log.warning("State store: could not save buffers: %s", e)
+    if _snapshots is not None:
+        try:
+            await asyncio.to_thread(_flush_snapshots)
+        except Exception as e:
+            log.warning("Blob Storage (snapshots): %s", e)
+    if _shards is not None:
+        await asyncio.to_thread(_shards.close)
+
+
+app = FastAPI(title="Predictive Digital Twin — Leak Detection API",
+              lifespan=_lifespan)
+
+
 @app.get("/")
 def home():
     return {
         "status":                    "Digital Twin API running",
         "model":                     "Extra Trees (CalibratedClassifierCV)",
-        "model_version":             "7.0-clean",
+        "model_version":             _shard_model_version or predict.model_version(),
         "pipe_diameter_mm":          25,
         "field_normal_pressure_bar": FIELD_PRESSURE_BAR,
         "field_normal_flow_lpm":     FIELD_FLOW_LPM,
@@ -224,7 +735,177 @@ def home():
     }
 
 
+# cProfile hooks the event loop thread, which every request shares:
+# one profiled request at a time, or they replace each other's profiler
+_profiling = asyncio.Lock()
+
+
+@app.middleware("http")
+async def _profile_request(request: Request, call_next):
+    """X-Profile: <PROFILE_TOKEN> → profiler report instead of the body."""
+    token = request.headers.get("x-profile")
+    if (not PROFILE_TOKEN or token is None
+            or not hmac.compare_digest(token.encode(), PROFILE_TOKEN.encode())):
+        return await call_next(request)         # a wrong token gets the normal body
+    if _profiling.locked():
+        return PlainTextResponse("Another profiled request is running; retry.\n",
+                                 status_code=409)
+
+    request.state.profile = True
+    async with _profiling:
+        with metrics.Profile(PROFILER) as prof:
+            response = await call_next(request)
+    head = (f"{request.method} {request.url.path} → {response.status_code} "
+            f"in {prof.seconds * 1000:.1f} ms ({prof.kind})\n\n")
+    return PlainTextResponse(head + prof.text(),
+                             headers={"X-Profile-Status": str(response.status_code)})
+
+
+@app.get("/stream")
+async def stream():
+    """Server-Sent Events feed of the twin state (see stream.py)."""
+    return StreamingResponse(_hub.subscribe(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache",
+                                      "X-Accel-Buffering": "no"})
+
+
+@app.get("/metrics")
+def prometheus_metrics():
+    return PlainTextResponse(metrics.render(),
+                             media_type="text/plain; version=0.0.4")
+
+
 @app.get("/live")
-def live():
-    """Fetch ThingSpeak → predict → prescribe → persist → return."""
-    return run_digital_twin()
+async def live(request: Request):
+    """Most recent ingested result (no I/O when the scheduler is on)."""
+    if getattr(request.state, "profile", False):
+        return await run_digital_twin_async(inline=True)
+    if not INGEST_SCHEDULER:
+        return await run_digital_twin_async()
+    if _last["proc_out"] is not None:
+        return _last["proc_out"]
+    return _last["error"] or {"error": "No reading ingested yet"}
+
+
+def _history_range(start, end) -> tuple:
+    end = end or datetime.utcnow().isoformat()
+    return start or history.iso(history.to_ms(end) - HISTORY_DEFAULT_DAYS * 86_400_000), end
+
+
+@app.get("/history")
+def history_series(pipe_id: str = None, sensor_id: int = None, start: str = None,
+            end: str = None, bucket_s: float = None, points: int = 500,
+            alert_state: str = None):
+    """
+    Downsampled series from the history index (default: last 7 days,
+    about 500 buckets, the whole fleet unless pipe_id / sensor_id).
+    """
+    if _history is None:
+        return {"error": "History index is off (set HISTORY_DB)"}
+    try:
+        start, end = _history_range(start, end)
+        return _history.series(start, end, pipe_id=pipe_id, sensor_id=sensor_id,
+                               alert_state=alert_state, bucket_s=bucket_s, points=points)
+    except ValueError as e:
+        return {"error": f"History: {e}"}
+
+
+@app.get("/events")
+def history_events(pipe_id: str = None, sensor_id: int = None, start: str = None,
+           end: str = None, open_only: bool = False, limit: int = 500):
+    """Latch episodes overlapping the range (default: last 7 days), newest first."""
+    if _history is None:
+        return {"error": "History index is off (set HISTORY_DB)"}
+    try:
+        start, end = _history_range(start, end)
+        return {"start": start, "end": end,
+                "events": _history.events(start, end, pipe_id=pipe_id, sensor_id=sensor_id,
+                                          open_only=open_only, limit=limit)}
+    except ValueError as e:
+        return {"error": f"History: {e}"}
+
+
+@app.post("/backfill")
+async def backfill(source: str = "thingspeak", start: str = None, end: str = None,
+                   limit: int = None, prefix: str = ""):
+    """
+    Re-score history with the current model and write one result blob.
+
+    source = 'thingspeak' (start/end/limit, every channel of the
+    registry), 'raw' (raw blob name prefix, e.g. '2026-09') or
+    'snapshots' (start/end).
+    Output: {PROCESSED_CONTAINER}/backfill/{run}.csv
+    """
+    def _run():
+        t0 = time.perf_counter()
+        if source == "raw":
+            frames = [replay.load_raw_container(_raw_ctr, prefix, _channels.sensors)]
+        elif source == "snapshots":
+            frames = [replay.load_snapshots(_proc_ctr, start, end, _channels.sensors)]
+        else:
+            frames = replay.fetch_channels(_channels, start=start, end=end,
+                                           limit=limit, session=_http)
+        df   = replay.replay_frames(frames)
+        name = f"backfill/{datetime.utcnow().strftime('%Y-%m-%d_%H-%M-%S')}_{source}.csv"
+        _proc_ctr.get_blob_client(name).upload_blob(replay.to_bytes(df, "csv"),
+                                                    overwrite=True)
+        return {**replay.summarize(df, time.perf_counter() - t0), "blob": name}
+
+    if source not in ("thingspeak", "raw", "snapshots"):
+        return {"error": f"Unknown backfill source: {source}"}
+    if source == "snapshots" and not (start and end):
+        return {"error": "Backfill: snapshots needs start and end"}
+    try:
+        return await asyncio.to_thread(_run)
+    except Exception as e:
+        return {"error": f"Backfill: {e}"}
+
+
+# ── Model registry ────────────────────────────────────────────────
+_shard_model_version: str = None    # live version the shards last reported
+
+
+def _models_call(method: str, *args) -> dict:
+    """ModelRegistry operation here, or in every shard (report of shard 0 + all)."""
+    global _shard_model_version
+    if _shards is not None:
+        reports = _shards.models(method, *args)
+        _shard_model_version = reports[0]["live"]["version"]
+        return {**reports[0], "shards": reports}
+    getattr(predict._models, method)(*args)
+    report = predict._models.report()
+    if report["live"] is None:
+        report["live"] = {"version": predict.model_version(), "loaded": False}
+    return report
+
+
+@app.get("/models")
+def models_report():
+    """Live and shadow model: version, latency, shadow disagreement rate."""
+    return _models_call("report")
+
+
+@app.post("/models/shadow")
+def models_shadow(name: str):
+    """Load MODEL_DIR/<name> (a .pkl bundle) as the shadow model, in the background."""
+    path = os.path.join(MODEL_DIR, name)
+    if os.path.basename(name) != name or not name.endswith(".pkl") or not os.path.isfile(path):
+        return {"error": f"Models: no bundle {name!r} in MODEL_DIR"}
+    try:
+        return _models_call("load_async", path, "shadow")
+    except Exception as e:
+        return {"error": f"Models: {e}"}
+
+
+@app.post("/models/promote")
+def models_promote():
+    """Make the shadow model live (buffers and latch state are kept)."""
+    try:
+        return _models_call("promote")
+    except Exception as e:
+        return {"error": f"Models: {e}"}
+
+
+@app.delete("/models/shadow")
+def models_drop_shadow():
+    return _models_call("drop_shadow")
@@ -0,0 +1,178 @@
+"""
+metrics.py  —  Stage timers, counters and on-demand profiling
+─────────────────────────────────────────────────────────────────────
+Stdlib-only latency histograms and counters, rendered in the
+Prometheus text exposition format (0.0.4) by /metrics.  Values are per
+process: with several workers, each one reports its own series.
+
+  twin_stage_seconds{stage}                  one observation per tick
+  twin_sensor_stage_seconds{sensor,stage}    per-sensor work inside a tick
+  twin_leak_triggers_total{sensor,rule}      raw triggers: physics | ml
+  twin_latch_transitions_total{sensor,from,to}
+  twin_ticks_total{result}                   processed | duplicate | error
+  twin_errors_total{stage}                   fetch | predict | persist …
+  twin_model_seconds{model,role}             predict_proba latency, live | shadow
+  twin_shadow_disagreements_total{model}     rows whose ML trigger differs from live
+
+Profile is a per-request profiling session (cProfile, or pyinstrument
+when installed) used by the X-Profile header hook in main.py.
+"""
+
+import bisect, cProfile, io, logging, pstats, threading, time
+from contextlib import contextmanager
+
+log = logging.getLogger(__name__)
+
+# 100 µs … 10 s: covers a cached /live and a slow Blob upload alike
+BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025,
+           0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_REGISTRY: list = []
+
+
+def _labels(names: tuple, values: tuple, extra: str = "") -> str:
+    parts = [f'{n}="{str(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class Counter:
+    def __init__(self, name: str, doc: str, labels: tuple = ()):
+        self.name, self.doc, self.labels = name, doc, labels
+        self._values: dict = {}
+        self._lock = threading.Lock()
+        _REGISTRY.append(self)
+
+    def inc(self, *label_values, amount: float = 1.0):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0.0) + amount
+
+    def value(self, *label_values) -> float:
+        return self._values.get(label_values, 0.0)
+
+    def render(self) -> list[str]:
+        out = [f"# HELP {self.name} {self.doc}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            items = sorted(self._values.items())
+        out += [f"{self.name}{_labels(self.labels, k)} {v:g}" for k, v in items]
+        return out
+
+
+class Histogram:
+    def __init__(self, name: str, doc: str, labels: tuple = (),
+                 buckets: tuple = BUCKETS):
+        self.name, self.doc, self.labels = name, doc, labels
+        self.buckets = tuple(buckets)
+        self._series: dict = {}     # label values → [bucket counts…, +Inf], sum
+        self._lock = threading.Lock()
+        _REGISTRY.append(self)
+
+    def observe(self, seconds: float, *label_values):
+        i = bisect.bisect_left(self.buckets, seconds)
+        with self._lock:
+            s = self._series.get(label_values)
+            if s is None:
+                s = self._series[label_values] = [[0] * (len(self.buckets) + 1), 0.0]
+            s[0][i] += 1
+            s[1] += seconds
+
+    @contextmanager
+    def time(self, *label_values):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - t0, *label_values)
+
+    def count(self, *label_values) -> int:
+        s = self._series.get(label_values)
+        return sum(s[0]) if s else 0
+
+    def render(self) -> list[str]:
+        out = [f"# HELP {self.name} {self.doc}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = sorted((k, (list(c), total)) for k, (c, total) in self._series.items())
+        for key, (counts, total) in items:
+            cum = 0
+            for le, c in zip(self.buckets + (float("inf"),), counts):
+                cum += c
+                le = "+Inf" if le == float("inf") else f"{le:g}"
+                lbl = _labels(self.labels, key, 'le="%s"' % le)
+                out.append(f"{self.name}_bucket{lbl} {cum}")
+            out.append(f"{self.name}_sum{_labels(self.labels, key)} {total:.9g}")
+            out.append(f"{self.name}_count{_labels(self.labels, key)} {cum}")
+        return out
+
+
+def render() -> str:
+    """Every registered metric, Prometheus text format."""
+    return "\n".join(line for m in _REGISTRY for line in m.render()) + "\n"
+
+
+# ══════════════════════════════════════════════════════════════════
+# DIGITAL TWIN METRICS
+# ══════════════════════════════════════════════════════════════════
+STAGE_SECONDS  = Histogram("twin_stage_seconds",
+                           "Ingestion stage latency per tick", ("stage",))
+SENSOR_SECONDS = Histogram("twin_sensor_stage_seconds",
+                           "Per-sensor stage latency", ("sensor", "stage"))
+TRIGGERS       = Counter("twin_leak_triggers_total",
+                         "Raw leak triggers before the latch, by rule", ("sensor", "rule"))
+TRANSITIONS    = Counter("twin_latch_transitions_total",
+                         "Alert state machine transitions", ("sensor", "from", "to"))
+TICKS          = Counter("twin_ticks_total", "Ingestion ticks by outcome", ("result",))
+ERRORS         = Counter("twin_errors_total", "Pipeline errors by stage", ("stage",))
+MODEL_SECONDS  = Histogram("twin_model_seconds",
+                           "predict_proba latency per batch, by model", ("model", "role"))
+SHADOW_DISAGREE = Counter("twin_shadow_disagreements_total",
+                          "Rows where the shadow model's ML trigger differs from live",
+                          ("model",))
+
+
+def stage(name: str):
+    """with stage("fetch"): … → one twin_stage_seconds observation."""
+    return STAGE_SECONDS.time(name)
+
+
+# ══════════════════════════════════════════════════════════════════
+# PER-REQUEST PROFILING
+# ══════════════════════════════════════════════════════════════════
+class Profile:
+    """
+    Profiling session around one request.
+
+    kind = 'cprofile' (stdlib, default) or 'pyinstrument' (falls back
+    to cProfile when pyinstrument is not installed).  text() returns
+    the report once the block has exited.
+    """
+
+    def __init__(self, kind: str = "cprofile", limit: int = 40):
+        self.kind, self.limit = kind, limit
+        self._prof = None
+        if kind == "pyinstrument":
+            try:
+                from pyinstrument import Profiler
+                self._prof = Profiler(async_mode="enabled")
+            except ImportError:
+                log.warning("pyinstrument not installed; profiling with cProfile")
+                self.kind = "cprofile"
+        if self._prof is None:
+            self._prof = cProfile.Profile()
+
+    def __enter__(self):
+        self._t0 = time.perf_counter()
+        (self._prof.start if self.kind == "pyinstrument" else self._prof.enable)()
+        return self
+
+    def __exit__(self, *exc):
+        (self._prof.stop if self.kind == "pyinstrument" else self._prof.disable)()
+        self.seconds = time.perf_counter() - self._t0
+        return False
+
+    def text(self) -> str:
+        if self.kind == "pyinstrument":
+            return self._prof.output_text(unicode=True)
+        buf = io.StringIO()
+        pstats.Stats(self._prof, stream=buf).sort_stats("cumulative").print_stats(self.limit)
+        return buf.getvalue()
@@ -0,0 +1,268 @@
+"""
+models.py  —  Model registry: background loads, atomic swap, shadow
+─────────────────────────────────────────────────────────────────────
+The live estimator used to be a module global loaded once, so a
+retrained bundle meant a restart (and, without a state store, lost
+buffers).  A ModelRegistry holds the live Model and an optional shadow:
+
+  - load_async(path, role) loads a bundle (joblib + CompiledForest for
+    INFERENCE_ENGINE=compiled) on a background thread; ticks keep
+    scoring with the current models while it loads
+  - the live / shadow pair is swapped as one tuple assignment, so a
+    batch is scored by one consistent pair and nothing waits on a lock
+  - a shadow scores the same feature matrix on a background worker
+    thread, so the tick waits only for the live model; its
+    probabilities never reach the latch, only the report.  At most
+    shadow_backlog batches wait for the worker: beyond that a batch
+    is not shadow-scored (counted as "dropped") rather than queued
+  - promote() makes the shadow live
+
+A candidate must share the live bundle's features, field normals,
+physics rule and rolling windows: those define the buffered state and
+the feature vector, so only the estimator and its threshold may change.
+
+Per model (version + role): batches, rows and predict_proba latency;
+for a shadow also the disagreement rate, i.e. the share of rows whose
+ML trigger (prob >= threshold) differs from the live model's, the
+mean |Δprob| and the batches dropped by a full backlog.  Latency also goes to /metrics (twin_model_seconds).
+"""
+
+import json, logging, os, threading, time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from . import metrics
+
+log = logging.getLogger(__name__)
+
+ROLES = ("live", "shadow")
+
+# bundle entries that must not change across a swap
+COMPATIBLE_KEYS = ("features", "field_normals", "physics_rule", "rolling_windows")
+
+
+def bundle_meta(bundle: dict) -> dict:
+    """Every bundle entry except the estimator, as plain JSON values."""
+    return json.loads(json.dumps({k: v for k, v in bundle.items() if k != "model"}))
+
+
+def load_bundle(path: str) -> dict:
+    import joblib
+    return joblib.load(path)
+
+
+# ══════════════════════════════════════════════════════════════════
+# ONE LOADED BUNDLE
+# ══════════════════════════════════════════════════════════════════
+class Model:
+    """Estimator (+ compiled forest), decision threshold and bundle metadata."""
+
+    def __init__(self, bundle: dict, path: str = "", engine: str = "sklearn"):
+        self.meta      = bundle_meta(bundle)
+        self.version   = str(self.meta.get("version", "unknown"))
+        self.threshold = float(self.meta["threshold"])
+        self.features  = list(self.meta["features"])
+        self.path      = path
+        self.estimator = bundle["model"]
+        self.compiled  = None
+        self.engine    = "sklearn"
+        self.loaded_at = time.time()
+        if engine == "compiled":
+            from .forest import CompiledForest
+            try:
+                self.compiled, self.engine = CompiledForest(self.estimator), "compiled"
+            except ValueError as e:
+                log.warning("INFERENCE_ENGINE=compiled unavailable for %s (%s); using sklearn",
+                            self.version, e)
+
+    @classmethod
+    def from_path(cls, path: str, engine: str = "sklearn") -> "Model":
+        return cls(load_bundle(path), path, engine)
+
+    def predict_proba(self, X: np.ndarray) -> np.ndarray:
+        """P(leak) for each row of an (n × F) feature matrix."""
+        if self.compiled is not None and np.isfinite(X).all():
+            return self.compiled.predict_proba(X)[:, 1]
+        return self.estimator.predict_proba(pd.DataFrame(X, columns=self.features))[:, 1]
+
+    def incompatible(self, reference: dict) -> list[str]:
+        """Bundle keys that differ from the reference metadata."""
+        return [k for k in COMPATIBLE_KEYS if self.meta.get(k) != reference.get(k)]
+
+    def info(self) -> dict:
+        return {"version": self.version, "path": os.path.basename(self.path),
+                "threshold": self.threshold, "engine": self.engine,
+                "loaded_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(self.loaded_at))}
+
+
+# ══════════════════════════════════════════════════════════════════
+# REGISTRY
+# ══════════════════════════════════════════════════════════════════
+class ModelRegistry:
+    """
+    Live + shadow models.  predict_proba() is lock-free (reads the pair
+    once); loads, swaps and the statistics take short locks.  Shadow
+    batches go to one worker thread, started on first use.
+    """
+
+    def __init__(self, reference: dict, engine: str = "sklearn", shadow_backlog: int = 4):
+        self.reference = reference
+        self.engine    = engine
+        self.shadow_backlog = shadow_backlog
+        self._pair     = (None, None)           # (live, shadow), swapped whole
+        self._swap     = threading.Lock()
+        self._stats: dict = {}                  # (version, role) → counters
+        self._stats_lock  = threading.Lock()
+        self._shadow_pool = None                # ThreadPoolExecutor(1)
+        self._shadow_busy = 0                   # batches submitted, not yet scored
+        self.loading: dict = None               # {"path", "role", "error"?}
+
+    @property
+    def live(self) -> Model:
+        return self._pair[0]
+
+    @property
+    def shadow(self) -> Model:
+        return self._pair[1]
+
+    # ── loading and swapping ─────────────────────────────────────
+    def install(self, model: Model, role: str = "live") -> Model:
+        """Swap a loaded model in (checked against the reference)."""
+        if role not in ROLES:
+            raise ValueError(f"role must be one of {ROLES}")
+        bad = model.incompatible(self.reference)
+        if bad:
+            raise ValueError(f"{model.version}: bundle differs from the live one in {bad}")
+        with self._swap:
+            live, shadow = self._pair
+            self._pair = (model, shadow) if role == "live" else (live, model)
+        log.info("Model %s installed as %s (%s)", model.version, role, model.engine)
+        return model
+
+    def load(self, path: str, role: str = "live") -> Model:
+        """Load a bundle from path and install it (blocking)."""
+        return self.install(Model.from_path(path, self.engine), role)
+
+    def load_async(self, path: str, role: str = "shadow") -> threading.Thread:
+        """load() on a background thread; progress in self.loading."""
+        if role not in ROLES:
+            raise ValueError(f"role must be one of {ROLES}")
+        status = {"path": os.path.basename(path), "role": role,
+                  "started": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())}
+
+        def _run():
+            try:
+                self.load(path, role)
+                self.loading = None
+            except Exception as e:
+                log.warning("Model load %s failed: %s", path, e)
+                self.loading = {**status, "error": str(e)}
+
+        self.loading = status
+        thread = threading.Thread(target=_run, name="model-load", daemon=True)
+        thread.start()
+        return thread
+
+    def promote(self) -> Model:
+        """Make the shadow the live model (the old live one is dropped)."""
+        with self._swap:
+            live, shadow = self._pair
+            if shadow is None:
+                raise ValueError("no shadow model to promote")
+            self._pair = (shadow, None)
+        log.info("Model %s promoted (was %s)", shadow.version,
+                 live.version if live else None)
+        return shadow
+
+    def drop_shadow(self):
+        with self._swap:
+            self._pair = (self._pair[0], None)
+
+    # ── scoring ──────────────────────────────────────────────────
+    def predict_proba(self, X: np.ndarray) -> tuple:
+        """(live P(leak), live threshold); X is handed to the shadow worker."""
+        live, shadow = self._pair
+        t0    = time.perf_counter()
+        probs = live.predict_proba(X)
+        self._observe(live, "live", time.perf_counter() - t0, len(X))
+        if shadow is not None:
+            self._submit_shadow(live, shadow, X, probs)
+        return probs, live.threshold
+
+    def _submit_shadow(self, live: Model, shadow: Model, X: np.ndarray, probs: np.ndarray):
+        with self._stats_lock:
+            if self._shadow_busy >= self.shadow_backlog:
+                self._counters((shadow.version, "shadow"))["dropped"] += 1
+                return
+            self._shadow_busy += 1
+            if self._shadow_pool is None:
+                self._shadow_pool = ThreadPoolExecutor(1, thread_name_prefix="model-shadow")
+        self._shadow_pool.submit(self._score_shadow, live, shadow, X, probs)
+
+    def _score_shadow(self, live: Model, shadow: Model, X: np.ndarray, probs: np.ndarray):
+        t0 = time.perf_counter()
+        try:
+            other = shadow.predict_proba(X)
+        except Exception as e:
+            metrics.ERRORS.inc("shadow")
+            log.warning("Shadow model %s: %s", shadow.version, e)
+        else:
+            self._observe(shadow, "shadow", time.perf_counter() - t0, len(X),
+                          np.count_nonzero((probs >= live.threshold)
+                                           != (other >= shadow.threshold)),
+                          float(np.abs(other - probs).sum()))
+        finally:
+            with self._stats_lock:
+                self._shadow_busy -= 1
+
+    def drain(self, timeout: float = None):
+        """Wait until every submitted shadow batch has been scored."""
+        pool = self._shadow_pool
+        if pool is not None:
+            pool.submit(lambda: None).result(timeout)   # one worker: FIFO
+
+    def _counters(self, key: tuple) -> dict:
+        s = self._stats.get(key)
+        if s is None:
+            s = self._stats[key] = {"batches": 0, "rows": 0, "seconds": 0.0, "max_seconds": 0.0,
+                                    "disagree": 0, "abs_diff": 0.0, "dropped": 0}
+        return s
+
+    def _observe(self, model: Model, role: str, seconds: float, rows: int,
+                 disagree: int = 0, abs_diff: float = 0.0):
+        metrics.MODEL_SECONDS.observe(seconds, model.version, role)
+        with self._stats_lock:
+            s = self._counters((model.version, role))
+            s["batches"] += 1; s["rows"] += rows; s["seconds"] += seconds
+            s["max_seconds"] = max(s["max_seconds"], seconds)
+            s["disagree"] += disagree; s["abs_diff"] += abs_diff
+        if disagree:
+            metrics.SHADOW_DISAGREE.inc(model.version, amount=disagree)
+
+    # ── report ───────────────────────────────────────────────────
+    def _entry(self, model: Model, role: str) -> dict:
+        if model is None:
+            return None
+        with self._stats_lock:
+            s = dict(self._counters((model.version, role)))
+        out = {**model.info(), "batches": s["batches"], "rows": s["rows"],
+               "mean_ms": round(1000 * s["seconds"] / s["batches"], 3) if s["batches"] else None,
+               "max_ms": round(1000 * s["max_seconds"], 3)}
+        if role == "shadow":
+            rows = s["rows"] or None
+            out["disagreement_rate"] = round(s["disagree"] / rows, 6) if rows else None
+            out["mean_abs_prob_diff"] = round(s["abs_diff"] / rows, 6) if rows else None
+            out["dropped_batches"] = s["dropped"]
+        return out
+
+    def report(self) -> dict:
+        """Live / shadow models with their latency and disagreement so far."""
+        live, shadow = self._pair
+        return {"live": self._entry(live, "live"), "shadow": self._entry(shadow, "shadow"),
+                "loading": self.loading}
+
+    def reset_stats(self):
+        with self._stats_lock:
+            self._stats.clear()
@@ -0,0 +1,220 @@
+"""
+network.py  —  Graph-aware inference over the pipe topology
+─────────────────────────────────────────────────────────────────────
+Each SensorBuffer scores one sensor in isolation.  This module adds the
+network view: nodes, pipes and sensor attachments come from a config
+file (NETWORK_CONFIG; network.example.json shows the layout), are
+compiled once into sparse matrices, and every tick computes
+cross-sensor features with a few sparse mat-vecs:
+
+  grad_residual  excess pressure drop between a sensor and its nearest
+                 metered upstream sensor, vs. its learned baseline,
+                 relative to the field normal pressure
+  flow_deficit   mass balance of the sensor's zone: its flow minus the
+                 flow of the metered pipes directly downstream, vs. the
+                 learned baseline (unmetered demand), relative to inflow
+
+A zone is the set of pipes whose nearest metered ancestor-or-self pipe
+is the sensor's pipe.  A deficit points into the sensor's own zone, a
+gradient residual at the pipes feeding the sensor, so pipe scores are
+
+  score = Z · relu(flow_deficit) + Path · relu(grad_residual)
+
+with Z (pipes × sensors) zone membership and Path the pipes between
+each sensor's pressure tap and its metered parent's, each weighted by
+its share of that path's length (length_m; equal shares when a pipe
+has none), so a residual points at pipes in proportion to how much of
+the drop they carry; the top pipe is the localisation.  Baselines are EWMAs that freeze while the
+twin reports a leak on the sensor or its parent.
+
+Pipes are oriented in the normal flow direction; where several pipes
+feed one node (meshed networks), one of them is taken as the upstream
+path.
+"""
+
+import json
+
+import numpy as np
+import scipy.sparse as sp
+
+from .config import FIELD_PRESSURE_BAR
+
+
+class PipeNetwork:
+    """Compiled topology: index maps and sparse relation matrices."""
+
+    def __init__(self, nodes: list, pipes: list, sensors: list):
+        self.node_ids = [n["id"] for n in nodes]
+        self.pipe_ids = [p["id"] for p in pipes]
+        node_ix = {n: i for i, n in enumerate(self.node_ids)}
+        pipe_ix = {p: i for i, p in enumerate(self.pipe_ids)}
+        if len(node_ix) != len(nodes) or len(pipe_ix) != len(pipes):
+            raise ValueError("duplicate node or pipe id")
+        try:
+            self.pipe_from = np.array([node_ix[p["from"]] for p in pipes], dtype=np.intp)
+            self.pipe_to   = np.array([node_ix[p["to"]]   for p in pipes], dtype=np.intp)
+            self.sensor_pipe = np.array([pipe_ix[s["pipe_id"]] for s in sensors], dtype=np.intp)
+        except KeyError as e:
+            raise ValueError(f"unknown node or pipe id: {e}") from None
+        self.length_m   = np.array([float(p.get("length_m") or 0.0) for p in pipes])
+        self.sensor_ids = [int(s["sensor_id"]) for s in sensors]
+        if len(set(self.sensor_ids)) != len(self.sensor_ids):
+            raise ValueError("duplicate sensor id")
+
+        N, P, S = len(nodes), len(pipes), len(sensors)
+
+        # sensor id → column, by binary search over the sorted ids
+        ids = np.array(self.sensor_ids, dtype=np.int64)
+        self._id_order  = np.argsort(ids, kind="stable")
+        self._id_sorted = ids[self._id_order]
+
+        # upstream pipe of every pipe (-1 at sources)
+        feed = np.full(N, -1, dtype=np.intp)
+        feed[self.pipe_to] = np.arange(P)
+        self.parent_pipe = feed[self.pipe_from]
+
+        # nearest metered ancestor-or-self, by pointer doubling
+        metered = np.zeros(P, dtype=bool)
+        metered[self.sensor_pipe] = True
+        ptr = np.where(metered, np.arange(P), self.parent_pipe)
+        for _ in range(max(P, 1).bit_length() + 1):
+            hop = (ptr >= 0) & ~metered[np.maximum(ptr, 0)]
+            if not hop.any():
+                break
+            ptr[hop] = ptr[ptr[hop]]
+        sensor_of_pipe = np.full(P, -1, dtype=np.intp)
+        sensor_of_pipe[self.sensor_pipe] = np.arange(S)
+        self.zone_of_pipe = np.where(ptr >= 0, sensor_of_pipe[np.maximum(ptr, 0)], -1)
+
+        # metered parent of every sensor (-1 = none)
+        up = self.parent_pipe[self.sensor_pipe]
+        self.parent_sensor = np.where(up >= 0, self.zone_of_pipe[np.maximum(up, 0)], -1)
+
+        has = self.parent_sensor >= 0
+        # Z: pipe k in zone of sensor j
+        inz = self.zone_of_pipe >= 0
+        self.Z = sp.csr_matrix((np.ones(inz.sum()),
+                                (np.flatnonzero(inz), self.zone_of_pipe[inz])), shape=(P, S))
+        # C: sensor c is a metered child of sensor j
+        self.C = sp.csr_matrix((np.ones(has.sum()),
+                                (self.parent_sensor[has], np.flatnonzero(has))), shape=(S, S))
+        # Path: pipes from sensor j's pipe up to (excluding) its parent's pipe,
+        # walked upwards for all sensors at once
+        rows, cols = [self.sensor_pipe], [np.arange(S)]
+        cur, who = self.parent_pipe[self.sensor_pipe], np.arange(S)
+        while True:
+            live = (cur >= 0) & has[who]
+            live[live] &= ~metered[cur[live]]
+            if not live.any():
+                break
+            rows.append(cur[live]); cols.append(who[live])
+            cur, who = self.parent_pipe[cur[live]], who[live]
+        rows, cols = np.concatenate(rows), np.concatenate(cols)
+        keep = has[cols]
+        rows, cols = rows[keep], cols[keep]
+        # weight = the pipe's share of its path's length
+        w    = self.length_m[rows] if (self.length_m > 0).all() else np.ones(rows.size)
+        tot  = np.bincount(cols, weights=w, minlength=S)
+        self.Path = sp.csr_matrix((w / tot[cols], (rows, cols)), shape=(P, S))
+
+    def columns(self, sensor_ids) -> tuple:
+        """(mask of the ids that are network sensors, their columns)."""
+        ids = np.asarray(sensor_ids, dtype=np.int64).reshape(-1)
+        if not self._id_sorted.size:
+            return np.zeros(ids.size, dtype=bool), np.empty(0, dtype=np.intp)
+        pos = np.minimum(np.searchsorted(self._id_sorted, ids), self._id_sorted.size - 1)
+        hit = self._id_sorted[pos] == ids
+        return hit, self._id_order[pos[hit]]
+
+    @property
+    def n_pipes(self) -> int:
+        return len(self.pipe_ids)
+
+    @property
+    def n_sensors(self) -> int:
+        return len(self.sensor_ids)
+
+    @classmethod
+    def from_file(cls, path: str) -> "PipeNetwork":
+        with open(path, encoding="utf-8") as fh:
+            cfg = json.load(fh)
+        return cls(cfg["nodes"], cfg["pipes"], cfg["sensors"])
+
+
+class NetworkInference:
+    """Per-tick cross-sensor features, baselines and pipe localisation."""
+
+    def __init__(self, net: PipeNetwork, alpha: float = 0.05,
+                 min_score: float = 0.05, top_k: int = 5):
+        self.net       = net
+        self.alpha     = alpha          # EWMA weight of a new normal reading
+        self.min_score = min_score      # report a suspect pipe from here on
+        self.top_k     = top_k
+        self._base_dp  = None           # S: pressure drop from parent (bar)
+        self._base_def = None           # S: zone flow deficit (lpm)
+
+    def _vector(self, hit, cols, values, fill) -> np.ndarray:
+        out = np.full(self.net.n_sensors, fill, dtype=np.float64)
+        out[cols] = np.asarray(values, dtype=np.float64).reshape(-1)[hit]
+        return out
+
+    def step(self, sensor_ids, pressure, flow_lpm, leak) -> dict:
+        """
+        One tick.  sensor_ids / pressure (bar) / flow_lpm / leak (0|1)
+        are parallel sequences; sensors not in the network are ignored
+        and network sensors missing from the tick count as unknown.
+        """
+        net = self.net
+        hit, cols = net.columns(sensor_ids)
+        p   = self._vector(hit, cols, pressure, np.nan)
+        f   = self._vector(hit, cols, flow_lpm, np.nan)
+        lk  = self._vector(hit, cols, leak, 0.0) > 0
+        par = net.parent_sensor
+        has = par >= 0
+        p[p <= 0] = np.nan; f[f <= 0] = np.nan          # invalid readings
+
+        dp  = np.where(has, p[np.maximum(par, 0)] - p, np.nan)
+        dfc = f - net.C @ np.nan_to_num(f)
+        dfc[net.C @ np.isnan(f) > 0] = np.nan           # a child is unknown
+        if self._base_dp is None:
+            self._base_dp, self._base_def = dp.copy(), dfc.copy()
+        self._base_dp  = np.where(np.isnan(self._base_dp),  dp,  self._base_dp)
+        self._base_def = np.where(np.isnan(self._base_def), dfc, self._base_def)
+
+        r_p = (dp  - self._base_dp)  / FIELD_PRESSURE_BAR
+        r_f = (dfc - self._base_def) / np.where(np.isnan(f), 1.0, np.maximum(f, 1e-6))
+
+        # learn the normal state only while neither end reports a leak
+        calm = ~lk & ~np.where(has, lk[np.maximum(par, 0)], False)
+        a    = self.alpha
+        upd  = calm & ~np.isnan(dp)
+        self._base_dp[upd]  += a * (dp[upd]  - self._base_dp[upd])
+        upd  = calm & ~np.isnan(dfc)
+        self._base_def[upd] += a * (dfc[upd] - self._base_def[upd])
+
+        rp, rf = np.nan_to_num(np.maximum(r_p, 0.0)), np.nan_to_num(np.maximum(r_f, 0.0))
+        score  = net.Z @ rf + net.Path @ rp
+
+        out = {
+            "sensors": {sid: {"grad_residual": g, "flow_deficit": d} for sid, g, d in
+                        zip(net.sensor_ids, _rounded(r_p), _rounded(r_f))},
+            "suspect_pipe": None, "score": 0.0, "candidates": [],
+        }
+        if score.size and (lk.any() or score.max() >= self.min_score):
+            k   = min(self.top_k, score.size)
+            top = np.argpartition(-score, k - 1)[:k]
+            top = top[np.argsort(-score[top], kind="stable")]
+            top = top[score[top] > 0]
+            if top.size:
+                out.update(suspect_pipe=net.pipe_ids[top[0]], score=_r(score[top[0]]),
+                           candidates=[net.pipe_ids[k] for k in top])
+        return out
+
+
+def _r(x: float) -> float:
+    return 0.0 if not np.isfinite(x) else round(float(x), 5)
+
+
+def _rounded(x: np.ndarray) -> list:
+    """_r() of a whole array, as a list of floats."""
+    return (np.round(np.where(np.isfinite(x), x, 0.0), 5) + 0.0).tolist()    # no -0.0
@@ -6,20 +6,55 @@ DEPLOYMENT NOTES
     joblib.load() works on any Python 3.11+ environment without
     NamedRobustScaler injection or __main__ patching.
   - All 12 model features are dimensionless ratios / percentages.
-  - A per-sensor SensorBuffer maintains the rolling window.
+  - Rolling windows and latch state live in a BufferRegistry (one
+    row of preallocated arrays per sensor, bounded and evicting);
+    SensorBuffer is the same state for a single sensor.
   - Field normals are read from the bundle (set at training time).
+  - INFERENCE_ENGINE=compiled scores with the flat-array evaluator in
+    forest.py instead of sklearn (default: sklearn, the reference).
+  - Importing this module does not load the model: everything except
+    the estimator comes from leak_detector.meta.json, and the pickle
+    (plus sklearn) is loaded by load_model() on first use.  After
+    replacing the pickle, run `python -m backend.predict` to rewrite
+    the sidecar; a stale sidecar makes load_model() raise, and a tick
+    that cannot load the model fails instead of scoring prob=0.
+  - The estimator lives in a models.ModelRegistry (_models): a
+    retrained bundle can be loaded in the background, scored in shadow
+    next to the live one and promoted without a restart.  The decision
+    threshold is the live model's.
 """
 
-import math, os, joblib, numpy as np, pandas as pd
-from collections import deque
+import json, math, os, logging, threading, time, numpy as np, pandas as pd
 
-# ── Load bundle ──────────────────────────────────────────────────
+from . import kernels
+from .models import Model, ModelRegistry, bundle_meta as _bundle_meta, load_bundle
+
+log = logging.getLogger(__name__)
+
+# ── Bundle metadata (model itself loads lazily) ──────────────────
 BASE_DIR   = os.path.dirname(os.path.abspath(__file__))
-_bundle    = joblib.load(os.path.join(BASE_DIR, "leak_detector.pkl"))
-_model     = _bundle["model"]
-_threshold = _bundle["threshold"]
-_fn        = _bundle["field_normals"]
-_phys      = _bundle["physics_rule"]
+MODEL_PATH = os.path.join(BASE_DIR, "leak_detector.pkl")
+META_PATH  = os.path.join(BASE_DIR, "leak_detector.meta.json")
+
+
+def _load_bundle() -> dict:
+    return load_bundle(MODEL_PATH)
+
+
+try:
+    with open(META_PATH, encoding="utf-8") as fh:
+        _meta = json.load(fh)
+    _preloaded = None
+except FileNotFoundError:
+    log.warning("%s missing; loading the model bundle at import", META_PATH)
+    _preloaded = _load_bundle()
+    _meta = _bundle_meta(_preloaded)
+
+_threshold = _meta["threshold"]
+_fn        = _meta["field_normals"]
+_phys      = _meta["physics_rule"]
+FEATURES   = list(_meta["features"])       # training column order
+MODEL_VERSION = _meta.get("version", "unknown")
 
 FIELD_PRESSURE_BAR = _fn["pressure_bar"]   # 0.48
 FIELD_FLOW_LPS     = _fn["flow_lps"]       # 0.4167
@@ -27,6 +62,47 @@ FIELD_FLOW_LPS     = _fn["flow_lps"]       # 0.4167
 PHYS_DROP_PCT = _phys["threshold"]         # 0.26
 ML_THRESHOLD  = _threshold                 # 0.5178
 
+# ── Inference engine ─────────────────────────────────────────────
+# 'sklearn'  → _model.predict_proba (reference path)
+# 'compiled' → forest.CompiledForest, same probabilities to ~1e-15
+INFERENCE_ENGINE = os.getenv("INFERENCE_ENGINE", "sklearn").strip().lower()
+
+_models    = ModelRegistry(reference=_meta, engine=INFERENCE_ENGINE)
+_load_lock = threading.Lock()
+
+
+def load_model():
+    """
+    Load leak_detector.pkl (and compile it for INFERENCE_ENGINE=compiled)
+    as the live model once; safe to call from any thread, a no-op
+    afterwards.  Returns the live estimator.
+    """
+    global _preloaded, INFERENCE_ENGINE
+    if _models.live is not None:
+        return _models.live.estimator
+    with _load_lock:
+        if _models.live is not None:
+            return _models.live.estimator
+        bundle, _preloaded = _preloaded or _load_bundle(), None
+        if _bundle_meta(bundle) != _meta:
+            raise RuntimeError(f"{META_PATH} does not match {MODEL_PATH}; "
+                               "run `python -m backend.predict` to rewrite it")
+        live = _models.install(Model(bundle, MODEL_PATH, INFERENCE_ENGINE))
+        INFERENCE_ENGINE = live.engine
+    return live.estimator
+
+
+def model_version() -> str:
+    """Version of the live model (the sidecar's until it is loaded)."""
+    live = _models.live
+    return MODEL_VERSION if live is None else live.version
+
+
+def _predict_proba(X: np.ndarray) -> tuple:
+    """(P(leak) for each row of an (n × 12) feature matrix, threshold)."""
+    return _models.predict_proba(X)
+
+
 # ── Recovery threshold ───────────────────────────────────────────
 # Once a leak is latched, pressure must recover to at least this
 # fraction of rolling mean before the alert clears.
@@ -41,11 +117,34 @@ Cd = 0.80; g = 9.81
 WINDOW = 12
 
 
+# Window lengths used by the features (must match training)
+_W3, _W6 = 3, 6
+
+# Running sums are re-derived from the ring every this many pushes so
+# add/subtract rounding error can never accumulate, and the shift they
+# are taken about follows the signal.
+_RESYNC = 64
+
+
+def _fsum(xs) -> float:
+    """Left-to-right float sum (the order BufferRegistry sums columns in)."""
+    t = 0.0
+    for x in xs:
+        t += x
+    return t
+
+
 class SensorBuffer:
     """
     Rolling window of pressure/flow readings for one sensor.
     Pre-seeded with field normals — accurate from reading #1.
-    
+
+    The window is a fixed ring of WINDOW slots.  Running sums and sums
+    of squares are kept for the 3-, 6- and 12-sample windows, so each
+    push and each feature extraction is O(1).  Sums are taken about a
+    shift near the window mean (re-centred on every resync) to keep the
+    variance free of cancellation error.
+
     Also tracks sticky alert state:
       state = 'normal'     → no leak detected
       state = 'latched'    → leak detected, alert stays on
@@ -53,43 +152,130 @@ class SensorBuffer:
                              RECOVERY_READINGS consecutive stable readings
     """
 
+    __slots__ = ("_p", "_f", "_r", "_i", "_n", "_kp", "_kf",
+                 "_ps3", "_ps6", "_ps12", "_pq6", "_pq12",
+                 "_fs3", "_fs6", "_fq6", "_rs6",
+                 "state", "_stable_count")
+
     def __init__(self):
-        self._p     = deque([FIELD_PRESSURE_BAR] * WINDOW, maxlen=WINDOW)
-        self._f     = deque([FIELD_FLOW_LPS]     * WINDOW, maxlen=WINDOW)
+        self._p = [FIELD_PRESSURE_BAR] * WINDOW     # ring, oldest at _i
+        self._f = [FIELD_FLOW_LPS]     * WINDOW
+        self._r = [FIELD_PRESSURE_BAR / (FIELD_FLOW_LPS + 1e-6)] * WINDOW
+        self._i = 0                                 # next write slot
+        self._n = 0                                 # pushes since resync
+        self._resync()                              # sets shifts + sums
         self.state  = "normal"      # 'normal' | 'latched' | 'recovering'
         self._stable_count = 0      # consecutive stable readings counter
 
+    # ── ring helpers ─────────────────────────────────────────────
+    def _back(self, ring: list, k: int) -> float:
+        """k-th most recent value (k=1 is the newest)."""
+        return ring[(self._i - k) % WINDOW]
+
+    def _resync(self):
+        """Re-centre the shifts and recompute every running sum exactly."""
+        self._kp = P = _fsum(self._p) / WINDOW
+        self._kf = F = _fsum(self._f) / WINDOW
+        p = [self._back(self._p, k) - P for k in range(1, WINDOW + 1)]
+        f = [self._back(self._f, k) - F for k in range(1, WINDOW + 1)]
+        r = [self._back(self._r, k)     for k in range(1, _W6 + 1)]
+        self._ps3  = _fsum(p[:_W3]); self._ps6 = _fsum(p[:_W6]); self._ps12 = _fsum(p)
+        self._pq6  = _fsum(x * x for x in p[:_W6])
+        self._pq12 = _fsum(x * x for x in p)
+        self._fs3  = _fsum(f[:_W3]); self._fs6 = _fsum(f[:_W6])
+        self._fq6  = _fsum(x * x for x in f[:_W6])
+        self._rs6  = _fsum(r)
+        self._n    = 0
+
     def push(self, p: float, f: float):
-        self._p.append(p)
-        self._f.append(f)
+        P, F = self._kp, self._kf
+        r = p / (f + 1e-6)
 
-    def features(self, hour: int) -> pd.DataFrame:
-        p = list(self._p); f = list(self._f)
-        cp, cf = p[-1], f[-1]
-        pm3 = np.mean(p[-3:]); pm6 = np.mean(p[-6:]); pm12 = np.mean(p)
-        ps6 = max(np.std(p[-6:]), 1e-6); ps12 = max(np.std(p), 1e-6)
-        fm3 = np.mean(f[-3:]); fm6 = np.mean(f[-6:]); fs6 = max(np.std(f[-6:]), 1e-6)
-        p1  = (cp - p[-2]) / (pm3 + 1e-6)
-        p2  = p1 - (p[-2] - p[-3]) / (pm3 + 1e-6)
-        f1  = (cf - f[-2]) / (fm3 + 1e-6)
+        # Values leaving the 3-, 6- and 12-sample windows
+        p3 = self._back(self._p, _W3) - P; f3 = self._back(self._f, _W3) - F
+        p6 = self._back(self._p, _W6) - P; f6 = self._back(self._f, _W6) - F
+        p12 = self._p[self._i] - P;        r6 = self._back(self._r, _W6)
+
+        a, b = p - P, f - F
+        self._ps3  += a - p3;          self._fs3 += b - f3
+        self._ps6  += a - p6;          self._fs6 += b - f6
+        self._pq6  += a * a - p6 * p6; self._fq6 += b * b - f6 * f6
+        self._ps12 += a - p12;         self._pq12 += a * a - p12 * p12
+        self._rs6  += r - r6
+
+        i = self._i
+        self._p[i] = p; self._f[i] = f; self._r[i] = r
+        self._i = (i + 1) % WINDOW
+
+        self._n += 1
+        if self._n >= _RESYNC:
+            self._resync()
+
+    def feature_vector(self, hour: int, out: np.ndarray = None) -> np.ndarray:
+        """The 12 model features as a 1-D array, in FEATURES order.
+
+        Writes into ``out`` (length-12 float64 view) when given.
+        """
+        P, F = self._kp, self._kf
+        cp, cf = self._back(self._p, 1), self._back(self._f, 1)
+        p_2, p_3 = self._back(self._p, 2), self._back(self._p, 3)
+
+        s3, s6, s12 = self._ps3 / _W3, self._ps6 / _W6, self._ps12 / WINDOW
+        pm3, pm6, pm12 = P + s3, P + s6, P + s12
+        ps6  = max(math.sqrt(max(self._pq6  / _W6    - s6  * s6,  0.0)), 1e-6)
+        ps12 = max(math.sqrt(max(self._pq12 / WINDOW - s12 * s12, 0.0)), 1e-6)
+        t3, t6 = self._fs3 / _W3, self._fs6 / _W6
+        fm3, fm6 = F + t3, F + t6
+        fs6 = max(math.sqrt(max(self._fq6 / _W6 - t6 * t6, 0.0)), 1e-6)
+
+        p1  = (cp - p_2) / (pm3 + 1e-6)
+        p2  = p1 - (p_2 - p_3) / (pm3 + 1e-6)
+        f1  = (cf - self._back(self._f, 2)) / (fm3 + 1e-6)
         pn  = cp / (pm6 + 1e-6); fn = cf / (fm6 + 1e-6); pfr = pn / (fn + 1e-6)
-        pfm = np.mean([pp / (ff + 1e-6) for pp, ff in zip(p[-6:], f[-6:])])
-        return pd.DataFrame([{
-            "P_drop_pct6":   (pm6  - cp) / (pm6  + 1e-6),
-            "P_drop_pct12":  (pm12 - cp) / (pm12 + 1e-6),
-            "P_cv6":         ps6 / (pm6 + 1e-6),
-            "F_cv6":         fs6 / (fm6 + 1e-6),
-            "P_roc1": p1, "P_roc2": p2, "F_roc1": f1,
-            "P_zscore6":     (cp - pm6)  / (ps6  + 1e-6),
-            "P_zscore12":    (cp - pm12) / (ps12 + 1e-6),
-            "PF_norm_ratio": pfr,
-            "PF_ratio_dev":  pfr - pfm,
-            "hour":          float(hour),
-        }])
+        pfm = self._rs6 / _W6
+
+        if out is None:
+            out = np.empty(len(FEATURES), dtype=np.float64)
+        out[0]  = (pm6  - cp) / (pm6  + 1e-6)     # P_drop_pct6
+        out[1]  = (pm12 - cp) / (pm12 + 1e-6)     # P_drop_pct12
+        out[2]  = ps6 / (pm6 + 1e-6)              # P_cv6
+        out[3]  = fs6 / (fm6 + 1e-6)              # F_cv6
+        out[4]  = p1                              # P_roc1
+        out[5]  = p2                              # P_roc2
+        out[6]  = f1                              # F_roc1
+        out[7]  = (cp - pm6)  / (ps6  + 1e-6)     # P_zscore6
+        out[8]  = (cp - pm12) / (ps12 + 1e-6)     # P_zscore12
+        out[9]  = pfr                             # PF_norm_ratio
+        out[10] = pfr - pfm                       # PF_ratio_dev
+        out[11] = float(hour)                     # hour
+        return out
+
+    def features(self, hour: int) -> pd.DataFrame:
+        return pd.DataFrame([self.feature_vector(hour)], columns=FEATURES)
+
+    def window(self) -> tuple[list, list]:
+        """(pressure, flow) rings in chronological order, oldest first."""
+        i = self._i
+        return self._p[i:] + self._p[:i], self._f[i:] + self._f[:i]
+
+    @classmethod
+    def restore(cls, pressure, flow, state: str = "normal",
+                stable_count: int = 0) -> "SensorBuffer":
+        """Rebuild a buffer from window() output and its latch state."""
+        if len(pressure) != WINDOW or len(flow) != WINDOW:
+            raise ValueError(f"window must hold {WINDOW} readings")
+        buf = cls()
+        buf._p = [float(x) for x in pressure]
+        buf._f = [float(x) for x in flow]
+        buf._r = [p / (f + 1e-6) for p, f in zip(buf._p, buf._f)]
+        buf._i = 0
+        buf._resync()
+        buf.state, buf._stable_count = state, int(stable_count)
+        return buf
 
     @property
     def p6_mean(self) -> float:
-        return float(np.mean(list(self._p)[-6:]))
+        return self._kp + self._ps6 / _W6
 
     def update_state(self, raw_leak: bool, pressure_bar: float) -> tuple[bool, str]:
         """
@@ -142,15 +328,326 @@ class SensorBuffer:
 
 
 # ── Per-sensor buffer registry ───────────────────────────────────
-_buffers: dict[int, SensorBuffer] = {}
+STATES = ("normal", "latched", "recovering")      # latch state codes 0, 1, 2
+
+# One registry row per sensor: SensorBuffer's fields (same names) plus
+# the slot bookkeeping
+_RINGS = ("_p", "_f", "_r")
+_SUMS  = ("_kp", "_kf", "_ps3", "_ps6", "_ps12", "_pq6", "_pq12",
+          "_fs3", "_fs6", "_fq6", "_rs6")
+_ROW   = ([(k, np.float64, (WINDOW,)) for k in _RINGS]
+          + [(k, np.float64, ()) for k in _SUMS]
+          + [("_i", np.intp, ()), ("_n", np.intp, ()), ("state", np.uint8, ()),
+             ("_stable_count", np.intp, ()),
+             ("sid", np.int64, ()), ("seen", np.float64, ()), ("live", np.bool_, ())])
+
+# Batches at least this many sensors wide are pushed, featurised and
+# latched with whole-array operations; narrower ones (a long replay of
+# a few sensors) run SensorBuffer's code on checked-out rows.
+VECTOR_MIN_SENSORS = 16
+
+# Live registry bounds (0 = off): a sensor idle for BUFFER_TTL_S is
+# evicted, and past BUFFER_MAX_SENSORS the least recently seen go first
+BUFFER_TTL_S       = float(os.getenv("BUFFER_TTL_S", "86400"))
+BUFFER_MAX_SENSORS = int(os.getenv("BUFFER_MAX_SENSORS", "100000"))
+
+
+def _colsum(a: np.ndarray) -> np.ndarray:
+    """Row sums of a 2-D array, columns added left to right (as _fsum)."""
+    t = a[:, 0] + 0.0
+    for k in range(1, a.shape[1]):
+        t += a[:, k]
+    return t
+
+
+def _layers(slots: np.ndarray) -> list:
+    """
+    Split batch positions into layers holding each slot at most once,
+    the k-th layer taking every slot's k-th reading (batch order kept).
+    """
+    order = np.argsort(slots, kind="stable")
+    first = np.r_[True, slots[order][1:] != slots[order][:-1]]
+    start = np.maximum.accumulate(np.where(first, np.arange(len(order)), 0))
+    rank  = np.empty(len(order), dtype=np.intp)
+    rank[order] = np.arange(len(order)) - start
+    by_layer = np.lexsort((np.arange(len(order)), rank))
+    return np.split(by_layer, np.flatnonzero(np.diff(rank[by_layer])) + 1)
+
+
+class BufferRegistry:
+    """
+    sensor_id → SensorBuffer state for a whole fleet, as a struct of
+    arrays: each sensor owns one slot (row) of preallocated (capacity ×
+    WINDOW) rings and of one array per running sum and latch field, and
+    a dict maps sensor ids to slots.  Memory per sensor is flat (about
+    420 bytes) and a tick of many sensors is pushed, featurised and
+    latched with a few array operations.  The arithmetic is
+    SensorBuffer's, operation for operation, so results are identical.
+
+    Capacity doubles when free slots run out.  Optionally, sensors not
+    seen for ttl_s seconds are evicted, and beyond max_sensors the least
+    recently seen make room; a returning sensor starts again from field
+    normals, as after a restart.
+    """
+
+    def __init__(self, capacity: int = 8, ttl_s: float = None, max_sensors: int = None):
+        self.ttl_s       = ttl_s or None
+        self.max_sensors = max_sensors or None
+        self.evicted     = 0                # sensors dropped by TTL / LRU
+        self._index      = {}               # sensor_id → slot
+        self._a          = {k: np.zeros((max(capacity, 1),) + shape, dtype=dt)
+                            for k, dt, shape in _ROW}
+        self._swept      = -np.inf          # last TTL sweep
 
-def _buf(sid: int) -> SensorBuffer:
-    if sid not in _buffers:
-        _buffers[sid] = SensorBuffer()
-    return _buffers[sid]
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def __contains__(self, sid) -> bool:
+        return sid in self._index
+
+    def __iter__(self):
+        return iter(self._index)
+
+    @property
+    def capacity(self) -> int:
+        return len(self._a["live"])
+
+    # ── slots ────────────────────────────────────────────────────
+    def slots(self, sids, now: float = None) -> np.ndarray:
+        """Slot of every sensor id (allocated on first sight), marked seen."""
+        now = time.monotonic() if now is None else now
+        self._sweep(now)
+        uniq, inv = np.unique(np.asarray(sids, dtype=np.int64), return_inverse=True)
+        ix   = self._index
+        slot = np.fromiter((ix.get(s, -1) for s in uniq.tolist()), np.intp, len(uniq))
+        new  = slot < 0
+        if new.any():
+            slot[new] = self._allocate(uniq[new], keep=slot[~new])
+        self._a["seen"][slot] = now
+        return slot[inv.ravel()]
+
+    def _allocate(self, sids: np.ndarray, keep: np.ndarray) -> np.ndarray:
+        k = len(sids)
+        if self.max_sensors is not None:
+            if k > self.max_sensors:
+                raise ValueError(f"{k} new sensors exceed max_sensors={self.max_sensors}")
+            over = len(self._index) + k - self.max_sensors
+            if over > 0:
+                live = np.flatnonzero(self._a["live"])
+                live = live[~np.isin(live, keep)]
+                self._drop(live[np.argsort(self._a["seen"][live], kind="stable")[:over]])
+        if self.capacity - len(self._index) < k:
+            self._grow(len(self._index) + k)
+        slots = np.flatnonzero(~self._a["live"])[:k]
+        for name, v in _SEED.items():
+            self._a[name][slots] = v
+        self._a["sid"][slots]  = sids
+        self._a["live"][slots] = True
+        self._index.update(zip(sids.tolist(), slots.tolist()))
+        return slots
+
+    def _grow(self, need: int):
+        cap = self.capacity
+        while cap < need:
+            cap *= 2
+        for name, arr in self._a.items():
+            grown = np.zeros((cap,) + arr.shape[1:], dtype=arr.dtype)
+            grown[:len(arr)] = arr
+            self._a[name] = grown
+
+    def _drop(self, slots: np.ndarray):
+        for sid in self._a["sid"][slots].tolist():
+            del self._index[sid]
+        self._a["live"][slots] = False
+        self.evicted += len(slots)
+
+    def _sweep(self, now: float):
+        if self.ttl_s is None or now - self._swept < min(self.ttl_s, 60.0):
+            return
+        self._swept = now
+        a = self._a
+        self._drop(np.flatnonzero(a["live"] & (a["seen"] < now - self.ttl_s)))
+
+    def clear(self):
+        self._index.clear()
+        self._a["live"][:] = False
+
+    def load(self, other: "BufferRegistry"):
+        """Take over other's sensors (a restored snapshot), keeping our bounds."""
+        self._a, self._index = other._a, other._index
+        self._a["seen"][self._a["live"]] = time.monotonic()
+
+    # ── whole-array kernels (slots unique within a call) ─────────
+    def push(self, s: np.ndarray, p: np.ndarray, f: np.ndarray):
+        """SensorBuffer.push() for every slot in s."""
+        a = self._a
+        P, F, i = a["_kp"][s], a["_kf"][s], a["_i"][s]
+        rp, rf, rr = a["_p"], a["_f"], a["_r"]
+        r = p / (f + 1e-6)
+
+        # Values leaving the 3-, 6- and 12-sample windows
+        i3, i6 = (i - _W3) % WINDOW, (i - _W6) % WINDOW
+        p3 = rp[s, i3] - P; f3 = rf[s, i3] - F
+        p6 = rp[s, i6] - P; f6 = rf[s, i6] - F
+        p12 = rp[s, i] - P; r6 = rr[s, i6]
+
+        x, y = p - P, f - F
+        a["_ps3"][s]  += x - p3;          a["_fs3"][s]  += y - f3
+        a["_ps6"][s]  += x - p6;          a["_fs6"][s]  += y - f6
+        a["_pq6"][s]  += x * x - p6 * p6; a["_fq6"][s]  += y * y - f6 * f6
+        a["_ps12"][s] += x - p12;         a["_pq12"][s] += x * x - p12 * p12
+        a["_rs6"][s]  += r - r6
+
+        rp[s, i] = p; rf[s, i] = f; rr[s, i] = r
+        a["_i"][s] = (i + 1) % WINDOW
+
+        n = a["_n"][s] + 1
+        a["_n"][s] = n
+        due = s[n >= _RESYNC]
+        if due.size:
+            self._resync(due)
+
+    def _resync(self, s: np.ndarray):
+        a = self._a
+        rows = s[:, None]
+        back = (a["_i"][rows] - np.arange(1, WINDOW + 1)) % WINDOW     # newest first
+        a["_kp"][s] = P = _colsum(a["_p"][s]) / WINDOW
+        a["_kf"][s] = F = _colsum(a["_f"][s]) / WINDOW
+        p = a["_p"][rows, back] - P[:, None]
+        f = a["_f"][rows, back] - F[:, None]
+        r = a["_r"][rows, back[:, :_W6]]
+        a["_ps3"][s]  = _colsum(p[:, :_W3]); a["_ps6"][s] = _colsum(p[:, :_W6])
+        a["_ps12"][s] = _colsum(p)
+        a["_pq6"][s]  = _colsum(p[:, :_W6] * p[:, :_W6])
+        a["_pq12"][s] = _colsum(p * p)
+        a["_fs3"][s]  = _colsum(f[:, :_W3]); a["_fs6"][s] = _colsum(f[:, :_W6])
+        a["_fq6"][s]  = _colsum(f[:, :_W6] * f[:, :_W6])
+        a["_rs6"][s]  = _colsum(r)
+        a["_n"][s]    = 0
+
+    def p6_mean(self, s: np.ndarray) -> np.ndarray:
+        return self._a["_kp"][s] + self._a["_ps6"][s] / _W6
+
+    def features(self, s: np.ndarray, hour) -> np.ndarray:
+        """SensorBuffer.feature_vector() of every slot in s, (len(s) × 12)."""
+        a = self._a
+        P, F, i = a["_kp"][s], a["_kf"][s], a["_i"][s]
+        rp, rf = a["_p"], a["_f"]
+        cp, cf = rp[s, (i - 1) % WINDOW], rf[s, (i - 1) % WINDOW]
+        p_2, p_3 = rp[s, (i - 2) % WINDOW], rp[s, (i - 3) % WINDOW]
+
+        s3, s6, s12 = a["_ps3"][s] / _W3, a["_ps6"][s] / _W6, a["_ps12"][s] / WINDOW
+        pm3, pm6, pm12 = P + s3, P + s6, P + s12
+        ps6  = np.maximum(np.sqrt(np.maximum(a["_pq6"][s]  / _W6    - s6  * s6,  0.0)), 1e-6)
+        ps12 = np.maximum(np.sqrt(np.maximum(a["_pq12"][s] / WINDOW - s12 * s12, 0.0)), 1e-6)
+        t3, t6 = a["_fs3"][s] / _W3, a["_fs6"][s] / _W6
+        fm3, fm6 = F + t3, F + t6
+        fs6 = np.maximum(np.sqrt(np.maximum(a["_fq6"][s] / _W6 - t6 * t6, 0.0)), 1e-6)
+
+        p1  = (cp - p_2) / (pm3 + 1e-6)
+        p2  = p1 - (p_2 - p_3) / (pm3 + 1e-6)
+        f1  = (cf - rf[s, (i - 2) % WINDOW]) / (fm3 + 1e-6)
+        pn  = cp / (pm6 + 1e-6); fn = cf / (fm6 + 1e-6); pfr = pn / (fn + 1e-6)
+        pfm = a["_rs6"][s] / _W6
+
+        return np.column_stack((
+            (pm6  - cp) / (pm6  + 1e-6), (pm12 - cp) / (pm12 + 1e-6),
+            ps6 / (pm6 + 1e-6),          fs6 / (fm6 + 1e-6),
+            p1, p2, f1,
+            (cp - pm6)  / (ps6  + 1e-6), (cp - pm12) / (ps12 + 1e-6),
+            pfr, pfr - pfm,
+            np.broadcast_to(np.asarray(hour, dtype=np.float64), cp.shape),
+        ))
+
+    def latch(self, s: np.ndarray, raw_leak: np.ndarray, pressure_bar: np.ndarray) -> tuple:
+        """
+        SensorBuffer.update_state() for every slot in s.
+        Returns (final_leak bool[], state code[]).
+        """
+        a  = self._a
+        st, sc = a["state"][s], a["_stable_count"][s]
+        ok = (pressure_bar / FIELD_PRESSURE_BAR) >= RECOVERY_THRESHOLD
+
+        normal, recovering = st == 0, st == 2
+        trip    = normal & raw_leak
+        recover = (st == 1) & ok & ~raw_leak
+        relapse = recovering & (raw_leak | ~ok)
+        held    = recovering & ~relapse
+        cleared = held & (sc + 1 >= RECOVERY_READINGS)
+
+        st = st.copy(); sc = sc.copy()
+        sc[held] += 1
+        st[trip | relapse] = 1; sc[trip | relapse] = 0
+        st[recover] = 2;        sc[recover] = 1
+        st[cleared] = 0;        sc[cleared] = 0
+        a["state"][s], a["_stable_count"][s] = st, sc
+        return np.where(normal, raw_leak, ~cleared), st
+
+    # ── scalar access ────────────────────────────────────────────
+    def checkout(self, slots) -> dict:
+        """slot → SensorBuffer copy of that row, for the scalar path."""
+        a, out = self._a, {}
+        for s in np.unique(slots).tolist():
+            buf = SensorBuffer.__new__(SensorBuffer)
+            for name in _RINGS:
+                setattr(buf, name, a[name][s].tolist())
+            for name in _SUMS:
+                setattr(buf, name, float(a[name][s]))
+            buf._i, buf._n = int(a["_i"][s]), int(a["_n"][s])
+            buf.state, buf._stable_count = STATES[a["state"][s]], int(a["_stable_count"][s])
+            out[s] = buf
+        return out
+
+    def checkin(self, bufs: dict):
+        """Write checked-out SensorBuffers back to their slots."""
+        a = self._a
+        for s, buf in bufs.items():
+            for name in _RINGS + _SUMS + ("_i", "_n", "_stable_count"):
+                a[name][s] = getattr(buf, name)
+            a["state"][s] = STATES.index(buf.state)
+
+    def get(self, sid) -> SensorBuffer:
+        """A SensorBuffer copy of one sensor's state (KeyError if unknown)."""
+        s = self._index[sid]
+        return self.checkout([s])[s]
+
+    # ── snapshot ─────────────────────────────────────────────────
+    def export(self) -> tuple:
+        """(sids, state codes, stable counts, pressure, flow) windows, oldest first."""
+        a = self._a
+        s = np.flatnonzero(a["live"])
+        chrono = (a["_i"][s, None] + np.arange(WINDOW)) % WINDOW
+        return (a["sid"][s], a["state"][s], a["_stable_count"][s],
+                a["_p"][s[:, None], chrono], a["_f"][s[:, None], chrono])
+
+    @classmethod
+    def from_arrays(cls, sids, states, stable, pressure, flow, **kw) -> "BufferRegistry":
+        """Rebuild a registry from export() output (SensorBuffer.restore())."""
+        p = np.asarray(pressure, dtype=np.float64)
+        f = np.asarray(flow,     dtype=np.float64)
+        if p.shape[1:] != (WINDOW,) or f.shape != p.shape:
+            raise ValueError(f"windows must hold {WINDOW} readings")
+        reg = cls(capacity=len(p), **kw)
+        s = reg.slots(sids)
+        if len(np.unique(s)) != len(s):
+            raise ValueError("duplicate sensor id")
+        a = reg._a
+        a["_p"][s], a["_f"][s], a["_r"][s] = p, f, p / (f + 1e-6)
+        a["_i"][s] = 0
+        reg._resync(s)
+        a["state"][s], a["_stable_count"][s] = states, stable
+        return reg
+
+
+_SEED = {k: getattr(SensorBuffer(), k) for k in _RINGS + _SUMS + ("_i", "_n", "_stable_count")}
+_SEED["state"] = 0
+
+_buffers = BufferRegistry(ttl_s=BUFFER_TTL_S, max_sensors=BUFFER_MAX_SENSORS)
 
 
 # ── Orifice quantification ────────────────────────────────────────
+_MAGNITUDE = ("Leak_Magnitude_LPS", "Leak_Magnitude_LPM", "Leak_Area_mm2", "Leak_Diameter_mm")
+
 def _quantify(flow_lps: float, pressure_bar: float) -> tuple:
     lps = abs(flow_lps - FIELD_FLOW_LPS)
     if lps <= 0 or pressure_bar <= 0:
@@ -172,6 +669,225 @@ def _no_leak(prob: float, pdrop: float = 0.0, state: str = "normal") -> dict:
 
 
 # ── Main prediction ───────────────────────────────────────────────
+def _result(final_leak: bool, state: str, phys: bool, prob: float, pdrop: float) -> dict:
+    """
+    Result dict for one reading after the latch; magnitudes stay 0.0
+    until _quantify_rows() fills them.
+    """
+    if not final_leak:
+        return _no_leak(prob, pdrop, state)
+    return {
+        "leak":               1,
+        "prob":               round(prob, 4),
+        "alert_state":        state,          # 'latched' or 'recovering'
+        "physics_fired":      bool(phys),
+        "p_drop_pct":         round(pdrop, 4),
+        "Leak_Magnitude_LPS": 0.0,
+        "Leak_Magnitude_LPM": 0.0,
+        "Leak_Area_mm2":      0.0,
+        "Leak_Diameter_mm":   0.0,
+    }
+
+
+def _quantify_rows(rows: list, results: list, idx: list):
+    """Fill the magnitudes of every leaking result with one kernel call."""
+    leaks = [i for i in idx if results[i]["leak"]]
+    if not leaks:
+        return
+    lps, area, dia = kernels.quantify([rows[i][2] for i in leaks], [rows[i][1] for i in leaks],
+                                      FIELD_FLOW_LPS, Cd, g)
+    lpm = np.round(lps * 60.0, 2)
+    for i, q in zip(leaks, zip(lps.tolist(), lpm.tolist(), area.tolist(), dia.tolist())):
+        results[i].update(zip(_MAGNITUDE, q))
+
+
+# ── Wide batches: whole-array kernels, one layer at a time ───────
+def _features_wide(reg: BufferRegistry, slots, layers, p, f, hour) -> tuple:
+    X, pdrop = np.empty((len(slots), len(FEATURES))), np.empty(len(slots))
+    for sel in layers:
+        s = slots[sel]
+        reg.push(s, p[sel], f[sel])
+        p6m = reg.p6_mean(s)
+        X[sel] = reg.features(s, hour[sel])
+        pdrop[sel] = (p6m - p[sel]) / (p6m + 1e-6)
+    return X, pdrop
+
+
+def _latch_wide(reg: BufferRegistry, slots, layers, raw, p) -> tuple:
+    final = np.empty(len(slots), dtype=bool)
+    prev, state = np.empty((2, len(slots)), dtype=np.uint8)
+    for sel in layers:
+        prev[sel] = reg._a["state"][slots[sel]]
+        final[sel], state[sel] = reg.latch(slots[sel], raw[sel], p[sel])
+    return final, prev, state
+
+
+# ── Narrow batches: SensorBuffer code on checked-out rows ────────
+def _features_narrow(bufs: dict, slots, p, f, hour) -> tuple:
+    X, pdrop = np.empty((len(slots), len(FEATURES))), []
+    for j, (s, pj, fj, h) in enumerate(zip(slots.tolist(), p.tolist(), f.tolist(), hour.tolist())):
+        buf = bufs[s]
+        buf.push(pj, fj)
+        p6m = buf.p6_mean
+        buf.feature_vector(h, out=X[j])
+        pdrop.append((p6m - pj) / (p6m + 1e-6))
+    return X, np.array(pdrop)
+
+
+def _latch_narrow(bufs: dict, slots, raw, p) -> tuple:
+    final, prev, state = [], [], []
+    for s, rj, pj in zip(slots.tolist(), raw.tolist(), p.tolist()):
+        buf = bufs[s]
+        prev.append(STATES.index(buf.state))
+        leak, st = buf.update_state(rj, pj)
+        final.append(leak); state.append(STATES.index(st))
+    return (np.array(final, dtype=bool), np.array(prev, dtype=np.uint8),
+            np.array(state, dtype=np.uint8))
+
+
+def score_arrays(sids, p, f, hour, buffers: BufferRegistry = None) -> dict:
+    """
+    Array core of predict_leak_rows() for valid readings (p, f > 0),
+    oldest first: push, featurise, one predict_proba call, latch.
+
+    Returns {"prob", "pdrop": float64[], "phys", "leak": bool[],
+    "prev", "state": latch state codes (STATES index) before / after,
+    "threshold": the live model's ML threshold,
+    "seconds": {features, predict_proba, decide}}.
+    """
+    t0  = time.perf_counter()
+    reg = _buffers if buffers is None else buffers
+    if _models.live is None:
+        load_model()        # before any push: a load error fails the tick, loudly
+    p, f, hour = np.asarray(p, dtype=np.float64), np.asarray(f, dtype=np.float64), np.asarray(hour)
+
+    # 1. Push every reading, stack its feature vector ──────────────
+    slots  = reg.slots(sids)
+    layers = _layers(slots)
+    bufs   = None if len(layers[0]) >= VECTOR_MIN_SENSORS else reg.checkout(slots)
+    try:
+        if bufs is None:
+            X, pdrop = _features_wide(reg, slots, layers, p, f, hour)
+        else:
+            X, pdrop = _features_narrow(bufs, slots, p, f, hour)
+
+        # 2. One model call for the whole batch ────────────────────
+        t1 = time.perf_counter()
+        try:
+            probs, threshold = _predict_proba(X)
+        except Exception:
+            log.exception("predict_proba failed; physics rule only this tick")
+            probs, threshold = np.zeros(len(slots)), ML_THRESHOLD
+
+        # 3. Latch, in order ───────────────────────────────────────
+        t2   = time.perf_counter()
+        phys = pdrop >= PHYS_DROP_PCT
+        raw  = phys | (probs >= threshold)
+        if bufs is None:
+            final, prev, state = _latch_wide(reg, slots, layers, raw, p)
+        else:
+            final, prev, state = _latch_narrow(bufs, slots, raw, p)
+    finally:
+        if bufs is not None:
+            reg.checkin(bufs)
+
+    return {"prob": probs, "pdrop": pdrop, "phys": phys, "leak": final,
+            "prev": prev, "state": state, "threshold": threshold,
+            "seconds": {"features": t1 - t0, "predict_proba": t2 - t1,
+                        "decide": time.perf_counter() - t2}}
+
+
+def valid_rows(rows: list) -> tuple:
+    """
+    (results, idx): results pre-filled with no-leak for invalid readings
+    (pressure or flow <= 0, never pushed), idx the positions of the rest.
+    """
+    results: list = [None] * len(rows)
+    idx = []
+    for i, (_, p, f, _) in enumerate(rows):
+        if p <= 0 or f <= 0:
+            results[i] = _no_leak(0.0)
+        else:
+            idx.append(i)
+    return results, idx
+
+
+def results_from_arrays(rows: list, results: list, idx: list, out: dict,
+                        trace: dict = None) -> list[dict]:
+    """score_arrays() output for rows[idx] → predict_leak() result dicts."""
+    t0    = time.perf_counter()
+    state = [STATES[c] for c in out["state"].tolist()]
+    probs, pdrop = out["prob"].tolist(), out["pdrop"].tolist()
+    for j, (i, leak, phys) in enumerate(zip(idx, out["leak"].tolist(), out["phys"].tolist())):
+        results[i] = _result(leak, state[j], phys, probs[j], pdrop[j])
+    _quantify_rows(rows, results, idx)
+    if trace is None:
+        return results
+
+    triggers, transitions = [], []
+    threshold = out.get("threshold", ML_THRESHOLD)
+    for j, (i, prev) in enumerate(zip(idx, out["prev"].tolist())):
+        sid = rows[i][0]
+        if pdrop[j] >= PHYS_DROP_PCT: triggers.append((sid, "physics"))
+        if probs[j] >= threshold:     triggers.append((sid, "ml"))
+        if state[j] != STATES[prev]:  transitions.append((sid, STATES[prev], state[j]))
+    seconds = dict(out["seconds"])
+    seconds["decide"] += time.perf_counter() - t0
+    trace["seconds"], trace["triggers"], trace["transitions"] = seconds, triggers, transitions
+    return results
+
+
+def predict_leak_rows(rows, buffers: BufferRegistry = None, trace: dict = None) -> list[dict]:
+    """
+    Score a time-ordered sequence of readings with one predict_proba call.
+
+    Args:
+        rows    : iterable of (sensor_id, pressure_bar, flow_lps, hour),
+                  oldest first; may span many ticks and many sensors
+        buffers : BufferRegistry to read and update
+                  (default: the live, process-wide registry)
+        trace   : optional dict, filled for instrumentation with
+                  "seconds"     {features, predict_proba, decide}
+                  "triggers"    [(sensor_id, 'physics' | 'ml')] raw,
+                                before the latch
+                  "transitions" [(sensor_id, from_state, to_state)]
+
+    Features only depend on the rolling window, never on latch state,
+    so every reading is pushed and featurised first, the whole matrix
+    is scored at once, and the latch state machine then runs over the
+    results in the original order.  Batches of at least
+    VECTOR_MIN_SENSORS sensors go through the registry's array kernels
+    (one layer per reading of each sensor), narrower ones through
+    SensorBuffer; both give the same numbers.
+
+    Returns a list of predict_leak() result dicts, in input order.
+    Invalid readings (pressure or flow <= 0) are not pushed into their
+    buffer and come back as no-leak, exactly as in predict_leak().
+    """
+    rows = list(rows)
+    results, idx = valid_rows(rows)
+    if not idx:
+        return results
+    sids, p, f, hour = zip(*(rows[i] for i in idx))
+    out = score_arrays(sids, p, f, hour, buffers)
+    return results_from_arrays(rows, results, idx, out, trace)
+
+
+def predict_leak_batch(readings, hour: int = 12, trace: dict = None) -> list[dict]:
+    """
+    Score many sensors of one tick with a single predict_proba call.
+
+    Args:
+        readings : iterable of (sensor_id, pressure_bar, flow_lps)
+        hour     : UTC hour (0-23), shared by the whole tick
+        trace    : see predict_leak_rows()
+
+    Returns a list of predict_leak() result dicts, in input order.
+    """
+    return predict_leak_rows(((sid, p, f, hour) for sid, p, f in readings),
+                             trace=trace)
+
+
 def predict_leak(pressure_bar: float,
                  flow_lps: float,
                  sensor_id: int = 1,
@@ -191,38 +907,12 @@ def predict_leak(pressure_bar: float,
         p_drop_pct    – actual % pressure drop
         Leak_Magnitude_LPS/LPM, Leak_Area_mm2, Leak_Diameter_mm
     """
-    if pressure_bar <= 0 or flow_lps <= 0:
-        return _no_leak(0.0)
-
-    buf = _buf(sensor_id)
-    buf.push(pressure_bar, flow_lps)
-
-    # Raw detection (ML + physics, no memory)
-    pdrop = (buf.p6_mean - pressure_bar) / (buf.p6_mean + 1e-6)
-    phys  = pdrop >= PHYS_DROP_PCT
-
-    try:
-        prob = float(_model.predict_proba(buf.features(hour))[0][1])
-    except Exception:
-        prob = 0.0
-
-    raw_leak = phys or (prob >= ML_THRESHOLD)
-
-    # Apply sticky latch state machine
-    final_leak, state = buf.update_state(raw_leak, pressure_bar)
+    return predict_leak_batch([(sensor_id, pressure_bar, flow_lps)], hour)[0]
 
-    if not final_leak:
-        return _no_leak(prob, pdrop, state)
 
-    lps, area, dia = _quantify(flow_lps, pressure_bar)
-    return {
-        "leak":               1,
-        "prob":               round(prob, 4),
-        "alert_state":        state,          # 'latched' or 'recovering'
-        "physics_fired":      bool(phys),
-        "p_drop_pct":         round(pdrop, 4),
-        "Leak_Magnitude_LPS": lps,
-        "Leak_Magnitude_LPM": round(lps * 60.0, 2),
-        "Leak_Area_mm2":      area,
-        "Leak_Diameter_mm":   dia,
-    }
+if __name__ == "__main__":
+    # python -m backend.predict → rewrite leak_detector.meta.json
+    with open(META_PATH, "w", encoding="utf-8") as fh:
+        json.dump(_bundle_meta(_load_bundle()), fh, indent=2, ensure_ascii=False)
+        fh.write("\n")
+    print(f"wrote {META_PATH}")
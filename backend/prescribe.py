@@ -1,12 +1,20 @@
-import pandas as pd
+import bisect
+import csv
 import math
 import os
 
+import numpy as np
+
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 CSV_PATH = os.path.join(BASE_DIR, "prescription.csv")
 
-df = pd.read_csv(CSV_PATH).fillna("")
-df.columns = df.columns.str.strip().str.lower()
+# Cells pandas.read_csv would read as NaN (then blanked by fillna(""))
+_NA = {"", "#N/A", "#N/A N/A", "#NA", "-1.#IND", "-1.#QNAN", "-NaN", "-nan",
+       "1.#IND", "1.#QNAN", "<NA>", "N/A", "NA", "NULL", "NaN", "None",
+       "n/a", "nan", "null"}
+
+HIGH_FLOW_SUFFIX = " (High flow impact)"
+
 
 def clean_value(x):
     if isinstance(x, float) and math.isnan(x):
@@ -20,51 +28,107 @@ def to_float(x):
         return None
 
 
-def get_prescription(leak_size, magnitude):
+def _load_table(path: str) -> list[dict]:
+    """
+    prescription.csv → list of row dicts, typed like
+    pd.read_csv(path).fillna("") with stripped, lower-cased headers:
+    all-numeric columns become floats, blank cells become "".
+    """
+    with open(path, newline="", encoding="utf-8") as fh:
+        reader = csv.reader(fh)
+        header = [h.strip().lower() for h in next(reader)]
+        cells  = [r + [""] * (len(header) - len(r)) for r in reader if r]
+
+    cols = []
+    for j in range(len(header)):
+        col = ["" if r[j] in _NA else r[j] for r in cells]
+        if all(v == "" or to_float(v) is not None for v in col):
+            col = ["" if v == "" else float(v) for v in col]
+        cols.append(col)
+    return [dict(zip(header, vals)) for vals in zip(*cols)]
+
+
+# ══════════════════════════════════════════════════════════════════
+# INTERVAL INDEX (compiled once at import)
+# ══════════════════════════════════════════════════════════════════
+# Rows are matched in file order on leak_size ∈ [min, max), a blank
+# bound being open.  All row bounds are merged into one sorted array of
+# breakpoints; between two consecutive breakpoints the first matching
+# row never changes, so it is precomputed per elementary interval and
+# a lookup is a single bisect / searchsorted.
+ROWS = _load_table(CSV_PATH)
+
+def _bound(x, open_value: float) -> float:
+    v = to_float(x)
+    return open_value if v is None else v
+
+_SMIN = np.array([_bound(r.get("leak_size_min"), -np.inf) for r in ROWS])
+_SMAX = np.array([_bound(r.get("leak_size_max"),  np.inf) for r in ROWS])
+_MMIN = np.array([_bound(r.get("magnitude_min"), -np.inf) for r in ROWS])
+_MMAX = np.array([_bound(r.get("magnitude_max"),  np.inf) for r in ROWS])
+
+_BREAKS = np.unique(np.concatenate([_SMIN, _SMAX]))
+_BREAKS = _BREAKS[np.isfinite(_BREAKS)]
+_BREAKS_LIST = _BREAKS.tolist()
+
+def _first_row(lo: float, hi: float) -> int:
+    """First row covering all of [lo, hi), or -1 (→ fallback)."""
+    hit = np.flatnonzero((_SMIN <= lo) & (_SMAX >= hi))
+    return int(hit[0]) if len(hit) else -1
+
+_edges = [-np.inf] + _BREAKS_LIST + [np.inf]
+_ROW_OF_INTERVAL = np.array([_first_row(_edges[k], _edges[k + 1])
+                             for k in range(len(_edges) - 1)], dtype=np.intp)
+
+# Pre-cleaned result dicts: _RESULTS[row][high_flow]; fallback = last
+# row (Catastrophic) with no magnitude refinement.
+_RESULTS = [
+    ({k: clean_value(v) for k, v in r.items()},
+     {**{k: clean_value(v) for k, v in r.items()},
+      "action_type": r.get("action_type", "") + HIGH_FLOW_SUFFIX})
+    for r in ROWS
+]
+_FALLBACK = {k: clean_value(v) for k, v in ROWS[-1].items()}
+
+
+def _select(leak_size: float) -> int:
+    if leak_size != leak_size:          # NaN matches no interval
+        return -1
+    return int(_ROW_OF_INTERVAL[bisect.bisect_right(_BREAKS_LIST, leak_size)])
 
-    selected_row = None
 
+def get_prescription(leak_size, magnitude):
 
+    # =========================
     # STEP 1: SIZE-BASED SEVERITY
     # =========================
-    for _, row in df.iterrows():
-
-        smin = to_float(row.get("leak_size_min"))
-        smax = to_float(row.get("leak_size_max"))
-
-        size_ok = (
-            (smin is None or leak_size >= smin) and
-            (smax is None or leak_size < smax)
-        )
-
-        if size_ok:
-            selected_row = row
-            break
+    row = _select(leak_size)
 
     # =========================
     # STEP 2: MAGNITUDE REFINEMENT
     # =========================
-    if selected_row is not None:
-
-        result = {k: clean_value(v) for k, v in selected_row.to_dict().items()}
-
-        mmin = to_float(selected_row.get("magnitude_min"))
-        mmax = to_float(selected_row.get("magnitude_max"))
-
-        mag_ok = (
-            (mmin is None or magnitude >= mmin) and
-            (mmax is None or magnitude < mmax)
-        )
+    if row >= 0:
+        mag_ok = _MMIN[row] <= magnitude < _MMAX[row]
 
         # 🔥 If magnitude is extreme → upgrade action (NOT severity)
-        if not mag_ok:
-            result["action_type"] = result.get("action_type", "") + " (High flow impact)"
-
-        return result
+        return dict(_RESULTS[row][not mag_ok])
 
     # =========================
     # STEP 3: SAFETY FALLBACK
     # =========================
     # (should rarely happen)
-    row = df.iloc[-1]  # Catastrophic
-    return {k: clean_value(v) for k, v in row.to_dict().items()}
+    return dict(_FALLBACK)
+
+
+def get_prescriptions(size_ratios, magnitudes) -> list[dict]:
+    """Vectorised get_prescription() over equal-length arrays."""
+    size = np.asarray(size_ratios, dtype=np.float64)
+    mag  = np.asarray(magnitudes,  dtype=np.float64)
+
+    rows = _ROW_OF_INTERVAL[np.searchsorted(_BREAKS, size, side="right")]
+    rows[np.isnan(size)] = -1
+    safe = np.maximum(rows, 0)
+    high = ~((_MMIN[safe] <= mag) & (mag < _MMAX[safe]))
+
+    return [dict(_RESULTS[r][h]) if r >= 0 else dict(_FALLBACK)
+            for r, h in zip(rows.tolist(), high.tolist())]
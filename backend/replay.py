@@ -0,0 +1,348 @@
+"""
+replay.py  —  Historical replay / backfill
+─────────────────────────────────────────────────────────────────────
+Re-scores stored readings through the same calibration, SensorBuffer
+windows, model and latch state machine as live ingestion, in chunks
+of many ticks per predict_proba call (predict.predict_leak_rows).
+Replay runs on its own buffer registry, so live state is untouched.
+
+Sources:
+  file        ThingSpeak export (.json feeds document or .csv export)
+  thingspeak  ThingSpeak REST API, paged backwards 8000 entries at a time;
+              every channel of CHANNELS_CONFIG when it is set (one frame
+              per channel, scored on one buffer registry)
+  raw-dir     local directory of {fid}_raw.json files (Blob stand-in)
+  raw-blob    digital-twin-raw container (AZURE_STORAGE_CONNECTION_STRING,
+              works against Azurite too)
+  snapshots   Parquet snapshots (snapshots.py) for --start/--end, from a
+              local directory or the digital-twin-processed container
+
+Raw blobs and snapshots hold calibrated values rounded to 3/2 decimals,
+so re-scoring from them is close to, not bit-identical with, re-scoring
+the feed.
+
+Output is one flat table (one row per sensor per tick), written in a
+single .csv or .jsonl file / blob.
+
+Usage:
+  python -m backend.replay file feeds.csv --out rescored.csv
+  python -m backend.replay raw-dir ./raw --out rescored.jsonl
+  python -m backend.replay thingspeak --start 2026-09-01 --out sep.csv
+  python -m backend.replay snapshots --start 2026-09-01 --end 2026-10-01 --out sep.csv
+"""
+
+import argparse, glob, json, os, time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np, pandas as pd, requests
+
+from .config  import SENSOR_CONFIG
+from .kernels import calibrate, sensor_factors
+from .predict import BufferRegistry, predict_leak_rows
+from .twin    import sensor_columns
+
+THINGSPEAK_FEEDS = "https://api.thingspeak.com/channels/{channel}/feeds.json"
+THINGSPEAK_PAGE  = 8000     # max results per ThingSpeak request
+CHUNK_TICKS      = 2048     # ticks per predict_proba call
+DOWNLOAD_WORKERS = 16       # concurrent raw-blob downloads
+
+
+# ══════════════════════════════════════════════════════════════════
+# NORMALISED FRAME
+# ══════════════════════════════════════════════════════════════════
+# Every source is reduced to the same shape before scoring:
+#   {"sids": [int] * S, "timestamp": [str] * T, "entry_id": [int|None] * T,
+#    "hour": int[T], "pressure": float[T × S] (bar), "flow_lpm": float[T × S]}
+# with columns in the order of the sensors it was built for (default
+# SENSOR_CONFIG; a channel's sensors for a multi-channel deployment).
+
+def _hours(ts: pd.Series) -> np.ndarray:
+    t = pd.to_datetime(ts, utc=True, errors="coerce")
+    return t.dt.hour.fillna(12).to_numpy(dtype=np.int64)
+
+
+def frame_from_feeds(feeds, sensors: list = None) -> dict:
+    """ThingSpeak feed entries (list of dicts or DataFrame) of one channel → frame."""
+    sensors = SENSOR_CONFIG if sensors is None else sensors
+    df = feeds if isinstance(feeds, pd.DataFrame) else pd.DataFrame(list(feeds))
+    if "created_at" in df:
+        df = df.sort_values("created_at", kind="stable")
+    df = df.reset_index(drop=True)
+    T, S = len(df), len(sensors)
+    na = pd.Series([None] * T, dtype=object)
+
+    # T × S raw field values → one calibration kernel call
+    raw_p, raw_f = np.empty((T, S), dtype=object), np.empty((T, S), dtype=object)
+    for j, s in enumerate(sensors):
+        raw_p[:, j] = df.get(s["pressure_field"], na).to_numpy(dtype=object)
+        raw_f[:, j] = df.get(s["flow_field"], na).to_numpy(dtype=object)
+    pressure, flow_lpm = calibrate(raw_p, raw_f, *sensor_factors(sensors))
+
+    ts = df.get("created_at", na)
+    return {
+        "sids":      [s["sensor_id"] for s in sensors],
+        "timestamp": ts.astype(str).tolist(),
+        "entry_id":  df.get("entry_id", na).tolist(),
+        "hour":      _hours(ts),
+        "pressure":  pressure,
+        "flow_lpm":  flow_lpm,
+    }
+
+
+def frame_from_raw(docs, sensors: list = None) -> dict:
+    """Stored {fid}_raw.json documents → frame (missing sensor → invalid)."""
+    sensors = SENSOR_CONFIG if sensors is None else sensors
+    docs = sorted(docs, key=lambda d: d.get("timestamp", ""))
+    T, S = len(docs), len(sensors)
+    pressure = np.zeros((T, S)); flow = np.zeros((T, S))
+    for t, d in enumerate(docs):
+        readings = d.get("sensors", {})
+        for j, s in enumerate(sensors):
+            v = readings.get(f"sensor_{s['sensor_id']}") or {}
+            pressure[t, j] = v.get("pressure_bar", 0.0)
+            flow[t, j]     = v.get("flow_lpm", 0.0)
+    ts = pd.Series([d.get("timestamp") for d in docs], dtype=object)
+    return {
+        "sids":      [s["sensor_id"] for s in sensors],
+        "timestamp": ts.astype(str).tolist(),
+        "entry_id":  [d.get("entry_id") for d in docs],
+        "hour":      _hours(ts),
+        "pressure":  pressure,
+        "flow_lpm":  flow,
+    }
+
+
+def frame_from_snapshots(df: pd.DataFrame, sensors: list = None) -> dict:
+    """Snapshot / replay table (one row per sensor per tick) → frame."""
+    sensors = SENSOR_CONFIG if sensors is None else sensors
+    sids    = [s["sensor_id"] for s in sensors]
+    if df.empty:
+        return frame_from_raw([], sensors)
+    wide = df.pivot_table(index="timestamp", columns="sensor_numeric_id",
+                          values=["pressure", "flow_lpm"], aggfunc="last")
+    wide = wide.sort_index()
+    eids = df.groupby("timestamp")["entry_id"].last().reindex(wide.index)
+    ts   = pd.Series(wide.index, dtype=object)
+    return {
+        "sids":      sids,
+        "timestamp": ts.astype(str).tolist(),
+        "entry_id":  [None if pd.isna(e) else int(e) for e in eids],
+        "hour":      _hours(ts),
+        "pressure":  wide["pressure"].reindex(columns=sids).fillna(0.0).to_numpy(),
+        "flow_lpm":  wide["flow_lpm"].reindex(columns=sids).fillna(0.0).to_numpy(),
+    }
+
+
+# ══════════════════════════════════════════════════════════════════
+# SOURCES
+# ══════════════════════════════════════════════════════════════════
+def load_export(path: str) -> dict:
+    """ThingSpeak export: feeds.json ({"feeds": [...]}) or the CSV export."""
+    if path.lower().endswith(".csv"):
+        return frame_from_feeds(pd.read_csv(path, dtype=str))
+    with open(path) as fh:
+        doc = json.load(fh)
+    return frame_from_feeds(doc.get("feeds", []) if isinstance(doc, dict) else doc)
+
+
+def fetch_thingspeak(channel_id: str, api_key: str, start: str = None,
+                     end: str = None, limit: int = None,
+                     session: requests.Session = None, sensors: list = None) -> dict:
+    """
+    All feed entries in [start, end] (the newest `limit` of them), paged
+    backwards from end.  A page ends at the second of the previous page's
+    oldest entry, inclusive, so entries sharing that second are fetched
+    again and deduplicated on entry_id rather than skipped.
+    """
+    http  = session or requests.Session()
+    url   = THINGSPEAK_FEEDS.format(channel=channel_id)
+    by_id, again = {}, 0            # entry_id → feed; entries the next page repeats
+    while True:
+        results = THINGSPEAK_PAGE if not limit else \
+            min(THINGSPEAK_PAGE, limit - len(by_id) + again)
+        params  = {"api_key": api_key, "results": results}
+        if start: params["start"] = start
+        if end:   params["end"]   = end
+        resp = http.get(url, params=params, timeout=60)
+        resp.raise_for_status()
+        page = resp.json().get("feeds", [])
+        new  = [f for f in page if f["entry_id"] not in by_id]
+        by_id.update((f["entry_id"], f) for f in new)
+        if len(page) < results or not new or (limit and len(by_id) >= limit):
+            break
+        oldest = page[0]["created_at"]
+        again  = sum(f["created_at"] == oldest for f in page)
+        end    = pd.Timestamp(oldest).strftime("%Y-%m-%d %H:%M:%S")
+    feeds = sorted(by_id.values(), key=lambda f: f["entry_id"])
+    if limit:
+        feeds = feeds[-limit:]
+    return frame_from_feeds(feeds, sensors)
+
+
+def fetch_channels(registry, start: str = None, end: str = None, limit: int = None,
+                   session: requests.Session = None) -> list[dict]:
+    """fetch_thingspeak() for every channel of a ChannelRegistry, one frame each."""
+    return [fetch_thingspeak(ch.channel_id, ch.read_api_key, start=start, end=end,
+                             limit=limit, session=session, sensors=ch.sensors)
+            for ch in registry.channels]
+
+
+def load_raw_dir(path: str, prefix: str = "", sensors: list = None) -> dict:
+    """Local directory laid out like the digital-twin-raw container."""
+    docs = []
+    for name in sorted(glob.glob(os.path.join(path, f"{prefix}*_raw.json"))):
+        with open(name) as fh:
+            docs.append(json.load(fh))
+    return frame_from_raw(docs, sensors)
+
+
+def load_raw_container(container, prefix: str = "", sensors: list = None) -> dict:
+    """digital-twin-raw ContainerClient, blobs named {timestamp}_{uuid}_raw.json."""
+    names = sorted(b.name for b in container.list_blobs(name_starts_with=prefix or None)
+                   if b.name.endswith("_raw.json"))
+
+    def _get(name):
+        return json.loads(container.download_blob(name).readall())
+
+    with ThreadPoolExecutor(DOWNLOAD_WORKERS) as pool:
+        docs = list(pool.map(_get, names))
+    return frame_from_raw(docs, sensors)
+
+
+def load_snapshots(container, start, end, sensors: list = None) -> dict:
+    """Parquet snapshots in [start, end) from a container or LocalContainer."""
+    from .snapshots import read_range
+    return frame_from_snapshots(read_range(container, start, end), sensors)
+
+
+# ══════════════════════════════════════════════════════════════════
+# ENGINE
+# ══════════════════════════════════════════════════════════════════
+def replay(frame: dict, chunk_ticks: int = CHUNK_TICKS,
+           buffers: BufferRegistry = None) -> pd.DataFrame:
+    """
+    Score a frame oldest → newest; one model call per chunk_ticks ticks.
+
+    buffers defaults to a fresh registry (seeded with field normals, as
+    after a restart).  Returns one row per sensor per tick with the same
+    fields as a live processed document, prescription flattened into
+    prescription_* columns.
+    """
+    buffers = BufferRegistry() if buffers is None else buffers
+    sids = frame["sids"]
+    P, F, H = frame["pressure"], frame["flow_lpm"], frame["hour"]
+    T, S = len(H), len(sids)
+    if T == 0 or S == 0:
+        return pd.DataFrame()
+
+    results = []
+    for c0 in range(0, T, chunk_ticks):
+        c1 = min(c0 + chunk_ticks, T)
+        rows = [(sid, P[t, j], F[t, j] / 60.0, int(H[t]))
+                for t in range(c0, c1) for j, sid in enumerate(sids)]
+        results += predict_leak_rows(rows, buffers)
+
+    # Records for the whole run at once, tick-major like the rows
+    return pd.DataFrame({
+        "timestamp": [ts  for ts  in frame["timestamp"] for _ in sids],
+        "entry_id":  [eid for eid in frame["entry_id"]  for _ in sids],
+        **sensor_columns(np.tile(sids, T), np.ravel(P), np.ravel(F), results),
+    })
+
+
+def replay_frames(frames: list, chunk_ticks: int = CHUNK_TICKS) -> pd.DataFrame:
+    """
+    replay() of several frames (one per channel) on one buffer registry;
+    every sensor's window only sees its own channel's entries, rows come
+    back in time order.
+    """
+    buffers = BufferRegistry()
+    parts   = [df for df in (replay(f, chunk_ticks, buffers) for f in frames) if len(df)]
+    if not parts:
+        return pd.DataFrame()
+    df = pd.concat(parts, ignore_index=True)
+    return df.sort_values("timestamp", kind="stable").reset_index(drop=True)
+
+
+def summarize(df: pd.DataFrame, seconds: float) -> dict:
+    ticks = df["timestamp"].nunique() if len(df) else 0
+    return {
+        "ticks":         int(ticks),
+        "rows":          int(len(df)),
+        "leak_rows":     int(df["leak"].sum()) if len(df) else 0,
+        "first":         df["timestamp"].iloc[0]  if len(df) else None,
+        "last":          df["timestamp"].iloc[-1] if len(df) else None,
+        "seconds":       round(seconds, 3),
+    }
+
+
+def to_bytes(df: pd.DataFrame, fmt: str) -> bytes:
+    if fmt == "jsonl":
+        return df.to_json(orient="records", lines=True).encode()
+    return df.to_csv(index=False).encode()
+
+
+def write_results(df: pd.DataFrame, path: str):
+    fmt = "jsonl" if path.lower().endswith((".jsonl", ".json")) else "csv"
+    with open(path, "wb") as fh:
+        fh.write(to_bytes(df, fmt))
+
+
+# ══════════════════════════════════════════════════════════════════
+# CLI
+# ══════════════════════════════════════════════════════════════════
+def _load(args) -> list[dict]:
+    """The frames of args.source (one per channel for thingspeak)."""
+    from .channels import ChannelRegistry
+    registry = (ChannelRegistry.from_file(os.environ["CHANNELS_CONFIG"])
+                if os.getenv("CHANNELS_CONFIG") else None)
+    sensors  = registry.sensors if registry is not None else None
+    if args.source == "file":
+        return [load_export(args.path)]
+    if args.source == "raw-dir":
+        return [load_raw_dir(args.path, args.prefix, sensors)]
+    if args.source == "thingspeak":
+        if registry is None:
+            registry = ChannelRegistry.single(os.environ["CHANNEL_ID"],
+                                              os.environ["READ_API_KEY"])
+        return fetch_channels(registry, start=args.start, end=args.end, limit=args.limit)
+    if args.source == "snapshots" and args.path:
+        from .snapshots import LocalContainer
+        return [load_snapshots(LocalContainer(args.path), args.start, args.end, sensors)]
+    from azure.storage.blob import ContainerClient
+    name = args.container or ("digital-twin-processed" if args.source == "snapshots"
+                              else "digital-twin-raw")
+    ctr = ContainerClient.from_connection_string(
+        os.environ["AZURE_STORAGE_CONNECTION_STRING"], name)
+    if args.source == "snapshots":
+        return [load_snapshots(ctr, args.start, args.end, sensors)]
+    return [load_raw_container(ctr, args.prefix, sensors)]
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(prog="python -m backend.replay",
+                                 description="Re-score historical readings.")
+    ap.add_argument("source", choices=["file", "thingspeak", "raw-dir", "raw-blob",
+                                       "snapshots"])
+    ap.add_argument("path", nargs="?", help="export file, raw or snapshot directory")
+    ap.add_argument("--out", required=True, help="output .csv or .jsonl")
+    ap.add_argument("--start", help="ThingSpeak start, 'YYYY-MM-DD HH:MM:SS' UTC")
+    ap.add_argument("--end",   help="ThingSpeak end,   'YYYY-MM-DD HH:MM:SS' UTC")
+    ap.add_argument("--limit", type=int, help="keep only the newest N entries (per channel)")
+    ap.add_argument("--prefix", default="", help="raw blob name prefix, e.g. 2026-09")
+    ap.add_argument("--container", help="blob container (default per source)")
+    ap.add_argument("--chunk", type=int, default=CHUNK_TICKS, help="ticks per model call")
+    args = ap.parse_args(argv)
+    if args.source in ("file", "raw-dir") and not args.path:
+        ap.error(f"{args.source} needs a path")
+    if args.source == "snapshots" and not (args.start and args.end):
+        ap.error("snapshots needs --start and --end")
+
+    t0 = time.perf_counter()
+    df = replay_frames(_load(args), chunk_ticks=args.chunk)
+    write_results(df, args.out)
+    print(json.dumps(summarize(df, time.perf_counter() - t0), indent=2))
+
+
+if __name__ == "__main__":
+    main()
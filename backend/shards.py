@@ -0,0 +1,323 @@
+"""
+shards.py  —  Process-pool sharded inference
+─────────────────────────────────────────────────────────────────────
+predict_leak_rows() runs in the calling process, so features, the
+model call and the latch of a whole tick share one core.  A
+ShardedScorer hashes sensor ids over N worker processes instead:
+
+  - every worker owns the BufferRegistry of its shard and loads the
+    model once, when it starts
+  - per tick the coordinator writes each shard's readings into that
+    worker's shared-memory block, sends it the row count over a pipe
+    and reads the scored arrays back from the same block; only counts,
+    timings and (rarely) state snapshots are pickled
+  - results are assembled into the dicts predict_leak_rows() returns
+    (predict.results_from_arrays), in input order
+
+Shards score concurrently, so a tick costs about as long as the
+slowest shard.  A sensor always hashes to the same shard, so its
+window and latch state never move between processes.  A block grows
+(doubling) when its shard receives more rows than it holds.
+
+export() / load() gather and scatter the buffer state in the
+BufferRegistry snapshot form, so state_store works unchanged.
+models() applies a model registry operation (load a shadow, promote,
+…) in every worker, each of which swaps its own copy.
+"""
+
+import logging, math, multiprocessing as mp, threading, time, warnings
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from . import predict
+
+log = logging.getLogger(__name__)
+
+# ModelRegistry methods a coordinator may apply in every worker
+MODEL_OPS = ("load_async", "promote", "drop_shadow", "reset_stats", "drain", "report")
+
+_IN  = np.dtype([("sid", "<i8"), ("p", "<f8"), ("f", "<f8"), ("hour", "<i8")])
+_OUT = np.dtype([("prob", "<f8"), ("pdrop", "<f8"), ("phys", "?"), ("leak", "?"),
+                 ("prev", "u1"), ("state", "u1")])
+
+
+def shard_of(sids, n_shards: int) -> np.ndarray:
+    """Shard of every sensor id: Fibonacci hash of the id, mod n_shards."""
+    h = np.asarray(sids, dtype=np.int64).astype(np.uint64) * np.uint64(0x9E3779B97F4A7C15)
+    return ((h >> np.uint64(32)) % np.uint64(n_shards)).astype(np.intp)
+
+
+class _Block:
+    """Shared-memory input and output rows of one shard."""
+
+    def __init__(self, capacity: int, name: str = None):
+        size = capacity * (_IN.itemsize + _OUT.itemsize)
+        self.shm      = (shared_memory.SharedMemory(create=True, size=size) if name is None
+                         else shared_memory.SharedMemory(name=name))
+        self.capacity = capacity
+        self.inp      = np.ndarray(capacity, _IN, buffer=self.shm.buf)
+        self.out      = np.ndarray(capacity, _OUT, buffer=self.shm.buf,
+                                   offset=capacity * _IN.itemsize)
+
+    @property
+    def name(self) -> str:
+        return self.shm.name
+
+    def close(self, unlink: bool = False):
+        del self.inp, self.out          # release the buffer exports first
+        self.shm.close()
+        if unlink:
+            self.shm.unlink()
+
+
+# ══════════════════════════════════════════════════════════════════
+# WORKER
+# ══════════════════════════════════════════════════════════════════
+def _worker(conn, ttl_s, max_sensors):
+    """Worker loop: one request in, one ("ok" | "error", payload) out."""
+    # daemon workers can't fork joblib pools; the model runs n_jobs=1 anyway
+    warnings.filterwarnings("ignore", message="Loky-backed parallel loops")
+    try:
+        predict.load_model()
+    except Exception as e:
+        conn.send(("error", f"model load failed: {e!r}"))
+        return
+    reg, block = predict.BufferRegistry(ttl_s=ttl_s, max_sensors=max_sensors), None
+    conn.send(("ok", predict.INFERENCE_ENGINE))
+    while True:
+        try:
+            op, *args = conn.recv()
+        except EOFError:
+            break
+        if op == "stop":
+            break
+        try:
+            if op == "score":
+                n = args[0]
+                x = block.inp[:n]
+                out = predict.score_arrays(x["sid"], x["p"], x["f"], x["hour"], reg)
+                o = block.out[:n]
+                for k in _OUT.names:
+                    o[k] = out[k]
+                conn.send(("ok", (out["seconds"], out["threshold"])))
+            elif op == "block":
+                if block is not None:
+                    block.close()
+                block = _Block(args[1], name=args[0])
+                conn.send(("ok", None))
+            elif op == "export":
+                conn.send(("ok", reg.export()))
+            elif op == "load":
+                reg.load(predict.BufferRegistry.from_arrays(*args[0]))
+                conn.send(("ok", None))
+            elif op == "len":
+                conn.send(("ok", len(reg)))
+            elif op == "models":
+                method, margs = args
+                if method not in MODEL_OPS:
+                    raise ValueError(f"unknown model operation {method!r}")
+                getattr(predict._models, method)(*margs)
+                conn.send(("ok", predict._models.report()))
+            else:
+                conn.send(("error", f"unknown request {op!r}"))
+        except Exception as e:
+            conn.send(("error", repr(e)))
+    if block is not None:
+        block.close()
+
+
+# ══════════════════════════════════════════════════════════════════
+# COORDINATOR
+# ══════════════════════════════════════════════════════════════════
+class ShardedScorer:
+    """
+    predict_leak_rows() / predict_leak_batch() over n_shards worker
+    processes.  Workers start on first use (or start()); ttl_s and
+    max_sensors bound each shard's registry (max_sensors is split
+    evenly across shards).
+    """
+
+    def __init__(self, n_shards: int, ttl_s: float = None, max_sensors: int = None,
+                 capacity: int = 1024, start_method: str = "spawn"):
+        if n_shards < 1:
+            raise ValueError("n_shards must be >= 1")
+        self.n_shards    = n_shards
+        self.ttl_s       = ttl_s
+        self.max_sensors = math.ceil(max_sensors / n_shards) if max_sensors else None
+        self.capacity    = capacity
+        self._ctx        = mp.get_context(start_method)
+        self._lock       = threading.RLock()
+        self._procs, self._conns, self._blocks = [], [], []
+        self._pending    = None         # load() before start()
+
+    @property
+    def started(self) -> bool:
+        return bool(self._procs)
+
+    def start(self):
+        """Spawn the workers and wait until each has loaded the model."""
+        with self._lock:
+            if self.started:
+                return
+            t0 = time.perf_counter()
+            for k in range(self.n_shards):
+                parent, child = self._ctx.Pipe()
+                proc = self._ctx.Process(target=_worker, name=f"twin-shard-{k}", daemon=True,
+                                         args=(child, self.ttl_s, self.max_sensors))
+                proc.start()
+                child.close()
+                self._procs.append(proc); self._conns.append(parent)
+            try:
+                for k in range(self.n_shards):
+                    self._reply(k)
+                    self._blocks.append(None)
+                    self._grow(k, self.capacity)
+            except Exception:
+                self.close()
+                raise
+            log.info("Sharded inference: %d workers ready in %.1f s",
+                     self.n_shards, time.perf_counter() - t0)
+            if self._pending is not None:
+                pending, self._pending = self._pending, None
+                self.load(pending)
+
+    def close(self):
+        """Stop the workers; their buffers are kept for the next start()."""
+        with self._lock:
+            if self.started:
+                try:
+                    self._pending = predict.BufferRegistry.from_arrays(*self.export())
+                except Exception as e:
+                    log.warning("Sharded inference: buffers lost on close: %s", e)
+            for conn in self._conns:
+                try:
+                    conn.send(("stop",))
+                except (BrokenPipeError, OSError):
+                    pass
+            for proc in self._procs:
+                proc.join(timeout=5)
+                if proc.is_alive():
+                    proc.terminate()
+            for block in self._blocks:
+                if block is not None:
+                    block.close(unlink=True)
+            for conn in self._conns:
+                conn.close()
+            self._procs, self._conns, self._blocks = [], [], []
+
+    # ── requests ─────────────────────────────────────────────────
+    def _reply(self, k: int):
+        status, payload = self._conns[k].recv()
+        if status != "ok":
+            raise RuntimeError(f"inference shard {k}: {payload}")
+        return payload
+
+    def _call(self, k: int, *msg):
+        self._conns[k].send(msg)
+        return self._reply(k)
+
+    def _grow(self, k: int, need: int):
+        old = self._blocks[k]
+        cap = old.capacity if old is not None else max(self.capacity, 1)
+        while cap < need:
+            cap *= 2
+        block = _Block(cap)
+        self._call(k, "block", block.name, cap)
+        self._blocks[k] = block
+        if old is not None:
+            old.close(unlink=True)
+
+    # ── scoring ──────────────────────────────────────────────────
+    def score_arrays(self, sids, p, f, hour) -> dict:
+        """predict.score_arrays() across the shards (same output, input order)."""
+        sids = np.asarray(sids, dtype=np.int64)
+        n    = len(sids)
+        out  = {k: np.empty(n, dtype=_OUT[k]) for k in _OUT.names}
+        with self._lock:
+            if not self.started:
+                self.start()
+            shard = shard_of(sids, self.n_shards)
+            sent  = []
+            for k in range(self.n_shards):
+                sel = np.flatnonzero(shard == k)
+                if not sel.size:
+                    continue
+                if sel.size > self._blocks[k].capacity:
+                    self._grow(k, sel.size)
+                x = self._blocks[k].inp[:sel.size]
+                x["sid"], x["p"], x["f"], x["hour"] = (sids[sel], np.asarray(p)[sel],
+                                                       np.asarray(f)[sel], np.asarray(hour)[sel])
+                self._conns[k].send(("score", int(sel.size)))
+                sent.append((k, sel))
+
+            # shards run in parallel: a stage costs its slowest shard
+            seconds   = {"features": 0.0, "predict_proba": 0.0, "decide": 0.0}
+            threshold = predict.ML_THRESHOLD
+            errors    = []
+            for k, sel in sent:
+                try:
+                    took, threshold = self._reply(k)
+                except RuntimeError as e:
+                    errors.append(e)
+                    continue
+                o = self._blocks[k].out[:sel.size]
+                for name in _OUT.names:
+                    out[name][sel] = o[name]
+                for stage, s in took.items():
+                    seconds[stage] = max(seconds[stage], s)
+            if errors:
+                raise errors[0]
+        out["seconds"], out["threshold"] = seconds, threshold
+        return out
+
+    def predict_rows(self, rows, trace: dict = None) -> list[dict]:
+        """predict.predict_leak_rows() on the shards' registries."""
+        rows = list(rows)
+        results, idx = predict.valid_rows(rows)
+        if not idx:
+            return results
+        sids, p, f, hour = zip(*(rows[i] for i in idx))
+        out = self.score_arrays(sids, p, f, hour)
+        return predict.results_from_arrays(rows, results, idx, out, trace)
+
+    def predict_batch(self, readings, hour: int = 12, trace: dict = None) -> list[dict]:
+        """predict.predict_leak_batch() on the shards' registries."""
+        return self.predict_rows(((sid, p, f, hour) for sid, p, f in readings), trace)
+
+    # ── models ───────────────────────────────────────────────────
+    def models(self, method: str, *args) -> list[dict]:
+        """Apply a ModelRegistry operation in every worker; their report()s."""
+        if method not in MODEL_OPS:
+            raise ValueError(f"unknown model operation {method!r}")
+        with self._lock:
+            if not self.started:
+                self.start()
+            return [self._call(k, "models", method, args) for k in range(self.n_shards)]
+
+    # ── buffer state ─────────────────────────────────────────────
+    def __len__(self) -> int:
+        with self._lock:
+            if not self.started:
+                return 0 if self._pending is None else len(self._pending)
+            return sum(self._call(k, "len") for k in range(self.n_shards))
+
+    def export(self) -> tuple:
+        """BufferRegistry.export() of all shards, concatenated."""
+        with self._lock:
+            if not self.started:
+                return (self._pending or predict.BufferRegistry()).export()
+            parts = [self._call(k, "export") for k in range(self.n_shards)]
+        return tuple(np.concatenate(col) for col in zip(*parts))
+
+    def load(self, registry: "predict.BufferRegistry"):
+        """Replace every shard's state with the sensors of a restored registry."""
+        with self._lock:
+            if not self.started:
+                self._pending = registry
+                return
+            arrays = registry.export()
+            shard  = shard_of(arrays[0], self.n_shards)
+            for k in range(self.n_shards):
+                sel = shard == k
+                self._call(k, "load", tuple(a[sel] for a in arrays))
@@ -0,0 +1,190 @@
+"""
+snapshots.py  —  Columnar storage for processed snapshots
+─────────────────────────────────────────────────────────────────────
+Instead of two indented JSON blobs per tick, processed sensor rows are
+buffered in memory and flushed every SNAPSHOT_FLUSH_S seconds as one
+Parquet file per hour partition:
+
+  snapshots/date=YYYY-MM-DD/hour=HH/part-HHMMSS-<id>.parquet
+
+Parquet cannot be appended in place, so each flush writes a new part
+file; at the default 300 s that is 288 small, compressed blobs per day
+instead of ~11k JSON pairs, and a date range is read by listing only
+the partitions it covers.  latest.json (live view) is unaffected.
+
+Rows are twin.flat_record() rows: one per sensor per tick, the same
+table replay.py produces.
+
+Storage is any object with the ContainerClient methods used here
+(upload_blob, list_blobs, download_blob); LocalContainer is a
+directory-backed stand-in for development and tests.
+"""
+
+import glob, io, os, threading, time, uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+import pandas as pd
+
+from .twin import flat_record
+
+SNAPSHOT_PREFIX  = "snapshots"
+DOWNLOAD_WORKERS = 16
+
+
+def partition_of(timestamp: str) -> str:
+    """'2026-10-17T03:24:01.297' → 'date=2026-10-17/hour=03'."""
+    return f"date={timestamp[:10]}/hour={timestamp[11:13]}"
+
+
+# ══════════════════════════════════════════════════════════════════
+# LOCAL STAND-IN FOR A BLOB CONTAINER
+# ══════════════════════════════════════════════════════════════════
+class _LocalBlob:
+    def __init__(self, name: str):
+        self.name = name
+
+
+class _LocalDownload:
+    def __init__(self, path: str):
+        self._path = path
+
+    def readall(self) -> bytes:
+        with open(self._path, "rb") as fh:
+            return fh.read()
+
+
+class LocalContainer:
+    """Directory with the ContainerClient subset used by this module."""
+
+    def __init__(self, root: str):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    def upload_blob(self, name: str, data, overwrite: bool = False):
+        path = os.path.join(self.root, name)
+        if os.path.exists(path) and not overwrite:
+            raise FileExistsError(name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as fh:
+            fh.write(data if isinstance(data, bytes) else data.encode())
+
+    def list_blobs(self, name_starts_with: str = None):
+        pattern = os.path.join(self.root, "**", "*")
+        for path in sorted(glob.glob(pattern, recursive=True)):
+            if os.path.isfile(path):
+                name = os.path.relpath(path, self.root).replace(os.sep, "/")
+                if not name_starts_with or name.startswith(name_starts_with):
+                    yield _LocalBlob(name)
+
+    def download_blob(self, name: str) -> _LocalDownload:
+        return _LocalDownload(os.path.join(self.root, name))
+
+
+# ══════════════════════════════════════════════════════════════════
+# WRITER
+# ══════════════════════════════════════════════════════════════════
+class SnapshotWriter:
+    """
+    Buffers processed documents; flush() writes one Parquet part per
+    hour partition present in the buffer.  Thread-safe: add() is called
+    from the ingestion thread, flush() from wherever is convenient.
+    """
+
+    def __init__(self, container, flush_interval_s: float = 300.0,
+                 prefix: str = SNAPSHOT_PREFIX):
+        self.container        = container
+        self.flush_interval_s = flush_interval_s
+        self.prefix           = prefix
+        self._rows: list      = []
+        self._lock            = threading.Lock()
+        self._last_flush      = time.monotonic()
+
+    def add(self, proc_out: dict):
+        """Buffer every sensor of one processed document."""
+        ts, eid = proc_out["timestamp"], proc_out.get("entry_id")
+        rows = [flat_record(ts, eid, rec) for rec in proc_out["sensors"]]
+        with self._lock:
+            self._rows.extend(rows)
+
+    @property
+    def pending(self) -> int:
+        return len(self._rows)
+
+    def due(self) -> bool:
+        return bool(self._rows) and \
+            time.monotonic() - self._last_flush >= self.flush_interval_s
+
+    def flush(self) -> list[str]:
+        """Write buffered rows; returns the blob names written.
+
+        On upload failure the rows are put back for the next flush.
+        """
+        with self._lock:
+            rows, self._rows = self._rows, []
+            self._last_flush = time.monotonic()
+        if not rows:
+            return []
+
+        df    = pd.DataFrame(rows)
+        parts = df["timestamp"].map(partition_of)
+        stamp, tag = datetime.utcnow().strftime("%H%M%S"), uuid.uuid4().hex[:8]
+        names, written = [], set()
+        try:
+            for part, group in df.groupby(parts, sort=True):
+                name = f"{self.prefix}/{part}/part-{stamp}-{tag}.parquet"
+                buf  = io.BytesIO()
+                group.to_parquet(buf, index=False, compression="zstd")
+                self.container.upload_blob(name, buf.getvalue(), overwrite=True)
+                names.append(name); written.add(part)
+        except Exception:
+            keep = df[~parts.isin(written)].to_dict("records")
+            with self._lock:
+                self._rows[:0] = keep
+            raise
+        return names
+
+
+# ══════════════════════════════════════════════════════════════════
+# READER
+# ══════════════════════════════════════════════════════════════════
+def _naive_utc(x) -> datetime:
+    t = pd.Timestamp(x)
+    return (t.tz_convert(None) if t.tzinfo else t).to_pydatetime()
+
+
+def _hour_partitions(start: datetime, end: datetime) -> list[str]:
+    t = start.replace(minute=0, second=0, microsecond=0)
+    out = []
+    while t < end:
+        out.append(f"date={t:%Y-%m-%d}/hour={t:%H}")
+        t += timedelta(hours=1)
+    return out
+
+
+def read_range(container, start, end, prefix: str = SNAPSHOT_PREFIX) -> pd.DataFrame:
+    """
+    All snapshot rows with start <= timestamp < end (UTC, naive or ISO
+    strings), sorted by timestamp.  Only partitions in range are listed.
+    """
+    start, end = _naive_utc(start), _naive_utc(end)
+    wanted = set(_hour_partitions(start, end))
+    names  = []
+    for day in sorted({p.split("/")[0] for p in wanted}):
+        for b in container.list_blobs(name_starts_with=f"{prefix}/{day}/"):
+            part = "/".join(b.name.split("/")[1:3])
+            if b.name.endswith(".parquet") and part in wanted:
+                names.append(b.name)
+
+    def _get(name):
+        return pd.read_parquet(io.BytesIO(container.download_blob(name).readall()))
+
+    with ThreadPoolExecutor(DOWNLOAD_WORKERS) as pool:
+        parts = list(pool.map(_get, names))
+    if not parts:
+        return pd.DataFrame()
+
+    df = pd.concat(parts, ignore_index=True)
+    ts = pd.to_datetime(df["timestamp"], utc=True, format="ISO8601").dt.tz_localize(None)
+    df = df[(ts >= start) & (ts < end)]
+    return df.sort_values(["timestamp", "sensor_numeric_id"], kind="stable").reset_index(drop=True)
@@ -0,0 +1,154 @@
+"""
+state_store.py  —  Persisted SensorBuffer state
+─────────────────────────────────────────────────────────────────────
+Without this, every restart or new worker re-seeds each SensorBuffer
+with field normals, losing the 12-reading window and any latched /
+recovering alert.
+
+A snapshot of the whole buffer registry is one compact binary blob:
+
+  header   <4sHHQII   magic b"DTSB", format version, WINDOW,
+                      seq (bumped on every save), channel count,
+                      sensor count
+  channels numpy structured array, one row per ThingSpeak channel:
+             channel i8 · entry_id i8  (last ingested entry)
+  records  numpy structured array, one row per sensor:
+             sid i8 · state u1 · stable u2 · p f8[WINDOW] · f f8[WINDOW]
+           windows stored oldest → newest
+
+Backends (STATE_STORE):
+  file:/path/state.bin   atomic replace on save, mmap on load,
+                         flock(path + ".lock") for cross-process locking
+  redis://host:6379/0    any Redis-compatible server (Redis, Valkey,
+                         a local container as stand-in); key STATE_KEY
+
+Both expose load() → bytes | None, save(bytes) and lock(), a
+cross-process mutual-exclusion context used when several workers share
+one state (STATE_SHARED=1).
+"""
+
+import contextlib, mmap, os, struct
+
+import numpy as np
+
+from .predict import STATES, WINDOW, BufferRegistry
+
+MAGIC   = b"DTSB"
+VERSION = 2             # 1: one entry_id in the header, single channel
+_HEADER = struct.Struct("<4sHHQII")
+
+_CHANNEL = np.dtype([("channel", "<i8"), ("entry_id", "<i8")])
+_RECORD  = np.dtype([("sid",    "<i8"),
+                     ("state",  "u1"),
+                     ("stable", "<u2"),
+                     ("p",      "<f8", (WINDOW,)),
+                     ("f",      "<f8", (WINDOW,))])
+
+
+# ══════════════════════════════════════════════════════════════════
+# BINARY SNAPSHOT
+# ══════════════════════════════════════════════════════════════════
+def dump_buffers(buffers: BufferRegistry, seq: int = 0, entry_ids: dict = None) -> bytes:
+    """
+    Buffer registry (and channel_id → last ingested entry_id) →
+    snapshot bytes.
+    """
+    eids = {c: e for c, e in (entry_ids or {}).items() if e is not None}
+    chn  = np.array([(int(c), int(e)) for c, e in eids.items()], dtype=_CHANNEL)
+    sid, state, stable, p, f = buffers.export()
+    rec  = np.zeros(len(sid), dtype=_RECORD)
+    rec["sid"], rec["state"], rec["stable"], rec["p"], rec["f"] = sid, state, stable, p, f
+    head = _HEADER.pack(MAGIC, VERSION, WINDOW, seq, len(chn), len(rec))
+    return head + chn.tobytes() + rec.tobytes()
+
+
+def read_header(data) -> tuple:
+    """(seq, channel count, sensor count) without decoding the records."""
+    magic, version, window, seq, n_chn, count = _HEADER.unpack_from(data, 0)
+    if magic != MAGIC:
+        raise ValueError("not a SensorBuffer snapshot")
+    if version != VERSION:
+        raise ValueError(f"snapshot format v{version}, expected v{VERSION}")
+    if window != WINDOW:
+        raise ValueError(f"snapshot WINDOW={window}, model expects {WINDOW}")
+    return seq, n_chn, count
+
+
+def load_buffers(data) -> tuple:
+    """Snapshot bytes → (BufferRegistry, seq, {channel_id: entry_id})."""
+    seq, n_chn, count = read_header(data)
+    chn = np.frombuffer(data, dtype=_CHANNEL, count=n_chn, offset=_HEADER.size)
+    rec = np.frombuffer(data, dtype=_RECORD, count=count,
+                        offset=_HEADER.size + chn.nbytes)
+    if (rec["state"] >= len(STATES)).any():
+        raise ValueError("unknown latch state in snapshot")
+    buffers = BufferRegistry.from_arrays(rec["sid"], rec["state"], rec["stable"],
+                                         rec["p"], rec["f"])
+    return buffers, seq, {int(c): int(e) for c, e in chn}
+
+
+# ══════════════════════════════════════════════════════════════════
+# BACKENDS
+# ══════════════════════════════════════════════════════════════════
+class FileStateStore:
+    def __init__(self, path: str):
+        self.path = path
+        d = os.path.dirname(os.path.abspath(path))
+        os.makedirs(d, exist_ok=True)
+
+    def load(self):
+        try:
+            with open(self.path, "rb") as fh:
+                if os.fstat(fh.fileno()).st_size == 0:
+                    return None
+                with mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                    return bytes(mm)
+        except FileNotFoundError:
+            return None
+
+    def save(self, data: bytes):
+        tmp = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as fh:
+            fh.write(data)
+            fh.flush(); os.fsync(fh.fileno())
+        os.replace(tmp, self.path)
+
+    @contextlib.contextmanager
+    def lock(self):
+        import fcntl
+        with open(self.path + ".lock", "a") as fh:
+            fcntl.flock(fh, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(fh, fcntl.LOCK_UN)
+
+
+class RedisStateStore:
+    def __init__(self, url: str, key: str = "digital-twin:buffers",
+                 lock_timeout_s: float = 30.0):
+        import redis
+        self.client = redis.Redis.from_url(url)
+        self.key = key
+        self.lock_timeout_s = lock_timeout_s
+
+    def load(self):
+        return self.client.get(self.key)
+
+    def save(self, data: bytes):
+        self.client.set(self.key, data)
+
+    def lock(self):
+        return self.client.lock(self.key + ":lock", timeout=self.lock_timeout_s,
+                                blocking_timeout=self.lock_timeout_s)
+
+
+def open_store(spec: str, key: str = "digital-twin:buffers"):
+    """STATE_STORE value → backend, or None when empty."""
+    if not spec:
+        return None
+    if spec.startswith(("redis://", "rediss://", "unix://")):
+        return RedisStateStore(spec, key)
+    if spec.startswith("file:"):
+        return FileStateStore(spec[len("file:"):])
+    raise ValueError(f"Unsupported STATE_STORE: {spec}")
@@ -0,0 +1,132 @@
+"""
+stream.py  —  Server-Sent Events feed of the twin state
+─────────────────────────────────────────────────────────────────────
+The ingestion loop publishes each new processed document once; every
+/stream client then receives the same pre-encoded bytes, so viewers
+cost no model runs and almost no CPU.
+
+Events (text/event-stream, data is JSON):
+  snapshot      on connect (and after a client fell behind): all
+                prescriptions seen so far, static sensor metadata and
+                every sensor's full state
+  prescription  a prescription text not sent before:
+                {"id", "severity", "action_type", "failure_type",
+                 "repair_strategy"}
+  delta         {"timestamp", "entry_id", "sensors": [...]}: only the
+                sensors that changed, each with sensor_numeric_id and
+                only its changed fields; "prescription" is an id.  A
+                sensor's first delta also carries its static metadata
+A ": keepalive" comment is sent after STREAM_KEEPALIVE_S of silence.
+
+Client state = snapshot, then apply deltas field by field.
+"""
+
+import asyncio, json
+
+from . import metrics
+
+# Per-sensor fields that never change (snapshot and a sensor's first delta only)
+STATIC_FIELDS = ("pressure_sensor_id", "flow_sensor_id", "pipe_id")
+PRESCRIPTION_FIELDS = ("severity", "action_type", "failure_type", "repair_strategy")
+
+STREAM_BYTES = metrics.Counter("twin_stream_bytes_total",
+                               "SSE bytes published, per client", ("event",))
+
+
+def _sse(event: str, data) -> str:
+    body = json.dumps(data, separators=(",", ":"))
+    return f"event: {event}\ndata: {body}\n\n"
+
+
+class StreamHub:
+    """
+    Latest compact state per sensor + fan-out queues, one per client.
+
+    publish() runs on the event loop (the async ingestion pipeline);
+    subscribe() is the async generator behind one /stream response.
+    """
+
+    def __init__(self, keepalive_s: float = 15.0, max_queue: int = 64):
+        self.keepalive_s = keepalive_s
+        self.max_queue   = max_queue
+        self._rx: dict       = {}      # prescription tuple → id
+        self._rx_docs: list  = []      # id → prescription dict
+        self._static: dict   = {}      # sid → static metadata
+        self._sensors: dict  = {}      # sid → last published state
+        self._head: dict     = {"timestamp": None, "entry_id": None}
+        self._subs: set      = set()
+
+    @property
+    def clients(self) -> int:
+        return len(self._subs)
+
+    def _rx_id(self, pres: dict, new: list) -> int:
+        key = tuple(pres.get(k, "") for k in PRESCRIPTION_FIELDS)
+        rid = self._rx.get(key)
+        if rid is None:
+            rid = self._rx[key] = len(self._rx_docs)
+            doc = {"id": rid, **dict(zip(PRESCRIPTION_FIELDS, key))}
+            self._rx_docs.append(doc)
+            new.append(doc)
+        return rid
+
+    def _snapshot(self) -> str:
+        return _sse("snapshot", {
+            **self._head,
+            "prescriptions": self._rx_docs,
+            "static":  [{"sensor_numeric_id": sid, **m} for sid, m in self._static.items()],
+            "sensors": [{"sensor_numeric_id": sid, **s} for sid, s in self._sensors.items()],
+        })
+
+    def publish(self, proc_out: dict):
+        """Diff one processed document against the last and fan it out."""
+        new_rx, changed = [], []
+        for rec in proc_out.get("sensors", []):
+            sid = rec["sensor_numeric_id"]
+            static = self._static.get(sid)
+            if static is None:
+                static = self._static[sid] = {k: rec.get(k) for k in STATIC_FIELDS}
+            cur = {k: v for k, v in rec.items()
+                   if k not in STATIC_FIELDS and k not in ("sensor_numeric_id", "prescription")}
+            cur["prescription"] = self._rx_id(rec.get("prescription", {}), new_rx)
+
+            last = self._sensors.get(sid)
+            diff = ({**static, **cur} if last is None else
+                    {k: v for k, v in cur.items() if last.get(k) != v})
+            self._sensors[sid] = cur
+            if diff:
+                changed.append({"sensor_numeric_id": sid, **diff})
+
+        self._head = {"timestamp": proc_out.get("timestamp"),
+                      "entry_id":  proc_out.get("entry_id")}
+        msgs = [("prescription", _sse("prescription", d)) for d in new_rx]
+        if changed:
+            msgs.append(("delta", _sse("delta", {**self._head, "sensors": changed})))
+        for event, msg in msgs:
+            STREAM_BYTES.inc(event, amount=len(msg) * len(self._subs))
+            self._fan_out(msg)
+
+    def _fan_out(self, msg: str):
+        for q in self._subs:
+            try:
+                q.put_nowait(msg)
+            except asyncio.QueueFull:
+                # slow client: drop its backlog, resynchronise with a snapshot
+                while not q.empty():
+                    q.get_nowait()
+                q.put_nowait(self._snapshot())
+
+    async def subscribe(self):
+        q = asyncio.Queue(maxsize=self.max_queue)
+        self._subs.add(q)
+        try:
+            snap = self._snapshot()
+            STREAM_BYTES.inc("snapshot", amount=len(snap))
+            yield snap
+            while True:
+                try:
+                    yield await asyncio.wait_for(q.get(), timeout=self.keepalive_s)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+        finally:
+            self._subs.discard(q)
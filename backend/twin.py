@@ -0,0 +1,170 @@
+"""
+twin.py  —  Per-sensor calibration and processed-record assembly
+─────────────────────────────────────────────────────────────────────
+The pieces of the digital twin loop that do not touch the network:
+  calibrate()      ThingSpeak field values → bar / lpm
+  sensor_record()  predict_leak() result → processed sensor document
+                   (prescription attached when a leak is reported)
+  flat_record()    one sensor document as a flat table row
+  sensor_columns() sensor_record() for many readings at once, as
+                   flat_record() columns (bulk replay)
+
+Shared by main.py (live ingestion) and replay.py (historical backfill)
+so both produce identical processed output.
+"""
+
+import math
+
+import numpy as np
+
+from . import kernels
+from .config import (PIPE_AREA, FIELD_FLOW_LPM, FIELD_PRESSURE_BAR,
+                     FLOW_FACTOR, PRESSURE_FACTOR, FLOW_MAX_LPM,
+                     PRESSURE_MAX_BAR, SENSOR_META)
+from .prescribe import get_prescription, get_prescriptions
+
+
+def _float(x, default: float) -> float:
+    try:
+        v = float(x)
+        return default if (math.isnan(v) or math.isinf(v)) else v
+    except Exception:
+        return default
+
+def _clean(d: dict) -> dict:
+    """Replace NaN/Inf so JSON serialisation never fails."""
+    return {k: (0.0 if isinstance(v, float) and (math.isnan(v) or math.isinf(v)) else v)
+            for k, v in d.items()}
+
+
+def calibrate(feed: dict, s: dict) -> tuple:
+    """
+    (pressure_bar, flow_lpm) for one SENSOR_CONFIG entry of a feed.
+    The entry may carry its own "pressure_factor" / "flow_factor".
+    """
+    pf = s.get("pressure_factor", PRESSURE_FACTOR)
+    ff = s.get("flow_factor",     FLOW_FACTOR)
+    p_raw = max(_float(feed.get(s["pressure_field"]), FIELD_PRESSURE_BAR / pf), 0.0)
+    f_raw = max(_float(feed.get(s["flow_field"]),     FIELD_FLOW_LPM / ff),     0.0)
+
+    flow_lpm = min(f_raw * ff, FLOW_MAX_LPM)
+    pressure = min(p_raw * pf, PRESSURE_MAX_BAR)
+    return pressure, flow_lpm
+
+
+def sensor_record(sid: int, pressure: float, flow_lpm: float, result: dict) -> dict:
+    """Processed document for one sensor (one element of proc_out["sensors"])."""
+    leak_lps  = _float(result.get("Leak_Magnitude_LPS"), 0.0)
+    leak_lpm  = _float(result.get("Leak_Magnitude_LPM"), leak_lps*60)
+    leak_area = _float(result.get("Leak_Area_mm2"),       0.0)
+    leak_dia  = _float(result.get("Leak_Diameter_mm"),    0.0)
+    prob      = _float(result.get("prob"),                 0.0)
+
+    # Prescription
+    prescription = {
+        "severity": "Normal", "action_type": "No action required",
+        "failure_type": "", "repair_strategy": "",
+    }
+    size_ratio = 0.0
+
+    if result.get("leak") == 1:
+        size_ratio = (leak_area / PIPE_AREA) if PIPE_AREA > 0 else 0.0
+        pres = _clean(get_prescription(size_ratio, leak_lps))
+        prescription = {
+            "severity":        pres.get("severity",        "N/A"),
+            "action_type":     pres.get("action_type",     "N/A"),
+            "failure_type":    pres.get("failure_type",    "N/A"),
+            "repair_strategy": pres.get("repair_strategy", "N/A"),
+        }
+
+    meta = SENSOR_META.get(sid, {})
+    return _clean({
+        "sensor_numeric_id":  sid,
+        "pressure_sensor_id": meta.get("pressure_sensor_id"),
+        "flow_sensor_id":     meta.get("flow_sensor_id"),
+        "pipe_id":            meta.get("pipe_id"),
+
+        "pressure":           round(pressure, 3),   # bar
+        "flow_lpm":           round(flow_lpm, 2),   # lpm
+
+        "leak":               int(result.get("leak", 0)),
+        "probability":        round(prob, 4),
+        "physics_fired":      bool(result.get("physics_fired", False)),
+        "p_drop_pct":         round(_float(result.get("p_drop_pct"), 0.0), 4),
+
+        "leak_lpm":           round(leak_lpm, 2),
+        "leak_area_mm2":      leak_area,
+        "leak_diameter_mm":   leak_dia,
+        "leak_size_ratio":    round(size_ratio, 5),
+        "alert_state": result.get("alert_state", "normal"),
+
+        "prescription":       prescription,
+    })
+
+
+def flat_record(timestamp: str, entry_id, rec: dict) -> dict:
+    """Table row for one sensor document; prescription → prescription_*."""
+    row = {"timestamp": timestamp, "entry_id": entry_id}
+    for k, v in rec.items():
+        if k == "prescription":
+            row.update({f"prescription_{pk}": pv for pk, pv in v.items()})
+        else:
+            row[k] = v
+    return row
+
+
+def sensor_columns(sids, pressure, flow_lpm, results: list) -> dict:
+    """
+    sensor_record() + flat_record() for N readings at once: column name
+    → array / list of N values, without timestamp / entry_id.  Same
+    values as the row-wise path; only leaking rows look up a
+    prescription.
+    """
+    def col(key, default):
+        return kernels.to_float([r.get(key) for r in results], default)
+
+    leak_lps  = col("Leak_Magnitude_LPS", 0.0)
+    leak_lpm  = col("Leak_Magnitude_LPM", leak_lps * 60)
+    leak_area = col("Leak_Area_mm2",      0.0)
+    leak_dia  = col("Leak_Diameter_mm",   0.0)
+    prob      = col("prob",               0.0)
+    p_drop    = col("p_drop_pct",         0.0)
+
+    leaking    = np.array([r.get("leak") == 1 for r in results], dtype=bool)
+    size_ratio = np.zeros(len(results))
+    if PIPE_AREA > 0:
+        size_ratio[leaking] = leak_area[leaking] / PIPE_AREA
+
+    pres = {"severity":        ["Normal"] * len(results),
+            "action_type":     ["No action required"] * len(results),
+            "failure_type":    [""] * len(results),
+            "repair_strategy": [""] * len(results)}
+    idx = np.flatnonzero(leaking)
+    for k, rx in zip(idx.tolist(), get_prescriptions(size_ratio[idx], leak_lps[idx])):
+        rx = _clean(rx)
+        for field, values in pres.items():
+            values[k] = rx.get(field, "N/A")
+
+    metas = [SENSOR_META.get(sid, {}) for sid in sids]
+    return {
+        "sensor_numeric_id":  np.asarray(sids),
+        "pressure_sensor_id": [m.get("pressure_sensor_id") for m in metas],
+        "flow_sensor_id":     [m.get("flow_sensor_id") for m in metas],
+        "pipe_id":            [m.get("pipe_id") for m in metas],
+
+        "pressure":           kernels.clean(np.round(pressure, 3)),
+        "flow_lpm":           kernels.clean(np.round(flow_lpm, 2)),
+
+        "leak":               np.array([int(r.get("leak", 0)) for r in results], dtype=np.int64),
+        "probability":        np.round(prob, 4),
+        "physics_fired":      np.array([bool(r.get("physics_fired", False)) for r in results]),
+        "p_drop_pct":         np.round(p_drop, 4),
+
+        "leak_lpm":           np.round(leak_lpm, 2),
+        "leak_area_mm2":      leak_area,
+        "leak_diameter_mm":   leak_dia,
+        "leak_size_ratio":    np.round(size_ratio, 5),
+        "alert_state":        [r.get("alert_state", "normal") for r in results],
+
+        **{f"prescription_{k}": v for k, v in pres.items()},
+    }
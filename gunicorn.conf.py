@@ -0,0 +1,24 @@
+"""
+gunicorn.conf.py  —  Multi-worker serving with a pre-forked model
+─────────────────────────────────────────────────────────────────────
+  gunicorn -c gunicorn.conf.py backend.main:app
+
+The master imports the app once with STARTUP_MODE=preload (model
+loaded, then gc.freeze()), and every worker forked from it shares the
+model pages copy-on-write instead of loading its own copy.  Blob
+clients and HTTP sessions are created lazily, so no socket crosses
+the fork.
+
+Each worker runs its own ingestion scheduler: use STATE_SHARED=1 with
+a shared STATE_STORE, or INGEST_SCHEDULER=0 on all but one instance.
+"""
+
+import os
+
+os.environ.setdefault("STARTUP_MODE", "preload")
+
+bind         = f"0.0.0.0:{os.getenv('PORT', '8000')}"
+workers      = int(os.getenv("WEB_CONCURRENCY", "2"))
+worker_class = "uvicorn.workers.UvicornWorker"
+preload_app  = True
+timeout      = 120
@@ -0,0 +1,257 @@
+"""
+Shared fixtures: synthetic streams, golden traces and an importable
+backend.main with ThingSpeak and Azure Blob replaced by local stand-ins.
+
+  pytest                        golden checks (benchmarks are skipped)
+  pytest --benchmark-only       benchmarks only
+  pytest -o addopts=""          golden checks + benchmarks
+  pytest --record-golden        rewrite tests/golden/*.json from the
+                                current implementation (review the diff!)
+"""
+
+import json, os
+from datetime import datetime
+from unittest import mock
+
+import numpy as np
+import pytest
+
+GOLDEN_DIR = os.path.join(os.path.dirname(__file__), "golden")
+
+# backend.main reads these at import time; nothing listens on port 1
+os.environ.setdefault("CHANNEL_ID", "0")
+os.environ.setdefault("READ_API_KEY", "test")
+os.environ.setdefault(
+    "AZURE_STORAGE_CONNECTION_STRING",
+    "DefaultEndpointsProtocol=http;AccountName=devstoreaccount1;"
+    "AccountKey=Eby8vdM02xNOcqFlqUwJPLlmEtlCDXJ1OUzFT50uSRZ6IFsuFq2UVErCz4I6tq/"
+    "K1SZFPTOtr/KBHBeksoGMGw==;BlobEndpoint=http://127.0.0.1:1/devstoreaccount1;")
+os.environ.setdefault("INGEST_SCHEDULER", "0")
+os.environ["STATE_STORE"] = ""
+
+
+def pytest_addoption(parser):
+    parser.addoption("--record-golden", action="store_true",
+                     help="rewrite golden traces instead of comparing")
+
+
+# ══════════════════════════════════════════════════════════════════
+# GOLDEN TRACES
+# ══════════════════════════════════════════════════════════════════
+# One trace per stream: every (tick, sensor) decision, column-wise.
+# Discrete fields must match exactly; prob / magnitude to rounding.
+_DISCRETE = ("leak", "alert_state", "physics_fired", "severity", "action_type")
+_NUMERIC  = {"probability": 1e-4, "leak_lpm": 1e-2, "leak_area_mm2": 1e-4}
+
+
+def trace_of(records) -> dict:
+    """
+    sensor_record() documents or flat_record() rows, tick-major →
+    column-wise trace.
+    """
+    cols = {k: [] for k in (*_DISCRETE, *_NUMERIC)}
+    for r in records:
+        pres = r.get("prescription") or {"severity":    r["prescription_severity"],
+                                         "action_type": r["prescription_action_type"]}
+        cols["leak"].append(int(r["leak"]))
+        cols["alert_state"].append(r["alert_state"])
+        cols["physics_fired"].append(bool(r["physics_fired"]))
+        cols["severity"].append(pres["severity"])
+        cols["action_type"].append(pres["action_type"])
+        for k in _NUMERIC:
+            cols[k].append(float(r[k]))
+    return cols
+
+
+def _encode(trace: dict) -> dict:
+    """String columns → {"values": vocabulary, "codes": [index]}."""
+    out = {}
+    for k, col in trace.items():
+        if col and isinstance(col[0], str):
+            vocab = sorted(set(col))
+            index = {v: i for i, v in enumerate(vocab)}
+            col   = {"values": vocab, "codes": [index[v] for v in col]}
+        out[k] = col
+    return out
+
+
+def _decode(data: dict) -> dict:
+    return {k: [col["values"][c] for c in col["codes"]] if isinstance(col, dict) else col
+            for k, col in data.items()}
+
+
+class Golden:
+    def __init__(self, record: bool):
+        self.record = record
+
+    def check(self, name: str, trace: dict):
+        path = os.path.join(GOLDEN_DIR, f"{name}.json")
+        if self.record:
+            with open(path, "w") as fh:
+                fh.write("{\n" + ",\n".join(
+                    f"{json.dumps(k)}: {json.dumps(v, separators=(',', ':'))}"
+                    for k, v in _encode(trace).items()) + "\n}\n")
+            return
+        if not os.path.exists(path):
+            pytest.fail(f"no golden trace {path}; run pytest --record-golden")
+        with open(path) as fh:
+            want = _decode(json.load(fh))
+
+        n = len(want["leak"])
+        assert len(trace["leak"]) == n, "trace length changed"
+        for k in _DISCRETE:
+            bad = [i for i in range(n) if trace[k][i] != want[k][i]]
+            assert not bad, (f"{name}: {k} differs at {len(bad)} of {n} readings, "
+                             f"first at #{bad[0]}: {trace[k][bad[0]]!r} != {want[k][bad[0]]!r}")
+        for k, tol in _NUMERIC.items():
+            np.testing.assert_allclose(trace[k], want[k], rtol=1e-6, atol=tol,
+                                       err_msg=f"{name}: {k}")
+
+
+@pytest.fixture(scope="session")
+def golden(request):
+    return Golden(request.config.getoption("--record-golden"))
+
+
+# ══════════════════════════════════════════════════════════════════
+# backend.main WITH LOCAL STAND-INS
+# ══════════════════════════════════════════════════════════════════
+@pytest.fixture(scope="session")
+def main_module():
+    with mock.patch("azure.storage.blob.ContainerClient.create_container"):
+        from backend import main
+    return main
+
+
+class FakeThingSpeak:
+    """requests.Session.get stand-in serving one feed per call."""
+
+    def __init__(self, feeds):
+        self.feeds, self.i = list(feeds), 0
+
+    def get(self, url, timeout=None):
+        feed = self.feeds[min(self.i, len(self.feeds) - 1)]
+        self.i += 1
+        resp = mock.Mock()
+        resp.json.return_value = {"channel": {}, "feeds": [feed]}
+        resp.raise_for_status.return_value = None
+        return resp
+
+
+class _AioResponse:
+    def __init__(self, payload):
+        self.payload = payload
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    def raise_for_status(self):
+        pass
+
+    async def json(self, content_type=None):
+        return self.payload
+
+
+class FakeAioHttp:
+    """aiohttp.ClientSession stand-in serving one feed per get()."""
+
+    def __init__(self, feeds):
+        self.feeds, self.gets = list(feeds), 0
+
+    def get(self, url):
+        feed = self.feeds[min(self.gets, len(self.feeds) - 1)]
+        self.gets += 1
+        return _AioResponse({"channel": {}, "feeds": [feed]})
+
+
+class FakeBlobService:
+    """Async BlobServiceClient stand-in: uploads land in .writes; names
+    ending in one of `fail` raise instead."""
+
+    def __init__(self, fail=()):
+        self.writes, self.fail = [], tuple(fail)
+
+    def get_blob_client(self, container, name):
+        svc = self
+
+        class _Blob:
+            async def upload_blob(self, body, overwrite=False):
+                if name.endswith(svc.fail):
+                    raise OSError(f"{name}: blob storage unreachable")
+                svc.writes.append((container, name))
+        return _Blob()
+
+
+async def asgi_request(app, path: str, headers: dict = None, method: str = "GET") -> tuple:
+    """One request straight through the ASGI app → (status, headers, body)."""
+    path, _, query = path.partition("?")
+    scope = {"type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1",
+             "method": method, "scheme": "http", "path": path, "raw_path": path.encode(),
+             "query_string": query.encode(), "root_path": "",
+             "headers": [(k.lower().encode(), v.encode()) for k, v in (headers or {}).items()],
+             "client": ("test", 1), "server": ("test", 80)}
+    sent = []
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        sent.append(message)
+
+    await app(scope, receive, send)
+    start = next(m for m in sent if m["type"] == "http.response.start")
+    body  = b"".join(m.get("body", b"") for m in sent if m["type"] == "http.response.body")
+    return start["status"], {k.decode(): v.decode() for k, v in start["headers"]}, body
+
+
+@pytest.fixture
+def twin(main_module, tmp_path, monkeypatch):
+    """
+    main with fresh buffers, ThingSpeak served from a feed list
+    (twin.serve(feeds), or twin.serve_async(feeds) for the async
+    pipeline), blobs kept in twin.blobs and snapshots written to a
+    LocalContainer under tmp_path.
+    """
+    from backend import predict
+    from backend.snapshots import LocalContainer
+
+    main = main_module
+    monkeypatch.setattr(predict, "_buffers", predict.BufferRegistry())
+    monkeypatch.setitem(main._last, "entry_ids", {})
+    monkeypatch.setitem(main._last, "records", {})
+    monkeypatch.setitem(main._last, "proc_out", None)
+
+    blobs = {}
+    monkeypatch.setattr(main, "_save_blob",
+                        lambda ctr, name, data: blobs.__setitem__(name, data))
+    if main._snapshots is not None:
+        monkeypatch.setattr(main._snapshots, "container",
+                            LocalContainer(str(tmp_path / "processed")))
+
+    def serve(feeds):
+        fake = FakeThingSpeak(feeds)
+        monkeypatch.setattr(main, "_http", fake)
+        return fake
+
+    def serve_async(feeds, fail=()):
+        http, blob = FakeAioHttp(feeds), FakeBlobService(fail)
+        monkeypatch.setattr(main, "_aio_clients", lambda: (http, blob))
+        monkeypatch.setattr(main._proc_ctr, "_client",                # warmed up
+                            LocalContainer(str(tmp_path / "processed")))
+        return http, blob
+
+    main.blobs, main.serve, main.serve_async = blobs, serve, serve_async
+    yield main
+    del main.blobs, main.serve, main.serve_async
+
+
+class FrozenClock(datetime):
+    """datetime whose utcnow() is set by the test (main stamps ticks with it)."""
+    now_value = datetime(2026, 1, 1)
+
+    @classmethod
+    def utcnow(cls):
+        return cls.now_value
@@ -0,0 +1,87 @@
+"""
+streams.py  —  Synthetic sensor streams for tests and benchmarks
+─────────────────────────────────────────────────────────────────────
+Deterministic (seeded) readings around the field normal operating
+point with leak events: for a share of the sensors, pressure sags and
+flow rises for a stretch of ticks, then recovers, so the physics rule,
+the ML threshold and the latched → recovering → normal transitions all
+fire.
+
+Values are generated as raw ThingSpeak field values and calibrated the
+way twin.calibrate() does, so the same stream can be fed to the live
+pipeline (feeds()) and straight to predict (rows_at()) with identical
+inputs.
+"""
+
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from backend.config import (FIELD_FLOW_LPM, FIELD_PRESSURE_BAR, FLOW_FACTOR,
+                            PRESSURE_FACTOR, FLOW_MAX_LPM, PRESSURE_MAX_BAR,
+                            SENSOR_CONFIG)
+
+START  = datetime(2026, 1, 5, 6, 0, 0)
+STEP   = timedelta(seconds=15)
+WARMUP = 15     # ticks before the first leak can start
+
+
+def sensor_stream(n_sensors: int, n_ticks: int, leak_share: float = 0.3,
+                  seed: int = 0) -> dict:
+    """
+    {"sids": [int] * S, "time": [datetime] * T, "hour": int[T],
+     "raw_p", "raw_f", "pressure" (bar), "flow_lpm": float[T × S]}
+    """
+    rng   = np.random.default_rng(seed)
+    T, S  = n_ticks, n_sensors
+    p_bar = FIELD_PRESSURE_BAR * (1 + 0.02 * rng.standard_normal((T, S)))
+    f_lpm = FIELD_FLOW_LPM     * (1 + 0.03 * rng.standard_normal((T, S)))
+
+    # leak events: sag / surge ramp in over 3 ticks, hold, then release
+    n_leaks = max(1, int(round(S * leak_share)))
+    for j in rng.choice(S, n_leaks, replace=False):
+        t0   = int(rng.integers(WARMUP, max(WARMUP + 1, T - 20)))
+        hold = int(rng.integers(8, 25))
+        drop = rng.uniform(0.10, 0.45)
+        gain = rng.uniform(0.10, 0.80)
+        ramp = np.clip((np.arange(T) - t0 + 1) / 3.0, 0.0, 1.0)
+        ramp[t0 + hold:] = 0.0
+        p_bar[:, j] *= 1 - drop * ramp
+        f_lpm[:, j] *= 1 + gain * ramp
+
+    # a few dropped-out readings (invalid → not pushed)
+    p_bar[rng.random((T, S)) < 0.002] = 0.0
+
+    raw_p = np.maximum(p_bar, 0.0) / PRESSURE_FACTOR
+    raw_f = np.maximum(f_lpm, 0.0) / FLOW_FACTOR
+    time  = [START + k * STEP * 240 for k in range(T)]      # crosses hours
+    return {
+        "sids":     list(range(1, S + 1)),
+        "time":     time,
+        "hour":     np.array([t.hour for t in time], dtype=np.int64),
+        "raw_p":    raw_p,
+        "raw_f":    raw_f,
+        "pressure": np.minimum(raw_p * PRESSURE_FACTOR, PRESSURE_MAX_BAR),
+        "flow_lpm": np.minimum(raw_f * FLOW_FACTOR,     FLOW_MAX_LPM),
+    }
+
+
+def rows_at(stream: dict, t: int) -> list:
+    """predict_leak_rows() input for tick t: (sid, p_bar, f_lps, hour)."""
+    h = int(stream["hour"][t])
+    return [(sid, float(stream["pressure"][t, j]), float(stream["flow_lpm"][t, j]) / 60.0, h)
+            for j, sid in enumerate(stream["sids"])]
+
+
+def feeds(stream: dict) -> list[dict]:
+    """ThingSpeak feed entries for a stream with len(SENSOR_CONFIG) sensors."""
+    if len(stream["sids"]) != len(SENSOR_CONFIG):
+        raise ValueError("feeds() needs one stream column per SENSOR_CONFIG entry")
+    out = []
+    for t, when in enumerate(stream["time"]):
+        feed = {"created_at": when.strftime("%Y-%m-%dT%H:%M:%SZ"), "entry_id": t + 1}
+        for j, s in enumerate(SENSOR_CONFIG):
+            feed[s["pressure_field"]] = repr(float(stream["raw_p"][t, j]))
+            feed[s["flow_field"]]     = repr(float(stream["raw_f"][t, j]))
+        out.append(feed)
+    return out
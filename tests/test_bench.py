@@ -0,0 +1,332 @@
+"""
+Hot-path benchmarks (pytest-benchmark): per-reading latency, per-tick
+calibration and throughput at 3 / 100 / 1000 sensors, replay
+throughput, the full fetch → predict → prescribe → persist tick with
+ThingSpeak and Blob stand-ins, concurrent multi-channel fetch, /stream
+delta publishing, network inference over a generated pipe tree,
+/history and /events over a week of ticks, sharded inference of a
+5000-sensor tick over 1 / 2 / 4 worker processes, buffer registry
+memory and cold-start import time.
+
+Skipped by a plain `pytest` (pytest.ini); run them with --benchmark-only.
+Scores use whichever engine INFERENCE_ENGINE selects; compare with
+  pytest tests/test_bench.py --benchmark-only --benchmark-save=sklearn
+  INFERENCE_ENGINE=compiled pytest tests/test_bench.py --benchmark-only --benchmark-compare
+"""
+
+import math, os, subprocess, sys, time, tracemalloc
+from unittest import mock
+
+import pytest
+
+pytest.importorskip("pytest_benchmark")
+
+import numpy as np
+
+from backend import history, kernels, predict, replay
+from backend.channels import Channel, ChannelRegistry
+from backend.history import HistoryIndex
+from backend.network import NetworkInference, PipeNetwork
+from backend.prescribe import get_prescription
+from backend.shards import ShardedScorer
+from backend.stream import StreamHub
+from backend.twin import sensor_record
+
+from streams import feeds, rows_at, sensor_stream
+
+SIZES = [3, 100, 1000]
+
+
+def _warm(stream, buffers, ticks: int):
+    for t in range(ticks):
+        predict.predict_leak_rows(rows_at(stream, t), buffers)
+
+
+def _throughput(benchmark, readings: int):
+    if benchmark.stats:                     # None with --benchmark-disable
+        benchmark.extra_info["readings_per_s"] = round(readings / benchmark.stats.stats.mean)
+
+
+@pytest.fixture(autouse=True)
+def _engine_info(benchmark):
+    benchmark.extra_info["engine"] = predict.INFERENCE_ENGINE
+
+
+# ══════════════════════════════════════════════════════════════════
+# PER READING
+# ══════════════════════════════════════════════════════════════════
+def test_predict_leak(benchmark, monkeypatch):
+    monkeypatch.setattr(predict, "_buffers", predict.BufferRegistry())
+    stream = sensor_stream(1, 64)
+    _warm(stream, predict._buffers, predict.WINDOW)
+    p, f = float(stream["pressure"][20, 0]), float(stream["flow_lpm"][20, 0]) / 60.0
+    benchmark(predict.predict_leak, p, f, sensor_id=1, hour=12)
+
+
+def test_buffer_push_features(benchmark):
+    buf  = predict.SensorBuffer()
+    X    = predict.np.empty(len(predict.FEATURES))
+    vals = sensor_stream(1, 64)
+
+    def step(i=[0]):
+        t = i[0] = (i[0] + 1) % 64
+        buf.push(float(vals["pressure"][t, 0]), float(vals["flow_lpm"][t, 0]) / 60.0)
+        buf.feature_vector(12, X)
+
+    benchmark(step)
+
+
+@pytest.mark.parametrize("size_ratio, lps", [(0.0005, 0.01), (0.05, 0.2), (0.9, 5.0)])
+def test_get_prescription(benchmark, size_ratio, lps):
+    benchmark(get_prescription, size_ratio, lps)
+
+
+# ══════════════════════════════════════════════════════════════════
+# PER TICK
+# ══════════════════════════════════════════════════════════════════
+@pytest.mark.parametrize("n", SIZES)
+def test_calibrate_tick(benchmark, n):
+    """Raw ThingSpeak field strings of n sensors → bar / lpm, one kernel call."""
+    stream = sensor_stream(n, 1)
+    raw_p  = [str(v) for v in stream["raw_p"][0]]
+    raw_f  = [str(v) for v in stream["raw_f"][0]]
+    p, f = benchmark(kernels.calibrate, raw_p, raw_f)
+    np.testing.assert_allclose(p, stream["pressure"][0], rtol=1e-9)
+    benchmark.extra_info["sensors"] = n
+
+
+@pytest.mark.parametrize("n", SIZES)
+def test_tick_predict_prescribe(benchmark, n):
+    """One tick of n sensors: predict_leak_rows + sensor_record."""
+    stream, buffers = sensor_stream(n, 40), predict.BufferRegistry()
+    _warm(stream, buffers, 20)
+    ticks = [rows_at(stream, t) for t in range(20, 40)]
+    P, F  = stream["pressure"], stream["flow_lpm"]
+
+    def tick(i=[0]):
+        k = i[0] = (i[0] + 1) % len(ticks)
+        results = predict.predict_leak_rows(ticks[k], buffers)
+        return [sensor_record(sid, float(P[20 + k, j]), float(F[20 + k, j]), r)
+                for j, (sid, r) in enumerate(zip(stream["sids"], results))]
+
+    benchmark(tick)
+    benchmark.extra_info["sensors"] = n
+    _throughput(benchmark, n)
+
+
+def test_replay_throughput(benchmark):
+    frame = replay.frame_from_feeds(feeds(sensor_stream(3, 2000)))
+    df    = benchmark.pedantic(replay.replay, args=(frame,), rounds=3, iterations=1)
+    _throughput(benchmark, len(df))
+
+
+def test_run_digital_twin(benchmark, twin):
+    """Fetch → predict → prescribe → persist with local stand-ins."""
+    stream = sensor_stream(3, 2000)
+    twin.serve(feeds(stream))
+    benchmark(twin.run_digital_twin)
+    assert "latest.json" in twin.blobs
+
+
+@pytest.mark.parametrize("n", SIZES)
+def test_stream_publish(benchmark, n):
+    """Diff + encode one tick of n sensors for /stream (any client count)."""
+    stream, buffers = sensor_stream(n, 40), predict.BufferRegistry()
+    P, F, docs = stream["pressure"], stream["flow_lpm"], []
+    for t in range(40):
+        results = predict.predict_leak_rows(rows_at(stream, t), buffers)
+        docs.append({"timestamp": str(stream["time"][t]), "entry_id": t, "sensors": [
+            sensor_record(sid, float(P[t, j]), float(F[t, j]), r)
+            for j, (sid, r) in enumerate(zip(stream["sids"], results))]})
+    hub = StreamHub()
+
+    def publish(i=[0]):
+        i[0] = (i[0] + 1) % len(docs)
+        hub.publish(docs[i[0]])
+
+    benchmark(publish)
+    benchmark.extra_info["sensors"] = n
+
+
+class _SlowThingSpeak:
+    """Session stand-in: every channel answers after `delay` seconds."""
+
+    def __init__(self, delay: float):
+        self.delay = delay
+
+    def get(self, url, timeout=None):
+        time.sleep(self.delay)
+        resp = mock.Mock()
+        resp.json.return_value = {"feeds": [{"entry_id": 1, "field1": "3.4", "field2": "1.2"}]}
+        return resp
+
+
+@pytest.mark.parametrize("n", [1, 8, 32])
+def test_channel_fetch(benchmark, n):
+    """Fetch n channels at 20 ms each: a tick costs the slowest wave, not the sum."""
+    delay, conc = 0.02, 8
+    reg = ChannelRegistry([Channel(c, "key", [{"sensor_id": c, "flow_field": "field1",
+                                                "pressure_field": "field2"}])
+                           for c in range(n)], concurrency=conc)
+    session = _SlowThingSpeak(delay)
+    t0 = time.perf_counter()
+    feeds, errors = reg.fetch(session)
+    assert len(feeds) == n and not errors
+    assert time.perf_counter() - t0 < delay * math.ceil(n / conc) + 0.1
+    benchmark(reg.fetch, session)
+    benchmark.extra_info["channels"] = n
+    reg.close()
+
+
+def _pipe_tree(n_pipes: int, n_sensors: int, seed: int = 7):
+    """Random tree rooted at SRC, its steady flows / pressures, and a net."""
+    rng    = np.random.default_rng(seed)
+    parent = np.r_[-1, [rng.integers(0, k) for k in range(1, n_pipes)]]
+    nodes  = [{"id": "SRC"}] + [{"id": f"J{k}"} for k in range(n_pipes)]
+    pipes  = [{"id": f"P-{k}", "from": "SRC" if parent[k] < 0 else f"J{parent[k]}",
+               "to": f"J{k}"} for k in range(n_pipes)]
+    metered = np.r_[0, rng.choice(np.arange(1, n_pipes), n_sensors - 1, replace=False)]
+    sensors = [{"sensor_id": j + 1, "pipe_id": f"P-{k}"} for j, k in enumerate(metered)]
+    return parent, metered, PipeNetwork(nodes, pipes, sensors)
+
+
+def _tick(parent, metered, extra_at=None):
+    """Pipe flows (subtree demand) and node pressures for one tick."""
+    demand = np.full(parent.size, 0.5)
+    if extra_at is not None:
+        demand[extra_at] += 20.0
+    flow = demand.copy()
+    for k in range(parent.size - 1, 0, -1):      # children have larger ids
+        flow[parent[k]] += flow[k]
+    pres = np.empty(parent.size)
+    for k in range(parent.size):
+        up = 4.0 if parent[k] < 0 else pres[parent[k]]
+        pres[k] = up - 1e-4 * flow[k]
+    return pres[metered], flow[metered]
+
+
+@pytest.mark.parametrize("n", SIZES)
+def test_network_step(benchmark, n):
+    """Cross-sensor features + localisation per tick, 10 pipes per sensor."""
+    parent, metered, net = _pipe_tree(10 * n, n)
+    inf  = NetworkInference(net)
+    sids = net.sensor_ids
+    p, f = _tick(parent, metered)
+    for _ in range(5):
+        inf.step(sids, p, f, np.zeros(n))
+
+    leak = int(np.flatnonzero(net.zone_of_pipe >= 0)[-1])
+    pl, fl = _tick(parent, metered, extra_at=leak)
+    out = benchmark(lambda: inf.step(sids, pl, fl, np.ones(n)))
+    suspect = net.pipe_ids.index(out["suspect_pipe"])
+    assert net.zone_of_pipe[suspect] == net.zone_of_pipe[leak]
+    benchmark.extra_info.update(sensors=n, pipes=net.n_pipes)
+
+
+# ══════════════════════════════════════════════════════════════════
+# HISTORY
+# ══════════════════════════════════════════════════════════════════
+@pytest.fixture(scope="module")
+def week_index(tmp_path_factory):
+    """A week of 15 s ticks for 3 sensors (~121k readings)."""
+    idx   = HistoryIndex(str(tmp_path_factory.mktemp("history") / "h.db"), retention_days=0)
+    t0    = history.to_ms("2026-01-05T00:00:00")
+    ticks = 7 * 86400 // 15
+    rng   = np.random.default_rng(0)
+    prob  = rng.random((ticks, 3))
+    for c0 in range(0, ticks, 5000):
+        idx.add_rows([{"sensor_id": j + 1, "ts": t0 + t * 15000, "pipe_id": f"P-00{j + 1}",
+                       "alert_state": "latched" if prob[t, j] > 0.99 else "normal",
+                       "leak": int(prob[t, j] > 0.99), "probability": float(prob[t, j]),
+                       "pressure": 0.48, "flow_lpm": 25.0, "p_drop_pct": 0.0,
+                       "leak_lpm": 0.0, "physics": 0}
+                      for t in range(c0, min(c0 + 5000, ticks)) for j in range(3)])
+    return idx, history.iso(t0), history.iso(t0 + ticks * 15000)
+
+
+@pytest.mark.parametrize("span", ["week", "hour"])
+def test_history_query(benchmark, week_index, span):
+    """/history for one pipe: a week from rollups, an hour from raw rows."""
+    idx, start, end = week_index
+    if span == "hour":
+        start = history.iso(history.to_ms(end) - 3_600_000)
+    out = benchmark(idx.series, start, end, pipe_id="P-002", points=500)
+    assert out["source"] == ("rollup_300s" if span == "week" else "readings")
+    assert 0 < len(out["series"]["t"]) <= 500
+
+
+def test_history_events(benchmark, week_index):
+    idx, start, end = week_index
+    out = benchmark(idx.events, start, end, pipe_id="P-002")
+    assert out and all(e["pipe_id"] == "P-002" for e in out)
+
+
+# ══════════════════════════════════════════════════════════════════
+# SHARDED INFERENCE
+# ══════════════════════════════════════════════════════════════════
+@pytest.mark.parametrize("n_shards", [1, 2, 4])
+def test_sharded_tick(benchmark, n_shards):
+    """One 5000-sensor tick hashed over n_shards worker processes."""
+    stream = sensor_stream(5000, 30)
+    ticks  = [rows_at(stream, t) for t in range(30)]
+    shards = ShardedScorer(n_shards)
+    try:
+        for rows in ticks[:20]:
+            shards.predict_rows(rows)
+
+        def tick(i=[0]):
+            k = i[0] = (i[0] + 1) % 10
+            return shards.predict_rows(ticks[20 + k])
+
+        benchmark(tick)
+    finally:
+        shards.close()
+    benchmark.extra_info.update(sensors=5000, shards=n_shards, cpus=os.cpu_count())
+    _throughput(benchmark, 5000)
+
+
+# ══════════════════════════════════════════════════════════════════
+# MEMORY
+# ══════════════════════════════════════════════════════════════════
+@pytest.mark.parametrize("n", SIZES)
+def test_registry_memory(benchmark, n):
+    """Traced bytes per sensor for a warm buffer registry."""
+    stream = sensor_stream(n, predict.WINDOW)
+
+    def build():
+        buffers = predict.BufferRegistry()
+        slots   = buffers.slots(stream["sids"])
+        for t in range(predict.WINDOW):
+            buffers.push(slots, stream["pressure"][t], stream["flow_lpm"][t] / 60.0)
+        return buffers
+
+    tracemalloc.start()
+    base    = tracemalloc.take_snapshot()
+    buffers = build()
+    used    = sum(s.size_diff for s in
+                  tracemalloc.take_snapshot().compare_to(base, "filename"))
+    tracemalloc.stop()
+
+    per_sensor = used / len(buffers)
+    benchmark.extra_info["bytes_per_sensor"] = round(per_sensor)
+    benchmark.pedantic(build, rounds=3, iterations=1)
+    assert per_sensor < (4096 if n < 100 else 1024), per_sensor
+
+
+# ══════════════════════════════════════════════════════════════════
+# STARTUP
+# ══════════════════════════════════════════════════════════════════
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.mark.parametrize("mode", ["lifespan", "preload"])
+def test_startup_import(benchmark, mode):
+    """Fresh interpreter: `import backend.main` until the app object exists."""
+    env  = {**os.environ, "STARTUP_MODE": mode, "PYTHONWARNINGS": "ignore"}
+    code = "import backend.main, sys; sys.exit(0 if backend.main.app else 1)"
+
+    def start():
+        subprocess.run([sys.executable, "-c", code], cwd=ROOT, env=env, check=True)
+
+    benchmark.pedantic(start, rounds=3, iterations=1)
+    benchmark.extra_info["startup_mode"] = mode
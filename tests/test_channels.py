@@ -0,0 +1,165 @@
+"""
+Channel registry (channels.py) with a fake clock and fake HTTP clients:
+429 with Retry-After, exponential backoff and its cap, and a failing
+channel that neither blocks the others in the same tick nor is
+requested again before its backoff expires.
+"""
+
+import asyncio, threading
+
+import aiohttp
+import pytest
+import requests
+from yarl import URL
+
+from backend import channels
+from backend.channels import Channel, ChannelRegistry
+from backend.config import SENSOR_CONFIG
+
+IDS = (101, 102, 103)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+    def perf_counter(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clk = FakeClock()
+    monkeypatch.setattr(channels, "time", clk)
+    return clk
+
+
+def _registry(**kw) -> ChannelRegistry:
+    chans = [Channel(cid, "key", [{**s, "sensor_id": 10 * cid + k}
+                                  for k, s in enumerate(SENSOR_CONFIG)]) for cid in IDS]
+    return ChannelRegistry(chans, **{"backoff_s": 15.0, "backoff_max_s": 300.0, **kw})
+
+
+def _cid(url: str) -> int:
+    return int(url.split("/channels/")[1].split("/")[0])
+
+
+class _Response:
+    def __init__(self, cid, status, headers):
+        self.cid, self.status_code, self.headers = cid, status, headers
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.HTTPError(f"{self.status_code}", response=self)
+
+    def json(self):
+        return {"feeds": [{"entry_id": self.cid}]}
+
+
+class FakeSession:
+    """requests.Session stand-in: status (and headers) per channel id."""
+
+    def __init__(self, status=None, headers=None, barrier=None):
+        self.status, self.headers = status or {}, headers or {}
+        self.barrier, self.calls = barrier, []
+
+    def get(self, url, timeout=None):
+        cid = _cid(url)
+        self.calls.append(cid)
+        if self.barrier is not None:
+            self.barrier.wait()             # every channel in flight at once
+        return _Response(cid, self.status.get(cid, 200), self.headers.get(cid, {}))
+
+
+def test_429_honours_retry_after(clock):
+    reg  = _registry()
+    http = FakeSession(status={101: 429}, headers={101: {"Retry-After": "120"}})
+    feeds, errors = reg.fetch(http)
+    assert set(feeds) == {102, 103} and set(errors) == {101}
+
+    ch = reg.channels[0]
+    assert ch.backoff_s == 15.0 and ch.retry_at == clock.now + 120.0
+    clock.now += 119.0
+    http.calls.clear()
+    feeds, errors = reg.fetch(http)
+    assert sorted(http.calls) == [102, 103] and "backing off" in errors[101]
+
+    clock.now += 1.0
+    http.status.clear()
+    assert set(reg.fetch(http)[0]) == set(IDS)
+    assert ch.backoff_s == 0.0                          # success resets the backoff
+
+
+def test_backoff_doubles_up_to_the_cap(clock):
+    reg, http = _registry(), FakeSession(status={101: 503})
+    ch, waits = reg.channels[0], []
+    for _ in range(8):
+        reg.fetch(http)
+        waits.append(ch.retry_at - clock.now)
+        clock.now = ch.retry_at                         # next attempt when due
+    assert waits == [15, 30, 60, 120, 240, 300, 300, 300]
+
+    http.status[101] = 404                              # not retryable: no backoff
+    ch.backoff_s = 0.0
+    reg.fetch(http)
+    assert ch.retry_at <= clock.now
+
+
+def test_failing_channel_does_not_stall_the_others(clock):
+    reg  = _registry(concurrency=3)
+    http = FakeSession(status={102: 500}, barrier=threading.Barrier(3, timeout=10))
+    feeds, errors = reg.fetch(http)                     # the barrier needs all 3 at once
+    assert set(feeds) == {101, 103} and set(errors) == {102}
+
+    http.barrier, http.calls = None, []
+    feeds, errors = reg.fetch(http)
+    assert sorted(http.calls) == [101, 103] and set(feeds) == {101, 103}
+    reg.close()
+
+
+# ── async path ────────────────────────────────────────────────────
+class _AioResponse:
+    def __init__(self, cid, status, headers):
+        self.cid, self.status, self.headers = cid, status, headers
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    def raise_for_status(self):
+        if self.status >= 400:
+            url = URL(channels.FEEDS_URL.format(channel=self.cid))
+            raise aiohttp.ClientResponseError(aiohttp.RequestInfo(url, "GET", {}, url), (),
+                                              status=self.status, headers=self.headers)
+
+    async def json(self, content_type=None):
+        return {"feeds": [{"entry_id": self.cid}]}
+
+
+class FakeAioSession:
+    """aiohttp.ClientSession stand-in: status (and headers) per channel id."""
+
+    def __init__(self, status, headers=None):
+        self.status, self.headers, self.calls = status, headers or {}, []
+
+    def get(self, url):
+        cid = _cid(url)
+        self.calls.append(cid)
+        return _AioResponse(cid, self.status.get(cid, 200), self.headers.get(cid, {}))
+
+
+def test_async_429_and_isolation(clock):
+    reg  = _registry()
+    http = FakeAioSession({103: 429}, {103: {"Retry-After": "45"}})
+    feeds, errors = asyncio.run(reg.fetch_async(http))
+    assert set(feeds) == {101, 102} and set(errors) == {103}
+    assert reg.channels[2].retry_at == clock.now + 45.0
+
+    http.calls.clear()
+    feeds, errors = asyncio.run(reg.fetch_async(http))
+    assert sorted(http.calls) == [101, 102] and "backing off" in errors[103]
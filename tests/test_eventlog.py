@@ -0,0 +1,204 @@
+"""
+Change-only persistence (eventlog.py): the transition log and
+state_at() against the full per-tick table of the same processed
+documents (one channel, and two ticking at different rates), resuming
+after a restart, and write volume vs Parquet snapshots.
+"""
+
+from datetime import datetime, timedelta
+
+import pandas as pd
+import pytest
+
+from backend import predict
+from backend.eventlog import EventLogWriter, read_events, state_at
+from backend.snapshots import LocalContainer, SnapshotWriter, _naive_utc
+from backend.twin import flat_record, sensor_record
+
+from streams import START, feeds, rows_at, sensor_stream
+
+STEP     = timedelta(seconds=15)
+KEYFRAME = 600.0                    # every 40 ticks
+
+
+def _docs(n_sensors: int = 6, n_ticks: int = 300, leak_share: float = 0.5,
+          seed: int = 2) -> list[dict]:
+    """Processed documents, one tick every 15 s."""
+    stream, reg, docs = sensor_stream(n_sensors, n_ticks, leak_share, seed=seed), \
+        predict.BufferRegistry(), []
+    for t in range(n_ticks):
+        results = predict.predict_leak_rows(rows_at(stream, t), reg)
+        sensors = [sensor_record(sid, float(stream["pressure"][t, j]),
+                                 float(stream["flow_lpm"][t, j]), r)
+                   for j, (sid, r) in enumerate(zip(stream["sids"], results))]
+        docs.append({"timestamp": (START + t * STEP).isoformat(), "entry_id": t,
+                     "sensors": sensors})
+    return docs
+
+
+def _write(container, docs, flush_every: int = 20):
+    writer = EventLogWriter(container, keyframe_s=KEYFRAME)
+    for k, d in enumerate(docs):
+        writer.add(d)
+        if k % flush_every == flush_every - 1:
+            writer.flush()
+    writer.flush()
+    return writer
+
+
+def _frame(docs) -> pd.DataFrame:
+    return pd.DataFrame([flat_record(d["timestamp"], d["entry_id"], r)
+                         for d in docs for r in d["sensors"]])
+
+
+@pytest.fixture(scope="module")
+def docs():
+    return _docs()
+
+
+def test_events_are_transitions(docs, tmp_path):
+    ctr = LocalContainer(str(tmp_path))
+    _write(ctr, docs)
+
+    df   = _frame(docs)
+    key  = df["alert_state"] + df["leak"].astype(str)
+    prev = key.groupby(df["sensor_numeric_id"]).shift()
+    want = df[prev.notna() & (key != prev)]
+    assert len(want) > 0
+
+    got = read_events(ctr, START, START + len(docs) * STEP)
+    assert list(zip(got["timestamp"], got["sensor_numeric_id"], got["alert_state"])) == \
+        list(zip(want["timestamp"], want["sensor_numeric_id"], want["alert_state"]))
+    assert list(got["leak_lpm"]) == list(want["leak_lpm"])
+    assert got["prev_state"].notna().all()
+
+
+@pytest.mark.parametrize("tick", [0, 1, 39, 40, 41, 117, 250, 299])
+def test_state_at_rebuilds_any_time(docs, tmp_path, tick):
+    ctr = LocalContainer(str(tmp_path))
+    _write(ctr, docs)
+
+    df    = _frame(docs)
+    t     = START + tick * STEP
+    upto  = df[pd.to_datetime(df["timestamp"]) <= t]
+    want  = upto.groupby("sensor_numeric_id").last()
+    got   = state_at(ctr, t).set_index("sensor_numeric_id")
+    assert list(got.index) == list(want.index)
+    assert list(got["alert_state"]) == list(want["alert_state"])
+    assert list(got["leak"]) == list(want["leak"])
+
+    # every record returned is the sensor's real record of that tick
+    rows = df.set_index(["timestamp", "sensor_numeric_id"])
+    for sid, r in got.iterrows():
+        ref = rows.loc[(r["timestamp"], sid)]
+        assert r["leak_lpm"] == ref["leak_lpm"] and r["probability"] == ref["probability"]
+
+
+def test_state_at_before_first_keyframe_is_empty(docs, tmp_path):
+    ctr = LocalContainer(str(tmp_path))
+    _write(ctr, docs[:10])
+    assert state_at(ctr, START - STEP).empty
+
+
+def test_restart_resumes_log(docs, tmp_path):
+    once, twice = LocalContainer(str(tmp_path / "a")), LocalContainer(str(tmp_path / "b"))
+    _write(once, docs)
+    _write(twice, docs[:130])
+    second = EventLogWriter(twice, keyframe_s=KEYFRAME)
+    second.resume(docs[130]["timestamp"])
+    second.add(docs[130])
+    assert not second._keyframes                    # resumed: no forced keyframe
+    for d in docs[131:]:
+        second.add(d)
+    second.flush()
+
+    span = START, START + len(docs) * STEP
+    pd.testing.assert_frame_equal(read_events(twice, *span), read_events(once, *span))
+    assert sorted(b.name.split("/")[-1][:9] for b in twice.list_blobs("events/keyframes")) == \
+        sorted(b.name.split("/")[-1][:9] for b in once.list_blobs("events/keyframes"))
+
+
+def _two_channels(docs, every: int = 11) -> list[dict]:
+    """Sensors 1-3 on a channel with a new entry only every `every` ticks
+    (so their keyframe rows are older than the keyframe), 4-6 on one
+    that updates every tick."""
+    return [{**d, "sensors": [r for r in d["sensors"]
+                              if r["sensor_numeric_id"] > 3 or t % every == 0]}
+            for t, d in enumerate(docs)]
+
+
+def test_two_channel_keyframes(docs, tmp_path):
+    two = _two_channels(docs)
+    ctr = LocalContainer(str(tmp_path / "a"))
+    _write(ctr, two)
+
+    df, gap_events = _frame(two), 0
+    for tick in (40, 80, 120, 160, 200, 240, 280):          # keyframe ticks
+        t    = START + tick * STEP
+        want = df[pd.to_datetime(df["timestamp"]) <= t].groupby("sensor_numeric_id").last()
+        got  = state_at(ctr, t).set_index("sensor_numeric_id")
+        assert list(got["timestamp"]) == list(want["timestamp"])      # nothing stale
+        assert list(got["leak_lpm"]) == list(want["leak_lpm"])
+        stale = want["timestamp"].min()                     # channel 1's last entry
+        ev    = read_events(ctr, stale, t)
+        gap_events += 0 if ev.empty else int((ev["sensor_numeric_id"] > 3).sum())
+    assert gap_events > 0       # transitions between the stale rows and the keyframe
+
+    again = LocalContainer(str(tmp_path / "b"))
+    _write(again, two[:45])
+    second = EventLogWriter(again, keyframe_s=KEYFRAME)
+    second.resume(two[45]["timestamp"])
+    assert second._keyframe_at == _naive_utc(two[40]["timestamp"]).timestamp()
+    for d in two[45:]:
+        second.add(d)
+    second.flush()
+    assert sorted(b.name.split("/")[-1][:9] for b in again.list_blobs("events/keyframes")) == \
+        sorted(b.name.split("/")[-1][:9] for b in ctr.list_blobs("events/keyframes"))
+
+
+class _Unreachable(LocalContainer):
+    def list_blobs(self, *a, **kw):
+        raise AssertionError("add() must not touch storage")
+
+
+def test_add_is_in_memory_and_resume_tolerates_errors(docs, tmp_path):
+    log = EventLogWriter(_Unreachable(str(tmp_path)), keyframe_s=KEYFRAME)
+    log.add(docs[0])                                # cold: keyframes, no I/O
+    assert len(log._keyframes) == 1
+    log.resume(docs[1]["timestamp"])                # state exists: no-op
+
+    cold = EventLogWriter(_Unreachable(str(tmp_path)), keyframe_s=KEYFRAME)
+    cold.resume()                                   # unreadable store: cold start
+    cold.add(docs[0])
+    assert len(cold._keyframes) == 1
+
+
+def test_healthy_network_writes_orders_less(tmp_path):
+    docs = _docs(n_sensors=100, n_ticks=120, leak_share=0.01, seed=9)
+    full, events = LocalContainer(str(tmp_path / "full")), LocalContainer(str(tmp_path / "ev"))
+    snap = SnapshotWriter(full)
+    for d in docs:
+        snap.add(d)
+        snap.flush()                                # flushed per tick, like the WebJob
+    writer = EventLogWriter(events, keyframe_s=KEYFRAME)
+    for d in docs:
+        writer.add(d)
+        writer.flush()
+
+    def volume(ctr):
+        return sum(len(ctr.download_blob(b.name).readall()) for b in ctr.list_blobs())
+
+    assert volume(events) * 20 < volume(full)
+
+
+def test_twin_events_mode(twin, tmp_path, monkeypatch):
+    ctr = LocalContainer(str(tmp_path / "events"))
+    monkeypatch.setattr(twin, "_snapshots", EventLogWriter(ctr))
+    twin.serve(feeds(sensor_stream(3, 30, 1.0, seed=4)))
+    for _ in range(30):
+        twin.run_digital_twin()
+
+    assert "latest.json" in twin.blobs and not [k for k in twin.blobs if "_raw" in k]
+    now = state_at(ctr, datetime.utcnow())
+    assert list(now["sensor_numeric_id"]) == [1, 2, 3]
+    assert list(now["alert_state"]) == [r["alert_state"] for r in twin.blobs["latest.json"]["sensors"]]
@@ -0,0 +1,60 @@
+"""
+Compiled forest (forest.py) against the sklearn estimator it was
+compiled from: same probabilities to 1e-9 on random feature rows,
+rows sitting exactly on split thresholds, extreme values and NaNs
+(routed by missing_go_to_left), whatever the row chunking.
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from backend import predict
+from backend.forest import CompiledForest
+
+
+@pytest.fixture(scope="module")
+def estimator():
+    return predict.load_model()
+
+
+def _sklearn(estimator, X):
+    return estimator.predict_proba(pd.DataFrame(X, columns=predict.FEATURES))
+
+
+def _random_rows(n: int, seed: int) -> np.ndarray:
+    """Rows spread over (and past) the range the buffers produce."""
+    rng = np.random.default_rng(seed)
+    return rng.normal(size=(n, len(predict.FEATURES))) * rng.choice([0.1, 1.0, 10.0], n)[:, None]
+
+
+def _threshold_rows(cf: CompiledForest, n: int, seed: int) -> np.ndarray:
+    """Rows whose features sit exactly on split thresholds of fold 0."""
+    rng   = np.random.default_rng(seed)
+    split = np.flatnonzero(np.isfinite(cf.threshold))
+    X     = _random_rows(n, seed)
+    for i in range(n):
+        for k in rng.choice(split, 4):
+            j = cf.feature[k]
+            X[i, j] = float(cf.threshold[k]) * cf.scale[0, j] + cf.center[0, j]
+    return X
+
+
+@pytest.mark.parametrize("chunk_rows", [1, 64, 512])
+def test_matches_sklearn(estimator, chunk_rows):
+    cf = CompiledForest(estimator, chunk_rows=chunk_rows)
+    X  = np.vstack([_random_rows(700, seed=1), _threshold_rows(cf, 100, seed=2)])
+    np.testing.assert_allclose(cf.predict_proba(X), _sklearn(estimator, X), rtol=0, atol=1e-9)
+
+
+def test_edge_rows_and_nan_routing(estimator):
+    cf = CompiledForest(estimator, chunk_rows=16)
+    F  = len(predict.FEATURES)
+    X  = _random_rows(60, seed=3)
+    rng = np.random.default_rng(4)
+    X[rng.random(X.shape) < 0.15] = np.nan                  # scattered NaNs
+    X  = np.vstack([X, np.zeros((1, F)), np.full((1, F), 1e30), np.full((1, F), -1e30),
+                    np.full((1, F), np.nan), np.eye(F) * 1e6])
+    np.testing.assert_allclose(cf.predict_proba(X), _sklearn(estimator, X), rtol=0, atol=1e-9)
+    np.testing.assert_allclose(cf.predict_proba(X[:1]), _sklearn(estimator, X[:1]),
+                               rtol=0, atol=1e-9)
@@ -0,0 +1,105 @@
+"""
+Golden-trace regression: every leak decision, alert state and
+prescription for the synthetic streams must match tests/golden/*.json,
+whichever path scores them (tick by tick, chunked, replay, the live
+pipeline) and whichever inference engine is active.
+"""
+
+import pytest
+
+from backend import predict, replay
+from backend.forest import CompiledForest
+from backend.twin import sensor_record
+
+from conftest import FrozenClock, trace_of
+from streams import feeds, rows_at, sensor_stream
+
+STREAMS = {                 # name → (sensors, ticks, leak share)
+    "stream_3":   (3,   120, 1.0),
+    "stream_100": (100,  45, 0.3),
+}
+
+
+@pytest.fixture(scope="module")
+def compiled_forest():
+    return CompiledForest(predict.load_model())
+
+
+@pytest.fixture(params=["sklearn", "compiled"])
+def engine(request, monkeypatch, golden):
+    predict.load_model()
+    if request.param == "compiled":
+        if golden.record:
+            pytest.skip("golden traces are recorded with the sklearn engine")
+        monkeypatch.setattr(predict._models.live, "compiled",
+                            request.getfixturevalue("compiled_forest"))
+    else:
+        monkeypatch.setattr(predict._models.live, "compiled", None)
+    return request.param
+
+
+def _records(stream, results) -> list[dict]:
+    """predict results (tick-major) → processed sensor documents."""
+    P, F = stream["pressure"], stream["flow_lpm"]
+    out  = []
+    for k, r in enumerate(results):
+        t, j = divmod(k, len(stream["sids"]))
+        out.append(sensor_record(stream["sids"][j], float(P[t, j]), float(F[t, j]), r))
+    return out
+
+
+@pytest.mark.parametrize("name", STREAMS)
+def test_tick_by_tick(name, engine, golden):
+    stream  = sensor_stream(*STREAMS[name])
+    buffers = predict.BufferRegistry()
+    results = []
+    for t in range(len(stream["time"])):
+        results += predict.predict_leak_rows(rows_at(stream, t), buffers)
+    golden.check(name, trace_of(_records(stream, results)))
+
+
+@pytest.mark.parametrize("name", STREAMS)
+def test_chunked(name, engine, golden):
+    if golden.record:
+        pytest.skip("recorded by test_tick_by_tick")
+    stream = sensor_stream(*STREAMS[name])
+    rows   = [r for t in range(len(stream["time"])) for r in rows_at(stream, t)]
+    golden.check(name, trace_of(_records(stream, predict.predict_leak_rows(rows, predict.BufferRegistry()))))
+
+
+def test_replay(engine, golden):
+    if golden.record:
+        pytest.skip("recorded by test_tick_by_tick")
+    frame = replay.frame_from_feeds(feeds(sensor_stream(*STREAMS["stream_3"])))
+    df    = replay.replay(frame, chunk_ticks=97)
+    golden.check("stream_3", trace_of(df.to_dict("records")))
+
+
+def test_live_pipeline(twin, engine, golden, monkeypatch):
+    if golden.record:
+        pytest.skip("recorded by test_tick_by_tick")
+    stream = sensor_stream(*STREAMS["stream_3"])
+    twin.serve(feeds(stream))
+    monkeypatch.setattr(twin, "datetime", FrozenClock)
+
+    docs = []
+    for when in stream["time"]:
+        FrozenClock.now_value = when
+        out = twin.run_digital_twin()
+        assert "error" not in out, out
+        docs += out["sensors"]
+
+    golden.check("stream_3", trace_of(docs))
+    assert twin.blobs["latest.json"]["entry_id"] == len(stream["time"])
+
+
+@pytest.mark.parametrize("name", STREAMS)
+def test_stream_exercises_the_latch(name):
+    """Guard against a stream change that makes the golden check vacuous."""
+    stream, buffers, results = sensor_stream(*STREAMS[name]), predict.BufferRegistry(), []
+    for t in range(len(stream["time"])):
+        results += predict.predict_leak_rows(rows_at(stream, t), buffers)
+    states = {r["alert_state"] for r in results}
+    assert {"normal", "latched", "recovering"} <= states, states
+    assert any(r["physics_fired"] for r in results)
+    assert any(r["leak"] and not r["physics_fired"] for r in results)
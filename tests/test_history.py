@@ -0,0 +1,144 @@
+"""
+History index (history.py): downsampled series and latch episodes
+against a pandas reference over the same processed documents, and the
+/history, /events routes on a live tick.
+"""
+
+from datetime import timedelta
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from backend import predict
+from backend.history import HistoryIndex, iso, to_ms
+from backend.twin import flat_record, sensor_record
+
+from streams import START, feeds, rows_at, sensor_stream
+
+STEP = timedelta(seconds=15)
+PIPE = {1: "P-A", 2: "P-A", 3: "P-B", 4: "P-C"}       # two sensors on P-A
+
+
+def _docs(n_ticks: int = 400, seed: int = 1) -> list[dict]:
+    """Processed documents for 4 sensors, one tick every 15 s."""
+    stream, reg, docs = sensor_stream(4, n_ticks, 0.5, seed=seed), predict.BufferRegistry(), []
+    for t in range(n_ticks):
+        results = predict.predict_leak_rows(rows_at(stream, t), reg)
+        sensors = [{**sensor_record(sid, float(stream["pressure"][t, j]),
+                                    float(stream["flow_lpm"][t, j]), r), "pipe_id": PIPE[sid]}
+                   for j, (sid, r) in enumerate(zip(stream["sids"], results))]
+        docs.append({"timestamp": (START + t * STEP).isoformat(), "sensors": sensors})
+    return docs
+
+
+def _frame(docs) -> pd.DataFrame:
+    df = pd.DataFrame([flat_record(d["timestamp"], None, r) for d in docs for r in d["sensors"]])
+    df["ts"] = [to_ms(t) for t in df["timestamp"]]
+    return df
+
+
+@pytest.fixture(scope="module")
+def docs():
+    return _docs()
+
+
+@pytest.fixture
+def index(docs, tmp_path):
+    idx = HistoryIndex(str(tmp_path / "history.db"), retention_days=0)
+    for d in docs:
+        idx.add(d)
+    return idx
+
+
+@pytest.mark.parametrize("bucket_s, source", [(60, "readings"), (900, "rollup_300s"),
+                                              (7200, "rollup_3600s")])
+def test_series_matches_pandas(index, docs, bucket_s, source):
+    df    = _frame(docs)
+    start = START + timedelta(minutes=7)
+    end   = START + len(docs) * STEP
+    got   = index.series(start.isoformat(), end.isoformat(), pipe_id="P-A", bucket_s=bucket_s)
+    assert got["source"] == source and got["sensor_ids"] == [1, 2]
+
+    b   = int(got["bucket_s"] * 1000)
+    sel = df[(df["pipe_id"] == "P-A") & (df["ts"] >= to_ms(got["start"])) & (df["ts"] < to_ms(end))]
+    g   = sel.groupby(sel["ts"] // b * b)
+    want = {"t": [iso(k) for k in g.groups], "n": g.size().tolist(),
+            "probability_mean": g["probability"].mean(), "probability_max": g["probability"].max(),
+            "pressure_mean": g["pressure"].mean(), "pressure_min": g["pressure"].min(),
+            "flow_lpm_mean": g["flow_lpm"].mean(), "leak_lpm_max": g["leak_lpm"].max(),
+            "leak_share": g["leak"].mean()}
+    series = got["series"]
+    assert series["t"] == want["t"] and series["n"] == want["n"]
+    for k in ("probability_mean", "probability_max", "pressure_mean", "pressure_min",
+              "flow_lpm_mean", "leak_lpm_max", "leak_share"):
+        np.testing.assert_allclose(series[k], want[k], atol=1e-4, err_msg=k)
+
+
+def test_series_alert_state_and_points(index, docs):
+    df  = _frame(docs)
+    end = START + len(docs) * STEP
+    got = index.series(START.isoformat(), end.isoformat(), alert_state="latched", bucket_s=60)
+    assert got["source"] == "readings"
+    assert sum(got["series"]["n"]) == int((df["alert_state"] == "latched").sum()) > 0
+
+    got = index.series(START.isoformat(), end.isoformat(), points=10)
+    assert len(got["series"]["t"]) <= 11 and sum(got["series"]["n"]) == len(df)
+    assert index.series(START.isoformat(), end.isoformat(), pipe_id="nope")["series"]["n"] == []
+
+
+def test_events_are_leak_runs(index, docs, tmp_path):
+    df   = _frame(docs)
+    want = []
+    for sid, g in df.groupby("sensor_numeric_id"):
+        run = (g["leak"] != g["leak"].shift()).cumsum()
+        for _, r in g[g["leak"] == 1].groupby(run[g["leak"] == 1]):
+            want.append((sid, iso(r["ts"].iloc[0]), iso(r["ts"].iloc[-1]), len(r),
+                         bool(r["physics_fired"].any()), r.index[-1] == g.index[-1]))
+    assert want
+
+    def got_of(idx):
+        evs = idx.events(START.isoformat(), (START + len(docs) * STEP).isoformat(), limit=10_000)
+        return sorted((e["sensor_id"], e["start"], e["end"], e["readings"], e["physics_fired"],
+                       e["open"]) for e in evs)
+
+    assert got_of(index) == sorted(want)
+    assert index.add(docs[-1]) == 0                         # re-indexing is a no-op
+    index.rebuild_episodes()
+    assert got_of(index) == sorted(want)
+
+    only_p = index.events(START.isoformat(), (START + len(docs) * STEP).isoformat(), pipe_id="P-B")
+    assert {e["sensor_id"] for e in only_p} <= {3}
+
+
+def test_open_episode_survives_restart(docs, tmp_path):
+    path = str(tmp_path / "h.db")
+    leaking = next(k for k, d in enumerate(docs) if any(r["leak"] for r in d["sensors"]))
+    first = HistoryIndex(path, retention_days=0)
+    for d in docs[:leaking + 1]:
+        first.add(d)
+    first.close()
+    second = HistoryIndex(path, retention_days=0)
+    for d in docs[leaking + 1:]:
+        second.add(d)
+
+    ref = HistoryIndex(":memory:", retention_days=0)
+    for d in docs:
+        ref.add(d)
+    span = START.isoformat(), (START + len(docs) * STEP).isoformat()
+    assert second.events(*span, limit=10_000) == ref.events(*span, limit=10_000)
+
+
+def test_history_routes(twin, tmp_path, monkeypatch):
+    monkeypatch.setattr(twin, "_history", HistoryIndex(str(tmp_path / "h.db")))
+    twin.serve(feeds(sensor_stream(3, 30, 1.0, seed=4)))
+    for _ in range(30):
+        twin.run_digital_twin()
+
+    out = twin.history_series(pipe_id="P-006", bucket_s=60)
+    assert out["sensor_ids"] == [2] and sum(out["series"]["n"]) == 30
+    assert "events" in twin.history_events()
+    assert "error" in twin.history_series(start="not a time")
+
+    monkeypatch.setattr(twin, "_history", None)
+    assert "error" in twin.history_events()
@@ -0,0 +1,259 @@
+"""
+Array kernels (kernels.py, twin.sensor_columns, prescribe, predict
+SensorBuffer / BufferRegistry) against their scalar or original
+references: same numbers, element for element, on normal readings and
+on the garbage ThingSpeak can send.
+"""
+
+import math
+from collections import deque
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from backend import kernels, predict, prescribe, state_store
+from backend.config import SENSOR_CONFIG
+from backend.twin import _clean, _float, calibrate, flat_record, sensor_columns, sensor_record
+
+from streams import rows_at, sensor_stream
+
+GARBAGE = ["3.4", " 1.2 ", "", None, "nan", "inf", "-inf", "abc", 5, 5.5,
+           True, "1_000", "1e3", float("nan"), "-0", "-2.5", "12345"]
+
+
+def test_to_float_and_clean():
+    got = kernels.to_float(GARBAGE, -9.0)
+    np.testing.assert_array_equal(got, [_float(v, -9.0) for v in GARBAGE])
+
+    x = np.array([1.5, np.nan, np.inf, -np.inf, -0.0, 7.0])
+    want = _clean({str(k): v for k, v in enumerate(x.tolist())})
+    np.testing.assert_array_equal(kernels.clean(x), list(want.values()))
+
+
+def test_calibrate_matches_scalar():
+    rng = np.random.default_rng(4)
+    sensors = [dict(s) for s in SENSOR_CONFIG]
+    sensors[1].update(pressure_factor=0.41, flow_factor=6.9)        # per-sensor factors
+    feeds = [{s[k]: (str(v) if rng.random() > 0.2 else GARBAGE[int(rng.integers(len(GARBAGE)))])
+              for s in sensors for k, v in (("pressure_field", rng.uniform(-1, 40)),
+                                            ("flow_field",     rng.uniform(-1, 40)))}
+             for _ in range(300)]
+
+    raw_p = [[f.get(s["pressure_field"]) for s in sensors] for f in feeds]
+    raw_f = [[f.get(s["flow_field"])     for s in sensors] for f in feeds]
+    p, f  = kernels.calibrate(raw_p, raw_f, *kernels.sensor_factors(sensors))
+
+    want = np.array([[calibrate(fd, s) for s in sensors] for fd in feeds])
+    np.testing.assert_array_equal(p, want[..., 0])
+    np.testing.assert_array_equal(f, want[..., 1])
+
+
+def test_quantify_matches_scalar():
+    rng = np.random.default_rng(5)
+    f = np.r_[rng.uniform(0, 3, 5000), predict.FIELD_FLOW_LPS, 0.0, np.nan]
+    p = np.r_[rng.uniform(-0.1, 1, 5000), 0.5, 0.5, 0.5]
+    got  = np.column_stack(kernels.quantify(f, p, predict.FIELD_FLOW_LPS, predict.Cd, predict.g))
+    want = np.array([predict._quantify(a, b) for a, b in zip(f.tolist(), p.tolist())])
+    np.testing.assert_array_equal(got, want)
+
+
+@pytest.mark.parametrize("n_sensors", [3, 100])
+def test_sensor_columns_match_records(n_sensors):
+    stream, buffers, results = sensor_stream(n_sensors, 60, 1.0, seed=2), predict.BufferRegistry(), []
+    for t in range(60):
+        results += predict.predict_leak_rows(rows_at(stream, t), buffers)
+    sids = np.tile(stream["sids"], 60)
+    P, F = np.ravel(stream["pressure"]), np.ravel(stream["flow_lpm"])
+    P[::17] = np.nan                                             # _clean path
+
+    cols = sensor_columns(sids, P, F, results)
+    rows = [flat_record(None, None, sensor_record(int(s), float(p), float(f), r))
+            for s, p, f, r in zip(sids, P, F, results)]
+    assert any(r["leak"] for r in rows)
+    for k, col in cols.items():
+        assert list(np.asarray(col, dtype=object)) == [r[k] for r in rows], k
+
+
+def _iterrows_prescription(df, leak_size, magnitude):
+    """Frozen copy of the original row-by-row get_prescription()."""
+    num = lambda x: None if x == "" else float(x)
+    for _, row in df.iterrows():
+        smin, smax = num(row.get("leak_size_min")), num(row.get("leak_size_max"))
+        if (smin is None or leak_size >= smin) and (smax is None or leak_size < smax):
+            result = {k: "" if isinstance(v, float) and math.isnan(v) else v
+                      for k, v in row.to_dict().items()}
+            mmin, mmax = num(row.get("magnitude_min")), num(row.get("magnitude_max"))
+            if not ((mmin is None or magnitude >= mmin) and (mmax is None or magnitude < mmax)):
+                result["action_type"] = result.get("action_type", "") + " (High flow impact)"
+            return result
+    return {k: "" if isinstance(v, float) and math.isnan(v) else v
+            for k, v in df.iloc[-1].to_dict().items()}
+
+
+def test_prescriptions_match_iterrows():
+    df = pd.read_csv(prescribe.CSV_PATH).fillna("")
+    df.columns = df.columns.str.strip().str.lower()
+
+    edges = np.r_[prescribe._SMIN, prescribe._SMAX, prescribe._MMIN, prescribe._MMAX]
+    edges = edges[np.isfinite(edges)]
+    edges = np.r_[edges, np.nextafter(edges, -np.inf), np.nextafter(edges, np.inf)]
+    rng   = np.random.default_rng(6)
+    size  = np.r_[edges, rng.uniform(-0.1, 1.5, 400), np.nan, np.inf, -np.inf, 0.0, 0.05]
+    mag   = np.r_[rng.permutation(edges), rng.uniform(-0.1, 1200, 400),
+                  0.1, 0.1, 0.1, np.nan, np.inf]
+
+    got  = prescribe.get_prescriptions(size, mag)
+    want = [_iterrows_prescription(df, s, m) for s, m in zip(size.tolist(), mag.tolist())]
+    assert got == want
+    assert [prescribe.get_prescription(s, m) for s, m in zip(size.tolist(), mag.tolist())] == want
+
+
+# ══════════════════════════════════════════════════════════════════
+# SENSOR BUFFER
+# ══════════════════════════════════════════════════════════════════
+class _DequeBuffer:
+    """Frozen copy of the original deque / np.mean SensorBuffer."""
+
+    def __init__(self):
+        self._p = deque([predict.FIELD_PRESSURE_BAR] * predict.WINDOW, maxlen=predict.WINDOW)
+        self._f = deque([predict.FIELD_FLOW_LPS] * predict.WINDOW, maxlen=predict.WINDOW)
+        self.state, self._stable_count = "normal", 0
+
+    def push(self, p, f):
+        self._p.append(p); self._f.append(f)
+
+    def features(self, hour) -> list:
+        p = list(self._p); f = list(self._f)
+        cp, cf = p[-1], f[-1]
+        pm3 = np.mean(p[-3:]); pm6 = np.mean(p[-6:]); pm12 = np.mean(p)
+        ps6 = max(np.std(p[-6:]), 1e-6); ps12 = max(np.std(p), 1e-6)
+        fm3 = np.mean(f[-3:]); fm6 = np.mean(f[-6:]); fs6 = max(np.std(f[-6:]), 1e-6)
+        p1  = (cp - p[-2]) / (pm3 + 1e-6)
+        p2  = p1 - (p[-2] - p[-3]) / (pm3 + 1e-6)
+        f1  = (cf - f[-2]) / (fm3 + 1e-6)
+        pn  = cp / (pm6 + 1e-6); fn = cf / (fm6 + 1e-6); pfr = pn / (fn + 1e-6)
+        pfm = np.mean([pp / (ff + 1e-6) for pp, ff in zip(p[-6:], f[-6:])])
+        return [(pm6 - cp) / (pm6 + 1e-6), (pm12 - cp) / (pm12 + 1e-6),
+                ps6 / (pm6 + 1e-6), fs6 / (fm6 + 1e-6), p1, p2, f1,
+                (cp - pm6) / (ps6 + 1e-6), (cp - pm12) / (ps12 + 1e-6),
+                pfr, pfr - pfm, float(hour)]
+
+    @property
+    def p6_mean(self):
+        return float(np.mean(list(self._p)[-6:]))
+
+    def update_state(self, raw_leak, pressure_bar):
+        ok = pressure_bar / predict.FIELD_PRESSURE_BAR >= predict.RECOVERY_THRESHOLD
+        if self.state == "normal":
+            if raw_leak:
+                self.state, self._stable_count = "latched", 0
+            return raw_leak, self.state
+        if self.state == "latched":
+            if ok and not raw_leak:
+                self.state, self._stable_count = "recovering", 1
+            return True, self.state
+        if raw_leak or not ok:
+            self.state, self._stable_count = "latched", 0
+            return True, self.state
+        self._stable_count += 1
+        if self._stable_count >= predict.RECOVERY_READINGS:
+            self.state, self._stable_count = "normal", 0
+            return False, self.state
+        return True, self.state
+
+
+def test_sensor_buffer_matches_deque_reference():
+    rng, n = np.random.default_rng(8), 20_000
+    p = predict.FIELD_PRESSURE_BAR * (1 + 0.03 * rng.standard_normal(n))
+    f = predict.FIELD_FLOW_LPS * (1 + 0.05 * rng.standard_normal(n))
+    for t0 in rng.choice(n - 60, 300, replace=False):            # leak episodes
+        hold = int(rng.integers(2, 40))
+        p[t0:t0 + hold] *= 1 - rng.uniform(0.1, 0.6)
+        f[t0:t0 + hold] *= 1 + rng.uniform(0.1, 1.0)
+    p[rng.random(n) < 0.01] *= 1e3                                 # spikes
+
+    ref, buf, seen = _DequeBuffer(), predict.SensorBuffer(), set()
+    for k in range(n):
+        ref.push(p[k], f[k]); buf.push(p[k], f[k])
+        want, got = ref.features(k % 24), buf.feature_vector(k % 24)
+        np.testing.assert_allclose(got, want, rtol=1e-6, atol=1e-9, err_msg=f"reading {k}")
+        assert buf.p6_mean == pytest.approx(ref.p6_mean, rel=1e-9)
+        raw = want[0] >= predict.PHYS_DROP_PCT or rng.random() < 0.02
+        assert buf.update_state(raw, p[k]) == ref.update_state(raw, p[k])
+        seen.add(ref.state)
+    assert seen == set(predict.STATES)
+
+
+# ══════════════════════════════════════════════════════════════════
+# BUFFER REGISTRY
+# ══════════════════════════════════════════════════════════════════
+@pytest.mark.parametrize("n_sensors", [3, 40])
+def test_registry_matches_sensor_buffer(n_sensors):
+    stream = sensor_stream(n_sensors, 3 * predict._RESYNC, seed=3)     # crosses resyncs
+    ref    = {sid: predict.SensorBuffer() for sid in stream["sids"]}
+    reg    = predict.BufferRegistry()
+    X      = np.empty(len(predict.FEATURES))
+    for t in range(len(stream["time"])):
+        p, f = stream["pressure"][t], stream["flow_lpm"][t] / 60.0
+        s    = reg.slots(stream["sids"])
+        reg.push(s, p, f)
+        raw  = (reg.p6_mean(s) - p) / (reg.p6_mean(s) + 1e-6) >= predict.PHYS_DROP_PCT
+        got  = reg.features(s, stream["hour"][t]), reg.latch(s, raw, p)
+        for j, sid in enumerate(stream["sids"]):
+            buf = ref[sid]
+            buf.push(float(p[j]), float(f[j]))
+            np.testing.assert_array_equal(got[0][j], buf.feature_vector(stream["hour"][t], X))
+            assert (bool(got[1][0][j]), predict.STATES[got[1][1][j]]) == \
+                buf.update_state(bool(raw[j]), float(p[j]))
+
+    for sid, buf in ref.items():
+        out = reg.get(sid)
+        assert {k: getattr(out, k) for k in buf.__slots__} == \
+               {k: getattr(buf, k) for k in buf.__slots__}
+
+
+def test_wide_and_narrow_paths_agree(monkeypatch):
+    stream = sensor_stream(40, 90, seed=6)
+    rows   = [r for t in range(90) for r in rows_at(stream, t)]
+    out    = {}
+    for mode, width in (("wide", 1), ("narrow", 10 ** 9)):
+        monkeypatch.setattr(predict, "VECTOR_MIN_SENSORS", width)
+        reg, res = predict.BufferRegistry(), []
+        for c0 in range(0, len(rows), 40 * 7):                    # 7 ticks per call
+            res += predict.predict_leak_rows(rows[c0:c0 + 40 * 7], reg)
+        out[mode] = res, reg.export()
+    assert out["wide"][0] == out["narrow"][0]
+    assert any(r["leak"] for r in out["wide"][0])
+    for a, b in zip(out["wide"][1], out["narrow"][1]):
+        np.testing.assert_array_equal(a, b)
+
+
+def test_registry_growth_and_eviction():
+    reg = predict.BufferRegistry(capacity=2, ttl_s=100, max_sensors=6)
+    reg.slots([1, 2, 3], now=0.0)
+    assert reg.capacity == 4 and len(reg) == 3
+    reg.slots([2, 3, 4, 5], now=50.0)
+    reg.slots([6, 7], now=60.0)                    # over max_sensors: LRU (1) goes
+    assert sorted(reg) == [2, 3, 4, 5, 6, 7] and reg.capacity == 8
+    reg.slots([7], now=155.0)                      # idle > ttl_s: 2, 3, 4, 5 go
+    assert sorted(reg) == [6, 7] and reg.evicted == 5
+
+    reg.slots([9], now=156.0)                      # reuses a freed slot, fresh state
+    assert reg.capacity == 8
+    assert reg.get(9).window() == predict.SensorBuffer().window()
+    with pytest.raises(ValueError):
+        reg.slots(range(100, 107), now=157.0)
+
+
+def test_registry_snapshot_roundtrip():
+    stream = sensor_stream(20, 80, seed=7)
+    reg    = predict.BufferRegistry()
+    for t in range(80):
+        predict.predict_leak_rows(rows_at(stream, t), reg)
+    back, seq, eids = state_store.load_buffers(state_store.dump_buffers(reg, 4, {123: 9}))
+    assert (seq, eids, sorted(back)) == (4, {123: 9}, sorted(reg))
+    for sid in reg:
+        a, b = reg.get(sid), back.get(sid)
+        want = predict.SensorBuffer.restore(*a.window(), a.state, a._stable_count)
+        assert {k: getattr(b, k) for k in b.__slots__} == {k: getattr(want, k) for k in b.__slots__}
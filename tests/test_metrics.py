@@ -0,0 +1,102 @@
+"""
+Metrics (metrics.py) and the routes around them: the Prometheus text
+exposition parses with cumulative buckets and +Inf == _count, /metrics
+serves it, and X-Profile profiles a request only with the right token
+and one at a time (concurrent ones get 409).
+"""
+
+import asyncio, json, re
+
+import pytest
+
+from backend import metrics
+from backend.config import SENSOR_CONFIG
+
+from conftest import asgi_request
+from streams import feeds, sensor_stream
+
+_SAMPLE = re.compile(r'^(\w+)(?:\{(.*)\})? (\S+)$')
+
+
+def _parse(text: str) -> dict:
+    """Exposition text → {(name, ((label, value), …)): float}."""
+    out = {}
+    for line in text.splitlines():
+        if not line or line.startswith("#"):
+            continue
+        name, labels, value = _SAMPLE.match(line).groups()
+        pairs = tuple(re.findall(r'(\w+)="([^"]*)"', labels or ""))
+        out[(name, pairs)] = float(value)
+    return out
+
+
+def test_histogram_exposition(monkeypatch):
+    monkeypatch.setattr(metrics, "_REGISTRY", [])
+    h = metrics.Histogram("twin_test_seconds", "test", ("stage",), buckets=(0.01, 0.1, 1.0))
+    c = metrics.Counter("twin_test_total", "test", ("result",))
+    obs = {"fetch": [0.005, 0.01, 0.05, 0.5, 3.0, 7.0], "persist": [0.2]}
+    for stage, values in obs.items():
+        for v in values:
+            h.observe(v, stage)
+    c.inc("ok"); c.inc("ok", amount=2)
+
+    text = metrics.render()
+    assert "# TYPE twin_test_seconds histogram" in text and text.endswith("\n")
+    samples = _parse(text)
+    assert samples[("twin_test_total", (("result", "ok"),))] == 3
+    for stage, values in obs.items():
+        lbl = (("stage", stage),)
+        buckets = [samples[("twin_test_seconds_bucket", lbl + (("le", le),))]
+                   for le in ("0.01", "0.1", "1", "+Inf")]
+        assert buckets == [sum(v <= le for v in values)
+                           for le in (0.01, 0.1, 1.0, float("inf"))]       # cumulative, le inclusive
+        assert buckets == sorted(buckets)
+        assert buckets[-1] == samples[("twin_test_seconds_count", lbl)] == len(values)
+        assert samples[("twin_test_seconds_sum", lbl)] == pytest.approx(sum(values))
+
+
+def test_metrics_route(twin):
+    twin.serve(feeds(sensor_stream(len(SENSOR_CONFIG), 2, seed=1)))
+    twin.run_digital_twin()
+    status, headers, body = asyncio.run(asgi_request(twin.app, "/metrics"))
+    assert status == 200 and headers["content-type"].startswith("text/plain; version=0.0.4")
+    samples = _parse(body.decode())
+    assert samples[("twin_ticks_total", (("result", "processed"),))] >= 1
+    stage = (("stage", "tick"),)
+    assert samples[("twin_stage_seconds_count", stage)] == \
+        samples[("twin_stage_seconds_bucket", stage + (("le", "+Inf"),))] >= 1
+
+
+@pytest.mark.parametrize("token, header, profiled", [
+    ("",       "anything", False),       # profiling off
+    ("secret", None,       False),       # no header
+    ("secret", "wrong",    False),       # wrong token: normal body, no hint
+    ("secret", "secret",   True),
+])
+def test_x_profile(twin, monkeypatch, token, header, profiled):
+    monkeypatch.setattr(twin, "PROFILE_TOKEN", token)
+    headers = {} if header is None else {"X-Profile": header}
+    status, got, body = asyncio.run(asgi_request(twin.app, "/", headers))
+    assert status == 200
+    if profiled:
+        assert got["x-profile-status"] == "200" and body.startswith(b"GET / ")
+    else:
+        assert "x-profile-status" not in got
+        assert json.loads(body)["status"] == "Digital Twin API running"
+
+
+def test_one_profiled_request_at_a_time(twin, monkeypatch):
+    monkeypatch.setattr(twin, "PROFILE_TOKEN", "secret")
+    headers = {"X-Profile": "secret"}
+
+    async def run():
+        return await asyncio.gather(*(asgi_request(twin.app, "/", headers) for _ in range(3)))
+
+    results = asyncio.run(run())
+    assert sorted(status for status, _, _ in results) == [200, 409, 409]
+    (_, got, body), = [r for r in results if r[0] == 200]
+    assert got["x-profile-status"] == "200" and body.startswith(b"GET / ")
+    assert not twin._profiling.locked()
+
+    status, got, _ = asyncio.run(asgi_request(twin.app, "/", headers))     # free again
+    assert status == 200 and got["x-profile-status"] == "200"
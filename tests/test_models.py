@@ -0,0 +1,166 @@
+"""
+Model registry (models.py): shadow scoring leaves live decisions
+untouched and reports the exact disagreement, promote() swaps the
+threshold and version without touching buffers, incompatible bundles
+are refused, and the /models routes on a live tick.
+"""
+
+import os, threading, time
+
+import joblib
+import numpy as np
+import pytest
+
+from backend import predict
+from backend.models import ModelRegistry
+
+from streams import feeds, rows_at, sensor_stream
+
+CANDIDATE_THRESHOLD = 0.3
+
+
+@pytest.fixture(scope="module")
+def bundles(tmp_path_factory):
+    """Candidate (same model, lower threshold) and incompatible bundle paths."""
+    root   = tmp_path_factory.mktemp("bundles")
+    bundle = predict._load_bundle()
+    paths  = {"candidate": str(root / "candidate.pkl"), "broken": str(root / "broken.pkl")}
+    joblib.dump({**bundle, "version": "7.1-test", "threshold": CANDIDATE_THRESHOLD},
+                paths["candidate"])
+    joblib.dump({**bundle, "version": "7.2-test",
+                 "features": list(reversed(bundle["features"]))}, paths["broken"])
+    return paths
+
+
+@pytest.fixture
+def models(monkeypatch):
+    """A fresh registry holding the current live model."""
+    predict.load_model()
+    reg = ModelRegistry(reference=predict._meta, engine=predict.INFERENCE_ENGINE)
+    reg.install(predict._models.live)
+    monkeypatch.setattr(predict, "_models", reg)
+    return reg
+
+
+def _wait_loaded(reg, timeout_s: float = 60.0):
+    t0 = time.monotonic()
+    while reg.loading is not None and "error" not in reg.loading:
+        assert time.monotonic() - t0 < timeout_s, "model load timed out"
+        time.sleep(0.05)
+
+
+def test_shadow_does_not_change_decisions(models, bundles):
+    stream = sensor_stream(20, 40, 0.5, seed=6)
+    ref_reg, reg = predict.BufferRegistry(), predict.BufferRegistry()
+    plain  = [predict.predict_leak_rows(rows_at(stream, t), ref_reg) for t in range(40)]
+
+    models.load_async(bundles["candidate"], "shadow").join()
+    assert models.loading is None and models.shadow.version == "7.1-test"
+    models.reset_stats()
+    shadowed = [predict.predict_leak_rows(rows_at(stream, t), reg) for t in range(40)]
+    assert shadowed == plain
+    models.drain()
+
+    valid = [row[1] > 0 and row[2] > 0 for t in range(40) for row in rows_at(stream, t)]
+    probs = np.array([r["prob"] for tick in plain for r in tick])[valid]
+    rep   = models.report()
+    assert rep["live"]["rows"] == rep["shadow"]["rows"] == len(probs)
+    assert rep["shadow"]["mean_ms"] > 0 and rep["shadow"]["mean_abs_prob_diff"] < 1e-9
+    want = np.mean((probs >= CANDIDATE_THRESHOLD) != (probs >= predict.ML_THRESHOLD))
+    assert want > 0
+    assert rep["shadow"]["disagreement_rate"] == pytest.approx(want, abs=1.5 / len(probs))
+
+
+def test_shadow_backlog_drops_instead_of_queueing(models, bundles, monkeypatch):
+    models.load(bundles["candidate"], "shadow")
+    gate, slow = threading.Event(), models.shadow.predict_proba
+    monkeypatch.setattr(models.shadow, "predict_proba", lambda X: gate.wait(10) and slow(X))
+    models.shadow_backlog = 2
+    X = np.zeros((5, len(predict.FEATURES)))
+    t0 = time.perf_counter()
+    for _ in range(5):
+        models.predict_proba(X)                         # live only: never waits
+    assert time.perf_counter() - t0 < 5
+    gate.set()
+    models.drain()
+    rep = models.report()["shadow"]
+    assert rep["batches"] == 2 and rep["dropped_batches"] == 3
+
+
+def test_promote_swaps_threshold_and_version(models, bundles):
+    stream, reg = sensor_stream(10, 30, 0.5, seed=8), predict.BufferRegistry()
+    for t in range(15):
+        predict.predict_leak_rows(rows_at(stream, t), reg)
+    models.load(bundles["candidate"], "shadow")
+    assert predict.model_version() == predict.MODEL_VERSION
+    models.promote()
+    assert predict.model_version() == "7.1-test" and models.shadow is None
+    assert len(reg) == 10                               # buffers untouched
+
+    rows, trace = rows_at(stream, 15), {}
+    results = predict.predict_leak_rows(rows, reg, trace)
+    assert {sid for sid, rule in trace["triggers"] if rule == "ml"} == \
+        {row[0] for row, r in zip(rows, results) if r["prob"] >= CANDIDATE_THRESHOLD}
+    with pytest.raises(ValueError):
+        models.promote()
+
+
+def test_incompatible_bundle_refused(models, bundles):
+    with pytest.raises(ValueError, match="features"):
+        models.load(bundles["broken"], "shadow")
+    models.load_async(bundles["broken"]).join()
+    assert "features" in models.loading["error"] and models.shadow is None
+    assert models.live.version == predict.MODEL_VERSION
+
+
+@pytest.mark.parametrize("failure", ["pickle", "sidecar"])
+def test_failing_load_surfaces(twin, monkeypatch, failure):
+    monkeypatch.setattr(predict, "_models", ModelRegistry(reference=predict._meta,
+                                                          engine=predict.INFERENCE_ENGINE))
+    monkeypatch.setattr(predict, "_preloaded", None)
+    if failure == "pickle":
+        def unreadable():
+            raise EOFError("leak_detector.pkl: truncated")
+        monkeypatch.setattr(predict, "_load_bundle", unreadable)
+    else:
+        monkeypatch.setattr(predict, "_meta", {**predict._meta, "version": "stale"})
+
+    with pytest.raises((EOFError, RuntimeError)):
+        predict.predict_leak(0.45, 0.4)
+    assert predict._models.live is None and len(predict._buffers) == 0   # nothing pushed
+
+    twin.serve(feeds(sensor_stream(3, 2, 1.0, seed=5)))
+    out = twin.run_digital_twin()
+    assert out["error"].startswith("Prediction error") and twin._last["proc_out"] is None
+
+
+def test_model_routes(twin, models, bundles, monkeypatch):
+    monkeypatch.setattr(twin, "MODEL_DIR", os.path.dirname(bundles["candidate"]))
+    assert twin.home()["model_version"] == predict.MODEL_VERSION
+    assert "error" in twin.models_shadow(name="../leak_detector.pkl")
+    assert "error" in twin.models_promote()
+
+    twin.models_shadow(name="candidate.pkl")
+    _wait_loaded(models)
+    twin.serve(feeds(sensor_stream(3, 20, 1.0, seed=4)))
+    for _ in range(20):
+        twin.run_digital_twin()
+    models.drain()
+    rep = twin.models_report()
+    assert rep["shadow"]["version"] == "7.1-test" and rep["shadow"]["rows"] > 0
+    assert rep["shadow"]["disagreement_rate"] is not None
+
+    assert twin.models_promote()["live"]["version"] == "7.1-test"
+    assert twin.home()["model_version"] == "7.1-test"
+    assert twin.models_drop_shadow()["shadow"] is None
+
+
+def test_home_does_not_ask_the_shards(twin, monkeypatch):
+    class _Shards:
+        def models(self, *args):
+            raise AssertionError("home() must not call the shards")
+
+    monkeypatch.setattr(twin, "_shards", _Shards())
+    assert twin.home()["model_version"] == predict.model_version()
+    monkeypatch.setattr(twin, "_shard_model_version", "7.1-test")  # after a promote
+    assert twin.home()["model_version"] == "7.1-test"
@@ -0,0 +1,129 @@
+"""
+Pipe-network inference (network.py) on a small hand-built tree: zone
+and path compilation, gradient residual sign, mass-balance deficit,
+EWMA baseline warm-up / freeze, the localised pipe for a known leak and
+pipe lengths steering it along a path; sensor ids are matched by array
+lookup, in any order and with strangers mixed in.
+
+  SRC ─P1─ A ─P2─ B ─P3─ C            sensor 1 meters P1 (root)
+                   └P4─ D ─P5─ E      sensor 2 meters P4, sensor 3 P5
+"""
+
+import numpy as np
+import pytest
+
+from backend.config import FIELD_PRESSURE_BAR
+from backend.network import NetworkInference, PipeNetwork
+
+NODES   = [{"id": n} for n in ("SRC", "A", "B", "C", "D", "E")]
+PIPES   = [{"id": "P1", "from": "SRC", "to": "A"}, {"id": "P2", "from": "A", "to": "B"},
+           {"id": "P3", "from": "B", "to": "C"},   {"id": "P4", "from": "B", "to": "D"},
+           {"id": "P5", "from": "D", "to": "E"}]
+SENSORS = [{"sensor_id": 1, "pipe_id": "P1"}, {"sensor_id": 2, "pipe_id": "P4"},
+           {"sensor_id": 3, "pipe_id": "P5"}]
+
+SIDS  = [1, 2, 3]
+P0    = np.array([4.0, 3.9, 3.85])      # bar at A, D, E
+F0    = np.array([11.0, 5.0, 2.0])      # lpm through P1, P4, P5
+CALM  = [0, 0, 0]
+
+
+@pytest.fixture
+def net():
+    return PipeNetwork(NODES, PIPES, SENSORS)
+
+
+def _warm(net, ticks: int = 3, **kw) -> NetworkInference:
+    inf = NetworkInference(net, **kw)
+    for _ in range(ticks):
+        inf.step(SIDS, P0, F0, CALM)
+    return inf
+
+
+def test_topology(net):
+    zone = dict(zip(net.pipe_ids, net.zone_of_pipe.tolist()))
+    assert zone == {"P1": 0, "P2": 0, "P3": 0, "P4": 1, "P5": 2}
+    assert net.parent_sensor.tolist() == [-1, 0, 1]
+    path = {sid: sorted(net.pipe_ids[k] for k in net.Path[:, j].nonzero()[0])
+            for j, sid in enumerate(SIDS)}
+    assert path == {1: [], 2: ["P2", "P4"], 3: ["P5"]}
+
+
+def test_steady_state_has_no_residuals_or_suspect(net):
+    out = _warm(net).step(SIDS, P0, F0, CALM)
+    assert all(v == {"grad_residual": 0.0, "flow_deficit": 0.0} for v in out["sensors"].values())
+    assert out["suspect_pipe"] is None and out["candidates"] == []
+
+
+@pytest.mark.parametrize("delta, sign", [(-0.05, 1), (0.05, -1)])
+def test_gradient_residual_sign(net, delta, sign):
+    inf = _warm(net)
+    p   = P0 + [0.0, delta, delta]          # D and E move together
+    out = inf.step(SIDS, p, F0, CALM)["sensors"]
+    assert np.sign(out[2]["grad_residual"]) == sign
+    assert out[2]["grad_residual"] == pytest.approx(-delta / FIELD_PRESSURE_BAR, abs=1e-5)
+    assert out[3]["grad_residual"] == 0.0   # drop from 2 to 3 unchanged
+
+
+def test_flow_deficit_after_child_flow_drop(net):
+    inf = _warm(net)
+    f   = F0 - [0.0, 2.0, 0.0]              # 2 lpm no longer reach sensor 2
+    out = inf.step(SIDS, P0, f, CALM)["sensors"]
+    assert out[1]["flow_deficit"] == pytest.approx(2.0 / 11.0, abs=1e-5)
+    assert out[2]["flow_deficit"] == pytest.approx(-2.0 / 3.0, abs=1e-5)
+    assert out[3]["flow_deficit"] == 0.0
+
+
+def test_known_leak_is_localised(net):
+    inf = _warm(net)
+    # leak on P2: more inflow at sensor 1, lower pressure at B and below
+    p   = P0 - [0.0, 0.05, 0.05]
+    f   = F0 + [3.0, 0.0, 0.0]
+    out = inf.step(SIDS, p, f, [1, 0, 0])
+    assert out["suspect_pipe"] == "P2"
+    assert out["candidates"][0] == "P2" and set(out["candidates"]) <= {"P1", "P2", "P3", "P4"}
+    assert out["score"] > 0
+
+
+def test_ewma_baseline_warm_up_and_freeze(net):
+    inf = NetworkInference(net, alpha=0.5)
+    inf.step(SIDS, P0, F0, CALM)            # first tick seeds the baselines
+    np.testing.assert_allclose(inf._base_def, [6.0, 3.0, 2.0])
+    np.testing.assert_allclose(inf._base_dp[1:], [0.1, 0.05])
+    assert np.isnan(inf._base_dp[0])        # root has no metered parent
+
+    f = F0 + [2.0, 0.0, 0.0]                # sensor 1 deficit 6 → 8
+    inf.step(SIDS, P0, f, CALM)
+    assert inf._base_def[0] == pytest.approx(7.0)          # halfway (alpha 0.5)
+    inf.step(SIDS, P0, f, CALM)
+    assert inf._base_def[0] == pytest.approx(7.5)
+
+    inf.step(SIDS, P0, f + [4.0, 0.0, 0.0], [1, 0, 0])     # leak: frozen
+    assert inf._base_def[0] == pytest.approx(7.5)
+    # a leak on sensor 1 also freezes its children's gradient baseline
+    before = inf._base_dp[1]
+    inf.step(SIDS, P0 - [0.0, 0.1, 0.1], f, [1, 0, 0])
+    assert inf._base_dp[1] == pytest.approx(before)
+
+
+@pytest.mark.parametrize("lengths, suspect", [({"P2": 90, "P4": 10}, "P2"),
+                                              ({"P2": 10, "P4": 90}, "P4")])
+def test_path_weighted_by_length(lengths, suspect):
+    pipes = [{**p, "length_m": lengths.get(p["id"], 20)} for p in PIPES]
+    net   = PipeNetwork(NODES, pipes, SENSORS)
+    share = net.Path[:, 1].toarray().ravel()
+    assert share[net.pipe_ids.index("P2")] == pytest.approx(lengths["P2"] / 100)
+    assert np.asarray(net.Path.sum(axis=0)).ravel()[1:] == pytest.approx([1.0, 1.0])
+
+    out = _warm(net).step(SIDS, P0 - [0.0, 0.05, 0.05], F0, CALM)   # gradient only
+    assert out["suspect_pipe"] == suspect
+
+
+def test_sensor_order_and_strangers(net):
+    inf, ref = _warm(net), _warm(net)
+    p, f     = P0 - [0.0, 0.05, 0.05], F0 + [3.0, 0.0, 0.0]
+    want     = ref.step(SIDS, p, f, [1, 0, 0])
+    order    = [2, 0, 1]
+    got      = inf.step([99] + [SIDS[j] for j in order], np.r_[1.0, p[order]],
+                        np.r_[1.0, f[order]], [1] + [[1, 0, 0][j] for j in order])
+    assert got == want and 99 not in got["sensors"]
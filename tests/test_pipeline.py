@@ -0,0 +1,144 @@
+"""
+Async ingestion pipeline (main.run_digital_twin_async) with ThingSpeak
+and Blob storage stubbed: /live serves the last tick from memory, a
+failed upload never breaks a tick, a repeated entry_id is neither
+scored nor written again, and overlapping ticks reach /stream in the
+order they were processed.
+"""
+
+import asyncio, json
+
+import pytest
+
+from backend import metrics, predict
+from backend.config import SENSOR_CONFIG
+
+from conftest import asgi_request
+from streams import feeds, sensor_stream
+
+
+@pytest.fixture
+def model_runs(monkeypatch):
+    """Counts predict_proba batches."""
+    runs, score = [], predict._predict_proba
+    monkeypatch.setattr(predict, "_predict_proba", lambda X: runs.append(len(X)) or score(X))
+    return runs
+
+
+def _feeds(n_ticks: int = 4, seed: int = 21) -> list:
+    return feeds(sensor_stream(len(SENSOR_CONFIG), n_ticks, 1.0, seed=seed))
+
+
+async def _settle(twin):
+    """Wait for the background uploads of the last tick (and their callbacks)."""
+    while twin._pending:
+        await asyncio.gather(*list(twin._pending), return_exceptions=True)
+    await asyncio.sleep(0)
+
+
+def test_live_never_fetches_or_scores(twin, model_runs, monkeypatch):
+    monkeypatch.setattr(twin, "INGEST_SCHEDULER", True)
+    monkeypatch.setattr(twin, "_snapshots", None)
+    http, blob = twin.serve_async(_feeds())
+
+    async def run():
+        status, _, body = await asgi_request(twin.app, "/live")
+        assert status == 200 and json.loads(body) == {"error": "No reading ingested yet"}
+        assert http.gets == 0 and not model_runs
+
+        await twin._ingest_job()
+        await _settle(twin)
+        assert http.gets == 1 and len(model_runs) == 1
+        writes = len(blob.writes)
+        for _ in range(5):
+            status, _, body = await asgi_request(twin.app, "/live")
+            assert status == 200
+            assert json.loads(body)["entry_id"] == twin._last["proc_out"]["entry_id"]
+        assert http.gets == 1 and len(model_runs) == 1 and len(blob.writes) == writes
+
+    asyncio.run(run())
+
+
+@pytest.mark.parametrize("fail", ["_processed.json", "latest.json"])
+def test_persist_failure_does_not_break_the_tick(twin, model_runs, monkeypatch, fail):
+    monkeypatch.setattr(twin, "_snapshots", None)
+    http, blob = twin.serve_async(_feeds(), fail=(fail,))
+    errors = metrics.ERRORS.value("persist")
+
+    async def run():
+        for t in range(3):
+            out = await twin.run_digital_twin_async()
+            await _settle(twin)
+            if fail == "latest.json":
+                assert "Blob Storage" in out["error"]
+            else:
+                assert "error" not in out and out["entry_id"] == t + 1
+            # the tick itself went through: state, /live document, buffers
+            assert twin._last["proc_out"]["entry_id"] == t + 1
+            assert twin._last["entry_ids"] == {int(twin.CHANNEL_ID): t + 1}
+        assert len(model_runs) == 3 and len(predict._buffers) == len(SENSOR_CONFIG)
+        assert not any(name.endswith(fail) for _, name in blob.writes)
+
+    asyncio.run(run())
+    assert metrics.ERRORS.value("persist") == errors + 3
+
+
+@pytest.mark.parametrize("mode", ["async", "blocking"])
+def test_repeated_entry_is_ingested_once(twin, model_runs, monkeypatch, mode):
+    monkeypatch.setattr(twin, "_snapshots", None)
+    once = _feeds(1)
+    dupes = metrics.TICKS.value("duplicate")
+    if mode == "async":
+        _, blob = twin.serve_async(once * 2)
+
+        async def _tick():
+            out = await twin.run_digital_twin_async()
+            await _settle(twin)
+            return out
+        tick = lambda: asyncio.run(_tick())
+        written = lambda: list(blob.writes)
+    else:
+        twin.serve(once * 2)
+        tick = twin.run_digital_twin
+        written = lambda: dict(twin.blobs)
+
+    first = tick()
+    state, writes = predict._buffers.export(), written()
+    assert first["entry_id"] == 1 and len(writes) == 3           # raw, processed, latest
+    assert tick() == first                              # same document back
+    for a, b in zip(predict._buffers.export(), state):
+        assert (a == b).all()
+    assert len(model_runs) == 1 and written() == writes
+    assert metrics.TICKS.value("duplicate") == dupes + 1
+
+
+def test_overlapping_ticks_stream_in_order(twin, monkeypatch):
+    monkeypatch.setattr(twin, "_snapshots", None)
+    twin.serve_async(_feeds(2))
+    processed, published = [], []
+    process = twin._process_feeds
+
+    def recording(*args):
+        tick = process(*args)
+        processed.append(tick[2]["entry_id"])
+        return tick
+    monkeypatch.setattr(twin, "_process_feeds", recording)
+    monkeypatch.setattr(twin._hub, "publish", lambda doc: published.append(doc["entry_id"]))
+
+    to_thread, first = asyncio.to_thread, []
+
+    async def late_first(fn, *args):
+        out = await to_thread(fn, *args)
+        if fn is recording and not first:
+            first.append(out)
+            await asyncio.sleep(0.2)            # the first tick resumes last
+        return out
+    monkeypatch.setattr(asyncio, "to_thread", late_first)
+
+    async def run():
+        await asyncio.gather(twin.run_digital_twin_async(), twin.run_digital_twin_async())
+        await _settle(twin)
+
+    asyncio.run(run())
+    assert sorted(processed) == [1, 2]
+    assert published == processed               # the newest tick is streamed last
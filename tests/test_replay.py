@@ -0,0 +1,115 @@
+"""
+ThingSpeak backfill (replay.py): paging backwards keeps entries that
+share a second across a page boundary, a limit caps the page size, and
+a multi-channel registry is fetched and scored channel by channel, also
+through POST /backfill.
+"""
+
+import asyncio, io
+from datetime import datetime, timedelta
+from unittest import mock
+
+import pandas as pd
+import pytest
+
+from backend import replay
+from backend.channels import Channel, ChannelRegistry
+from backend.config import SENSOR_CONFIG
+
+from streams import feeds, sensor_stream
+
+T0 = datetime(2026, 9, 1, 12, 0)
+
+
+def _entries(n: int, per_second: int = 3, seed: int = 41) -> list[dict]:
+    """n feed entries, `per_second` of them stamped with the same second."""
+    out = feeds(sensor_stream(len(SENSOR_CONFIG), n, 1.0, seed=seed))
+    for k, f in enumerate(out):
+        f["created_at"] = (T0 + timedelta(seconds=k // per_second)).strftime("%Y-%m-%dT%H:%M:%SZ")
+    return out
+
+
+class PagedThingSpeak:
+    """feeds.json stand-in: the newest `results` entries with
+    start <= created_at <= end, both at second precision."""
+
+    def __init__(self, by_channel: dict):
+        self.by_channel, self.calls = by_channel, []
+
+    def get(self, url, params=None, timeout=None):
+        cid = int(url.split("/channels/")[1].split("/")[0])
+        self.calls.append((cid, dict(params)))
+        lo  = pd.Timestamp(params["start"], tz="UTC") if "start" in params else None
+        hi  = pd.Timestamp(params["end"],   tz="UTC") if "end"   in params else None
+        sel = [f for f in self.by_channel[cid]
+               if (lo is None or pd.Timestamp(f["created_at"]) >= lo)
+               and (hi is None or pd.Timestamp(f["created_at"]) <= hi)]
+        resp = mock.Mock()
+        resp.json.return_value = {"feeds": sel[-params["results"]:]}
+        resp.raise_for_status.return_value = None
+        return resp
+
+
+@pytest.fixture
+def small_pages(monkeypatch):
+    monkeypatch.setattr(replay, "THINGSPEAK_PAGE", 4)   # boundaries fall inside a second
+
+
+def test_paging_keeps_entries_sharing_a_second(small_pages):
+    entries = _entries(25)
+    http    = PagedThingSpeak({7: entries})
+    frame   = replay.fetch_thingspeak(7, "key", session=http)
+    assert frame["entry_id"] == [f["entry_id"] for f in entries]
+    assert len(http.calls) > 25 // 4
+
+
+@pytest.mark.parametrize("limit", [3, 10])
+def test_limit_caps_the_page(small_pages, limit):
+    entries = _entries(25)
+    http    = PagedThingSpeak({7: entries})
+    frame   = replay.fetch_thingspeak(7, "key", limit=limit, session=http)
+    assert frame["entry_id"] == [f["entry_id"] for f in entries[-limit:]]
+    assert http.calls[0][1]["results"] == min(4, limit)
+    assert all(p["results"] <= limit for _, p in http.calls)
+
+
+def _two_channels() -> ChannelRegistry:
+    second = [{**s, "sensor_id": s["sensor_id"] + 10} for s in SENSOR_CONFIG]
+    return ChannelRegistry([Channel(7, "k7", SENSOR_CONFIG), Channel(8, "k8", second)])
+
+
+def test_every_channel_is_replayed(small_pages):
+    reg  = _two_channels()
+    data = {7: _entries(20, seed=42), 8: _entries(13, per_second=2, seed=43)}
+    http = PagedThingSpeak(data)
+    frames = replay.fetch_channels(reg, session=http)
+    assert {cid for cid, _ in http.calls} == {7, 8}
+    assert [f["sids"] for f in frames] == [[1, 2, 3], [11, 12, 13]]
+
+    df = replay.replay_frames(frames)
+    assert df["timestamp"].is_monotonic_increasing
+    for frame, sids in zip(frames, ([1, 2, 3], [11, 12, 13])):
+        alone = replay.replay(frame).reset_index(drop=True)
+        mine  = df[df["sensor_numeric_id"].isin(sids)].reset_index(drop=True)
+        pd.testing.assert_frame_equal(mine, alone, check_dtype=False)
+
+
+def test_backfill_route_uses_the_registry(twin, small_pages, monkeypatch):
+    reg  = _two_channels()
+    data = {7: _entries(9, seed=44), 8: _entries(6, seed=45)}
+    monkeypatch.setattr(twin, "_channels", reg)
+    monkeypatch.setattr(twin, "_http", PagedThingSpeak(data))
+    blobs = {}
+
+    class _Blob:
+        def __init__(self, name):
+            self.name = name
+
+        def upload_blob(self, body, overwrite=False):
+            blobs[self.name] = body
+
+    monkeypatch.setattr(twin._proc_ctr, "_client", mock.Mock(get_blob_client=_Blob))
+    out = asyncio.run(twin.backfill(source="thingspeak"))
+    assert "error" not in out and out["rows"] == 3 * (9 + 6)
+    df = pd.read_csv(io.BytesIO(blobs[out["blob"]]))
+    assert sorted(df["sensor_numeric_id"].unique()) == [1, 2, 3, 11, 12, 13]
@@ -0,0 +1,119 @@
+"""
+Sharded inference (shards.py): scores, latch decisions and buffer
+state across worker processes match predict_leak_rows() on one
+in-process registry, through growth, state export / load and restart;
+model registry operations reach every worker, and the coordinator
+starts the shards instead of loading a model of its own.
+"""
+
+import time
+
+import joblib
+import numpy as np
+import pytest
+
+from backend import predict, state_store
+from backend.shards import ShardedScorer, shard_of
+
+from streams import rows_at, sensor_stream
+
+
+@pytest.fixture(scope="module")
+def shards():
+    scorer = ShardedScorer(3, capacity=8)           # small blocks: exercise growth
+    yield scorer
+    scorer.close()
+
+
+def _assert_same(got: list, want: list):
+    assert got == want
+
+
+def test_shard_of_is_stable_and_spread():
+    sids = np.arange(1, 5001)
+    a, b = shard_of(sids, 4), shard_of(sids.tolist(), 4)
+    assert (a == b).all() and set(a) == {0, 1, 2, 3}
+    assert np.bincount(a).min() > 0.2 * len(sids)
+
+
+def test_sharded_matches_in_process(shards):
+    stream, reg = sensor_stream(40, 60, 0.5, seed=3), predict.BufferRegistry()
+    for t in range(60):
+        rows = rows_at(stream, t)
+        _assert_same(shards.predict_rows(rows), predict.predict_leak_rows(rows, reg))
+    assert len(shards) == len(reg) == 40
+
+    got, want = shards.export(), reg.export()
+    g_ord, w_ord = np.argsort(got[0]), np.argsort(want[0])
+    for g, w in zip(got, want):
+        np.testing.assert_array_equal(g[g_ord], w[w_ord])
+
+
+def test_state_roundtrip_and_restart(shards):
+    stream = sensor_stream(12, 50, 0.5, seed=5)
+    reg    = predict.BufferRegistry()
+    for t in range(25):
+        predict.predict_leak_rows(rows_at(stream, t), reg)
+
+    restored, _, _ = state_store.load_buffers(state_store.dump_buffers(reg))
+    shards.load(restored)
+    reg.load(state_store.load_buffers(state_store.dump_buffers(reg))[0])
+    for t in range(25, 35):
+        rows = rows_at(stream, t)
+        _assert_same(shards.predict_rows(rows), predict.predict_leak_rows(rows, reg))
+
+    shards.close()                                  # buffers survive a restart
+    assert not shards.started and len(shards) == 12
+    for t in range(35, 50):
+        rows = rows_at(stream, t)
+        _assert_same(shards.predict_rows(rows), predict.predict_leak_rows(rows, reg))
+
+
+def test_invalid_rows_and_trace(shards):
+    shards.load(predict.BufferRegistry())
+    reg   = predict.BufferRegistry()
+    rows  = [(1, 3.0, 0.5, 12), (2, 0.0, 0.5, 12), (3, 3.1, 0.4, 12)]
+    trace, want = {}, {}
+    _assert_same(shards.predict_rows(rows, trace), predict.predict_leak_rows(rows, reg, want))
+    assert len(shards) == 2
+    assert trace["triggers"] == want["triggers"]
+    assert set(trace["seconds"]) == set(want["seconds"])
+
+
+def test_models_in_every_shard(shards, tmp_path):
+    path = str(tmp_path / "candidate.pkl")
+    joblib.dump({**predict._load_bundle(), "version": "7.1-test", "threshold": 0.3}, path)
+    shards.models("load_async", path, "shadow")
+    t0 = time.monotonic()
+    while any(r["loading"] for r in shards.models("report")):
+        assert time.monotonic() - t0 < 120, "shadow load timed out"
+        time.sleep(0.2)
+
+    rows = rows_at(sensor_stream(30, 1, seed=7), 0)
+    shards.predict_rows(rows)
+    reports = shards.models("drain")
+    assert {r["shadow"]["version"] for r in reports} == {"7.1-test"}
+    assert sum(r["shadow"]["rows"] for r in reports) == sum(p > 0 and f > 0 for _, p, f, _ in rows)
+
+    shards.models("promote")
+    assert shards.score_arrays(*zip(*rows))["threshold"] == 0.3
+
+
+def test_coordinator_does_not_load_the_model(twin, monkeypatch):
+    class _Shards:
+        started = 0
+
+        def start(self):
+            self.started += 1
+
+    def load_model():
+        raise AssertionError("the coordinator never scores")
+
+    fake = _Shards()
+    monkeypatch.setattr(twin, "_shards", fake)
+    monkeypatch.setattr(predict, "load_model", load_model)
+    for ctr in (twin._raw_ctr, twin._proc_ctr):
+        monkeypatch.setattr(ctr, "_client", object())       # containers ensured
+    monkeypatch.setattr(twin, "_snapshots", None)
+    twin._warm_up()
+    assert fake.started == 1
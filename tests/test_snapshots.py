@@ -0,0 +1,89 @@
+"""
+Parquet snapshots (snapshots.py): read_range() over a recording fake
+container returns exactly the rows with start <= timestamp < end,
+across hour and day partition boundaries, and only lists and downloads
+the partitions the range covers.
+"""
+
+from datetime import datetime, timedelta
+
+import pandas as pd
+import pytest
+
+from backend.snapshots import LocalContainer, SnapshotWriter, partition_of, read_range
+
+T0 = datetime(2026, 1, 5, 21, 0)
+
+
+class RecordingContainer(LocalContainer):
+    """LocalContainer that remembers which prefixes were listed and blobs read."""
+
+    def __init__(self, root):
+        super().__init__(root)
+        self.listed, self.read = [], []
+
+    def list_blobs(self, name_starts_with: str = None):
+        self.listed.append(name_starts_with)
+        return super().list_blobs(name_starts_with)
+
+    def download_blob(self, name: str):
+        self.read.append(name)
+        return super().download_blob(name)
+
+
+def _stamps() -> list[str]:
+    """Every 7 min for 6 h, plus readings on and just around hour edges."""
+    ts  = [T0 + timedelta(minutes=7 * k) for k in range(52)]
+    ts += [T0 + timedelta(hours=h) for h in range(7)]
+    ts += [T0 + timedelta(hours=h) - timedelta(microseconds=1) for h in range(1, 7)]
+    return sorted({t.isoformat() for t in ts})
+
+
+@pytest.fixture
+def store(tmp_path):
+    ctr    = RecordingContainer(str(tmp_path))
+    writer = SnapshotWriter(ctr)
+    stamps = _stamps()
+    for k, ts in enumerate(stamps):
+        writer.add({"timestamp": ts, "entry_id": k + 1,
+                    "sensors": [{"sensor_numeric_id": sid, "pressure": 3.0 + k / 100,
+                                 "alert_state": "normal"} for sid in (2, 1)]})
+        if k % 11 == 10:
+            writer.flush()                          # several parts per partition
+    writer.flush()
+    return ctr, stamps
+
+
+@pytest.mark.parametrize("start, end", [
+    ("2026-01-05T21:00:00", "2026-01-06T03:00:00"),           # everything
+    ("2026-01-05T22:00:00", "2026-01-05T23:00:00"),           # one partition, exact edges
+    ("2026-01-05T22:59:59.999999", "2026-01-06T00:00:00"),    # starts on a reading
+    ("2026-01-05T23:30:00", "2026-01-06T01:14:00"),           # crosses midnight
+    ("2026-01-05T23:30:00Z", "2026-01-06T01:14:00+00:00"),    # ISO with offsets
+    ("2026-01-06T01:00:00", "2026-01-06T01:00:00"),           # empty: start == end
+])
+def test_read_range_is_half_open(store, start, end):
+    ctr, stamps = store
+    lo, hi = pd.Timestamp(start).tz_localize(None), pd.Timestamp(end).tz_localize(None)
+    want = [ts for ts in stamps if lo <= pd.Timestamp(ts) < hi]
+
+    df = read_range(ctr, start, end)
+    if not want:
+        assert df.empty
+        return
+    assert df["timestamp"].tolist() == [ts for ts in want for _ in (1, 2)]
+    assert df["sensor_numeric_id"].tolist() == [1, 2] * len(want)
+
+    hours = {partition_of(ts) for ts in want}
+    assert {"/".join(n.split("/")[1:3]) for n in ctr.read} <= \
+        {partition_of(t.isoformat()) for t in pd.date_range(lo.floor("h"), hi, freq="h")}
+    assert hours <= {"/".join(n.split("/")[1:3]) for n in ctr.read}
+    assert set(ctr.listed) == {f"snapshots/date={d}/" for d in {h[5:15] for h in hours}}
+
+
+def test_partition_boundaries(store):
+    ctr, _ = store
+    df = read_range(ctr, "2026-01-05T23:00:00", "2026-01-06T00:00:00")
+    assert df["timestamp"].iloc[0] == "2026-01-05T23:00:00"
+    assert df["timestamp"].iloc[-1] == "2026-01-05T23:59:59.999999"
+    assert ctr.read and all("date=2026-01-05/hour=23/" in n for n in ctr.read)
@@ -0,0 +1,62 @@
+"""
+Import-time behaviour of backend.main: in lifespan and lazy mode the
+import opens no socket, creates no Blob or HTTP client, loads no model
+and reads no state store, file or Redis (each is patched to raise).
+The stored buffers are restored by the first tick instead.  Runs in a fresh interpreter, since
+the test session has imported main already.
+"""
+
+import os, subprocess, sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+_PROBE = r"""
+import socket, sys
+
+def _forbidden(what):
+    def _raise(*args, **kwargs):
+        raise AssertionError(f"import did {what}")
+    return _raise
+
+socket.socket.connect = _forbidden("a socket connect")
+socket.create_connection = _forbidden("a socket connect")
+socket.getaddrinfo = _forbidden("a DNS lookup")
+
+import aiohttp, joblib, requests
+from backend import state_store
+from azure.storage.blob import BlobServiceClient, ContainerClient
+from azure.storage.blob.aio import BlobServiceClient as AsyncBlobServiceClient
+
+requests.Session.request = _forbidden("an HTTP request")
+aiohttp.ClientSession.__init__ = _forbidden("create an aiohttp session")
+BlobServiceClient.from_connection_string = _forbidden("create a Blob client")
+AsyncBlobServiceClient.from_connection_string = _forbidden("create a Blob client")
+ContainerClient.create_container = _forbidden("create a container")
+joblib.load = _forbidden("load the model")
+store_reads = []     # recorded, not raised: the restore would swallow it
+state_store.FileStateStore.load  = lambda self: store_reads.append(self.path)
+state_store.RedisStateStore.load = lambda self: store_reads.append(self.key)
+
+from backend import main, predict
+assert predict._models.live is None, "model loaded at import"
+assert not main._proc_ctr.ready and not main._raw_ctr.ready
+assert main._aio == {} and main._blob == {}
+assert not store_reads and not main._state["restored"], "state store read at import"
+print("ok")
+"""
+
+
+@pytest.mark.parametrize("store", ["", "file", "redis://127.0.0.1:1/0"])
+@pytest.mark.parametrize("mode", ["lifespan", "lazy"])
+def test_import_makes_no_io(mode, store, tmp_path):
+    if store == "file":
+        store = f"file:{tmp_path / 'buffers.bin'}"
+        (tmp_path / "buffers.bin").write_bytes(b"not read at import")
+    env = {**os.environ, "STARTUP_MODE": mode, "CHANNEL_ID": "0", "READ_API_KEY": "test",
+           "STATE_STORE": store, "INGEST_SCHEDULER": "0", "INFERENCE_SHARDS": "0"}
+    proc = subprocess.run([sys.executable, "-c", _PROBE], cwd=ROOT, env=env,
+                          capture_output=True, text=True, timeout=300)
+    assert proc.returncode == 0, proc.stderr[-3000:]
+    assert proc.stdout.strip().endswith("ok")
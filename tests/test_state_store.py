@@ -0,0 +1,137 @@
+"""
+Buffer state persistence (state_store.py) through both backends: the
+snapshot round-trips, a restored latched / recovering buffer continues
+bit-identically, and a missing or corrupt snapshot means a cold start.
+The Redis backend runs against an in-memory stand-in client.
+"""
+
+import threading
+
+import numpy as np
+import pytest
+
+from backend import predict, state_store
+from backend.channels import Channel, ChannelRegistry
+from backend.config import SENSOR_CONFIG
+
+from streams import feeds, rows_at, sensor_stream
+
+
+class FakeRedis:
+    """The get / set / lock subset of redis.Redis that RedisStateStore uses."""
+
+    def __init__(self):
+        self.data, self.locks = {}, {}
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def set(self, key, value):
+        self.data[key] = bytes(value)
+
+    def lock(self, name, timeout=None, blocking_timeout=None):
+        return self.locks.setdefault(name, threading.Lock())
+
+
+@pytest.fixture(params=["file", "redis"])
+def store(request, tmp_path, monkeypatch):
+    if request.param == "file":
+        return state_store.open_store(f"file:{tmp_path / 'state' / 'buffers.bin'}")
+    import redis
+    fake = FakeRedis()
+    monkeypatch.setattr(redis.Redis, "from_url", lambda url: fake)
+    return state_store.open_store("redis://localhost:6379/0", "digital-twin:test:buffers")
+
+
+def _run(stream, reg, ticks) -> list:
+    return [predict.predict_leak_rows(rows_at(stream, t), reg) for t in ticks]
+
+
+def _assert_same_state(a, b):
+    """Same sensors with the same windows and latch state (any slot order)."""
+    a, b = a.export(), b.export()
+    ia, ib = np.argsort(a[0]), np.argsort(b[0])
+    for x, y in zip(a, b):
+        np.testing.assert_array_equal(x[ia], y[ib])
+
+
+def test_roundtrip(store):
+    reg = predict.BufferRegistry()
+    _run(sensor_stream(25, 30, 0.5, seed=11), reg, range(30))
+    assert store.load() is None
+    store.save(state_store.dump_buffers(reg, seq=7, entry_ids={0: 123, 5: None}))
+
+    restored, seq, eids = state_store.load_buffers(store.load())
+    assert (seq, eids) == (7, {0: 123})
+    _assert_same_state(restored, reg)
+    with store.lock():
+        assert state_store.read_header(store.load()) == (7, 1, 25)
+
+
+def test_restored_buffers_continue_bit_identically(store):
+    stream = sensor_stream(30, 80, 1.0, seed=12)
+    live   = predict.BufferRegistry()
+    for t in range(80):
+        _run(stream, live, [t])
+        states = set(live.export()[1].tolist())
+        if t >= 30 and {1, 2} <= states:            # some latched, some recovering
+            break
+    else:
+        pytest.fail("stream never had latched and recovering sensors at once")
+
+    store.save(state_store.dump_buffers(live, seq=1))
+    restored = state_store.load_buffers(store.load())[0]
+    _assert_same_state(restored, live)
+    rest = range(t + 1, 80)
+    assert _run(stream, restored, rest) == _run(stream, live, rest)
+    _assert_same_state(restored, live)
+
+
+@pytest.mark.parametrize("damage", ["missing", "empty", "magic", "truncated", "state"])
+def test_bad_snapshot_is_a_cold_start(twin, store, monkeypatch, damage):
+    reg = predict.BufferRegistry()
+    _run(sensor_stream(4, 20, 1.0, seed=13), reg, range(20))
+    data = bytearray(state_store.dump_buffers(reg, seq=3))
+    if damage == "empty":
+        data = b""
+    elif damage == "magic":
+        data[:4] = b"XXXX"
+    elif damage == "truncated":
+        data = data[:len(data) // 2]
+    elif damage == "state":
+        rec = state_store._RECORD
+        data[len(data) - rec.itemsize + rec.fields["state"][1]] = 9     # last record
+    if damage != "missing":
+        store.save(bytes(data))
+
+    monkeypatch.setattr(twin, "_store", store)
+    monkeypatch.setitem(twin._state, "seq", 0)
+    assert twin._restore_at_startup() is False
+    assert len(predict._buffers) == 0 and twin._state["seq"] == 0
+
+    twin.serve(feeds(sensor_stream(len(SENSOR_CONFIG), 3, seed=14)))
+    out = twin.run_digital_twin()
+    assert "error" not in out and len(predict._buffers) == len(SENSOR_CONFIG)
+
+
+def test_first_tick_restores(twin, store, monkeypatch):
+    stream = sensor_stream(len(SENSOR_CONFIG), 6, 1.0, seed=15)
+    reg    = predict.BufferRegistry()
+    _run(stream, reg, range(3))
+    store.save(state_store.dump_buffers(reg, seq=5))
+
+    monkeypatch.setattr(twin, "_store", store)
+    monkeypatch.setattr(twin, "STATE_SAVE_S", 1e9)
+    monkeypatch.setattr(twin, "_state", {**twin._state, "seq": 0, "restored": False})
+    twin.serve(feeds(stream)[3:])
+    out = twin.run_digital_twin()
+    assert "error" not in out and twin._state["restored"] and twin._state["seq"] >= 5
+    for sid in stream["sids"]:                  # the tick continued the stored windows
+        assert predict._buffers.get(sid).window()[0][-4:-1] == reg.get(sid).window()[0][-3:]
+
+
+def test_state_key_follows_the_channel_set(twin):
+    assert twin.STATE_KEY == f"digital-twin:{twin.CHANNEL_ID}:buffers"
+    sensors = [{**s, "sensor_id": 100 + k} for k, s in enumerate(SENSOR_CONFIG)]
+    two = ChannelRegistry([Channel(9, "k", sensors), Channel(3, "k", SENSOR_CONFIG)])
+    assert two.key == "3,9"
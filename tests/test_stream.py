@@ -0,0 +1,121 @@
+"""
+SSE hub (stream.py) from the client's side: a snapshot plus the deltas
+applied field by field rebuild every sensor's latest processed record,
+for a client that joins mid-stream and for a slow client whose full
+queue was replaced by a resync snapshot.
+"""
+
+import asyncio, json
+
+import pytest
+
+from backend import predict
+from backend.stream import STATIC_FIELDS, StreamHub
+from backend.twin import sensor_record
+
+from streams import rows_at, sensor_stream
+
+
+def _documents(n_sensors: int = 6, n_ticks: int = 50, seed: int = 31) -> list:
+    """proc_out documents; every third tick only scores half the sensors."""
+    stream = sensor_stream(n_sensors, n_ticks, 1.0, seed=seed)
+    reg, docs = predict.BufferRegistry(), []
+    for t in range(n_ticks):
+        rows = rows_at(stream, t)
+        if t % 3 == 2:
+            rows = rows[: n_sensors // 2]
+        results = predict.predict_leak_rows(rows, reg)
+        docs.append({"timestamp": stream["time"][t].isoformat(), "entry_id": t + 1,
+                     "sensors": [sensor_record(sid, p, f * 60, r)
+                                 for (sid, p, f, _), r in zip(rows, results)]})
+    return docs
+
+
+class Client:
+    """What a browser keeps: the snapshot, then deltas applied field by field."""
+
+    def __init__(self):
+        self.sensors, self.rx, self.head, self.events = {}, {}, {}, []
+
+    def feed(self, message: str):
+        if message.startswith(":"):
+            return
+        event, data = (line.split(": ", 1)[1] for line in message.strip().split("\n"))
+        data = json.loads(data)
+        self.events.append(event)
+        if event == "snapshot":
+            self.head = {"timestamp": data["timestamp"], "entry_id": data["entry_id"]}
+            self.rx = {d["id"]: d for d in data["prescriptions"]}
+            static = {s["sensor_numeric_id"]: s for s in data["static"]}
+            self.sensors = {s["sensor_numeric_id"]: {**static[s["sensor_numeric_id"]], **s}
+                            for s in data["sensors"]}
+        elif event == "prescription":
+            self.rx[data["id"]] = data
+        else:
+            self.head = {"timestamp": data["timestamp"], "entry_id": data["entry_id"]}
+            for s in data["sensors"]:
+                self.sensors.setdefault(s["sensor_numeric_id"], {}).update(s)
+
+    def records(self) -> dict:
+        out = {}
+        for sid, s in self.sensors.items():
+            rx = {k: v for k, v in self.rx[s["prescription"]].items() if k != "id"}
+            out[sid] = {**s, "prescription": rx}
+        return out
+
+
+def _latest(docs) -> dict:
+    """Every sensor's most recent record, as JSON would carry it."""
+    out = {}
+    for d in docs:
+        for rec in d["sensors"]:
+            out[rec["sensor_numeric_id"]] = json.loads(json.dumps(rec))
+    return out
+
+
+async def _drain(hub: StreamHub, gen, client: Client):
+    while any(not q.empty() for q in hub._subs):
+        client.feed(await gen.__anext__())
+
+
+@pytest.mark.parametrize("join_at", [0, 17])
+def test_snapshot_plus_deltas_rebuild_the_state(join_at):
+    docs, hub, client = _documents(), StreamHub(keepalive_s=60), Client()
+
+    async def run():
+        for d in docs[:join_at]:
+            hub.publish(d)
+        gen = hub.subscribe()
+        client.feed(await gen.__anext__())
+        for d in docs[join_at:]:
+            hub.publish(d)
+            await _drain(hub, gen, client)
+        await gen.aclose()
+
+    asyncio.run(run())
+    assert client.events[0] == "snapshot" and "delta" in client.events
+    assert client.events.count("snapshot") == 1
+    assert client.records() == _latest(docs)
+    assert client.head == {"timestamp": docs[-1]["timestamp"], "entry_id": docs[-1]["entry_id"]}
+    assert hub.clients == 0
+
+
+def test_slow_client_is_resynchronised():
+    docs, hub, client = _documents(), StreamHub(keepalive_s=60, max_queue=4), Client()
+
+    async def run():
+        gen = hub.subscribe()
+        client.feed(await gen.__anext__())
+        for d in docs[:30]:                     # client reads nothing: queue overflows
+            hub.publish(d)
+        await _drain(hub, gen, client)
+        assert client.events.count("snapshot") == 2     # connect + resync
+        assert client.records() == _latest(docs[:30])
+        for d in docs[30:]:
+            hub.publish(d)
+            await _drain(hub, gen, client)
+        await gen.aclose()
+
+    asyncio.run(run())
+    assert client.records() == _latest(docs)
+    assert all(set(STATIC_FIELDS) <= set(r) for r in client.records().values())